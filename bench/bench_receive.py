@@ -0,0 +1,322 @@
+# ========================================
+# Файл: bench_receive.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - Замер скорости этапов приёма: CRC8, разбор потока на кадры, AES-ECB,
+#     снятие PKCS7, разбор нагрузки, запись CSV — и всего конвейера целиком
+#   - Исправление кадров кодом Рида — Соломона (FEC)
+#   - Синтетические кадры (text/binary/aggregate) и кадры из записанных
+#     экспериментов (experimental_results_logs_csv)
+#   - Запись CSV построчно и с буферизацией, с fsync и без
+#   - Результаты в JSON для сравнения между версиями (--compare)
+# ========================================
+#
+# Примеры:
+#   python bench/bench_receive.py --json bench_output.json
+#   python bench/bench_receive.py --compare bench_output.json --threshold 0.2
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from common.codec import AesCodec, unpad_view
+from common.crc import HAVE_NUMPY, crc8, crc8_many
+from common.fec import ReedSolomon
+from common.framing import FrameDecoder
+from common.payload import (AGGREGATE_FRAME_SIZES, PayloadError, decode_payload, pack_aggregate,
+                            pack_binary, pack_text, parse_text, unpack_aggregate, unpack_binary)
+from common.run_writer import RunWriter
+from common.writer_thread import WriterThread
+
+CODEC = AesCodec("cat")
+FEC = ReedSolomon(8)
+RECORDED_GLOB = os.path.join(ROOT, "experimental_results_logs_csv", "**", "sent_run_*.csv")
+CSV_HEADER = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity',
+              'density', 'concentration', 'crc_ok']
+
+# ========== Кадры ==========
+def random_params(rnd):
+    return [rnd.randint(20, 30), rnd.randint(980, 1020), rnd.randint(30, 80),
+            rnd.randint(1, 5), rnd.randint(50, 150)]
+
+def with_crc(encrypted):
+    return bytes(encrypted) + bytes([crc8(encrypted)])
+
+def synthetic_frames(kind, count, seed=1):
+    rnd = random.Random(seed)
+    start = 1750820056
+    frames = []
+    for i in range(count):
+        if kind == "text":
+            sent_at = start + i * 30 + rnd.randrange(1000) / 1000
+            frames.append(with_crc(CODEC.encrypt(pack_text(sent_at, random_params(rnd), i))))
+        elif kind == "binary":
+            sent_at = start + i * 30 + rnd.randrange(1000) / 1000
+            frames.append(with_crc(CODEC.encrypt_raw(pack_binary(i, sent_at, random_params(rnd)))))
+        else:
+            base = random_params(rnd)
+            samples = [(start + (i * 10 + j) * 30, [v + rnd.randint(0, 3) for v in base]) for j in range(10)]
+            frames.append(with_crc(CODEC.encrypt(pack_aggregate(i * 10, samples))))
+    return frames
+
+# Показания из CSV отправителя в экспериментах, перешифрованные текстом
+def recorded_frames(limit):
+    frames = []
+    for path in sorted(glob.glob(RECORDED_GLOB, recursive=True)):
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) < 7:
+                    continue
+                params = list(map(int, row[2:7]))
+                frames.append(with_crc(CODEC.encrypt(pack_text(int(row[0]), params))))
+                if len(frames) >= limit:
+                    return frames
+    return frames
+
+# ========== Замер ==========
+# Лучшее и медианное время из repeat повторов; скорость — по лучшему
+def measure(name, func, items, repeat, **meta):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    best = min(times)
+    result = {
+        "name": name,
+        "items": items,
+        "best_s": round(best, 6),
+        "median_s": round(statistics.median(times), 6),
+        "items_per_s": round(items / best, 1) if best else None,
+        "ns_per_item": round(best / items * 1e9, 1) if items else None,
+    }
+    result.update(meta)
+    return result
+
+def stage_benchmarks(source, frames, repeat):
+    results = []
+    count = len(frames)
+    bodies = [frame[:-1] for frame in frames]
+    stream = b"".join(frames)
+    plains = [CODEC.decrypt_raw(body) for body in bodies]
+
+    def crc_loop():
+        for frame in frames:
+            crc8(frame[:-1]) == frame[-1]
+    results.append(measure(f"{source}/crc8", crc_loop, count, repeat))
+
+    size = len(frames[0])
+    if all(len(frame) == size for frame in frames):
+        results.append(measure(f"{source}/crc8_many", lambda: crc8_many(stream, size), count, repeat,
+                               numpy=HAVE_NUMPY))
+
+    def framing():
+        decoder = FrameDecoder(AGGREGATE_FRAME_SIZES)
+        for _ in decoder.feed(stream):
+            pass
+    results.append(measure(f"{source}/framing", framing, count, repeat))
+
+    # FEC: чистый кадр (только синдромы) и кадр с двумя искажёнными байтами
+    codewords = [FEC.encode(frame) for frame in frames]
+    damaged = []
+    for codeword in codewords:
+        codeword = bytearray(codeword)
+        codeword[1] ^= 0x10
+        codeword[-2] ^= 0x01
+        damaged.append(bytes(codeword))
+
+    def fec_clean():
+        for codeword in codewords:
+            FEC.decode(codeword)
+
+    def fec_correct():
+        for codeword in damaged:
+            FEC.decode(codeword)
+    results.append(measure(f"{source}/fec_decode", fec_clean, count, repeat))
+    results.append(measure(f"{source}/fec_correct", fec_correct, count, repeat))
+
+    def decrypt():
+        for body in bodies:
+            CODEC.decrypt_raw(body)
+    results.append(measure(f"{source}/aes_decrypt", decrypt, count, repeat))
+    results.append(measure(f"{source}/aes_decrypt_batch", lambda: CODEC.decrypt_batch_raw(bodies), count, repeat))
+
+    def unpad():
+        for plain in plains:
+            unpad_view(plain)
+    results.append(measure(f"{source}/unpad", unpad, count, repeat))
+
+    if source.endswith("binary"):
+        def parse():
+            for plain in plains:
+                unpack_binary(plain)
+    elif source.endswith("aggregate"):
+        payloads = [unpad_view(plain) for plain in plains]
+
+        def parse():
+            for payload in payloads:
+                unpack_aggregate(payload)
+    else:
+        texts = [unpad_view(plain) for plain in plains]
+
+        def parse():
+            for text in texts:
+                parse_text(str(text, "utf-8"))
+    results.append(measure(f"{source}/parse", parse, count, repeat))
+
+    def decode():
+        for body in bodies:
+            decode_payload(CODEC, body)
+    results.append(measure(f"{source}/decode_payload", decode, count, repeat))
+    return results
+
+# ========== Запись CSV ==========
+def write_benchmarks(rows, repeat, workdir):
+    results = []
+    variants = (
+        ("per_row_fsync", {"flush_rows": 1, "fsync": True}, False),
+        ("per_row_no_fsync", {"flush_rows": 1, "fsync": False}, False),
+        ("buffered_fsync", {"flush_rows": 20, "fsync": True}, False),
+        ("buffered_no_fsync", {"flush_rows": 0, "fsync": False}, False),
+        ("writer_thread_fsync", {"flush_rows": 0, "fsync": True}, True),
+    )
+    for name, options, threaded in variants:
+        # Построчный fsync очень медленный: строк меньше, скорость та же
+        n = len(rows) if not (options["fsync"] and options["flush_rows"] == 1) else min(len(rows), 500)
+
+        def write():
+            path = os.path.join(workdir, f"{name}.csv")
+            for leftover in (path, path + ".log"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            run_writer = RunWriter(path, path + ".log", CSV_HEADER, **options)
+            if threaded:
+                writer = WriterThread(run_writer, queue_size=n + 1).start()
+                for row in rows[:n]:
+                    writer.write_row(row)
+                writer.close()
+            else:
+                for row in rows[:n]:
+                    run_writer.write_row(row)
+            run_writer.close()
+        results.append(measure(f"csv_write/{name}", write, n, repeat, **options))
+    return results
+
+# ========== Весь конвейер ==========
+# Поток байт -> кадры -> нагрузка -> строка CSV (буферизованная запись).
+# Как в autostart_receiver_24h.py: кадр с верным CRC8 проверяется разбором
+# нагрузки, затем разбирается ещё раз при сохранении.
+def frame_ok(frame):
+    try:
+        decode_payload(CODEC, frame[:-1])
+    except PayloadError:
+        return False
+    return True
+
+def pipeline_benchmark(source, frames, repeat, workdir, fsync):
+    stream = b"".join(frames)
+    path = os.path.join(workdir, f"pipeline_{source.replace('/', '_')}.csv")
+    readings = sum(len(decode_payload(CODEC, frame[:-1])) for frame in frames)
+
+    def run():
+        if os.path.exists(path):
+            os.remove(path)
+        run_writer = RunWriter(path, path + ".log", CSV_HEADER, flush_rows=20, fsync=fsync)
+        decoder = FrameDecoder(AGGREGATE_FRAME_SIZES, validate=frame_ok)
+        timestamp = "2025-06-25 07:54:17"
+        for frame in decoder.feed(stream):
+            for reading in decode_payload(CODEC, frame[:-1]):
+                run_writer.write_row([reading.packet_id, timestamp] + reading.params + [True])
+        run_writer.close()
+    return measure(f"{source}/pipeline{'_fsync' if fsync else ''}", run, len(frames), repeat,
+                   readings=readings, fsync=fsync)
+
+# ========== Сравнение с прошлыми результатами ==========
+# Регрессия — этап стал медленнее больше чем на threshold (0.2 = 20%)
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if not old or not old.get("items_per_s") or not result.get("items_per_s"):
+            continue
+        change = result["items_per_s"] / old["items_per_s"] - 1
+        mark = "REGRESSION" if change < -threshold else ""
+        print(f"{result['name']:<40} {old['items_per_s']:>14.1f} -> {result['items_per_s']:>14.1f} "
+              f"{change:+8.1%} {mark}")
+        if mark:
+            regressions.append(result["name"])
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the receive pipeline stages")
+    parser.add_argument("--frames", type=int, default=5000, help="frames per synthetic set")
+    parser.add_argument("--rows", type=int, default=5000, help="rows per CSV write benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before failing")
+    parser.add_argument("--quick", action="store_true", help="small sets, one repeat (smoke test)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.quick:
+        args.frames, args.rows, args.repeat = 200, 200, 1
+
+    sources = [(f"synthetic/{kind}", synthetic_frames(kind, args.frames)) for kind in ("text", "binary", "aggregate")]
+    recorded = recorded_frames(args.frames)
+    if recorded:
+        sources.append(("recorded/text", recorded))
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        for source, frames in sources:
+            results.extend(stage_benchmarks(source, frames, args.repeat))
+            results.append(pipeline_benchmark(source, frames, args.repeat, workdir, fsync=False))
+            results.append(pipeline_benchmark(source, frames, args.repeat, workdir, fsync=True))
+        rows = [[1750820056 + i, "2025-06-25 07:54:17", 25, 1000, 50, 3, 100, True] for i in range(args.rows)]
+        results.extend(write_benchmarks(rows, args.repeat, workdir))
+
+    for result in results:
+        print(f"{result['name']:<40} {result['items_per_s']:>14.1f}/s {result['ns_per_item']:>12.1f} ns")
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "numpy": HAVE_NUMPY,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        print()
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
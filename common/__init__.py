@@ -0,0 +1,8 @@
+# ========================================
+# Пакет: common
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Общий код для скриптов отправителя, приёмника и тестов
+#   - EN: Shared code for sender, receiver and test scripts
+# ========================================
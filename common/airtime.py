@@ -0,0 +1,76 @@
+# ========================================
+# Файл: common/airtime.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Время передачи кадра: UART до модуля, эфир LoRa, UART от модуля;
+#         учёт доли времени в эфире (duty cycle)
+#   - EN: Frame transit time: UART to the module, LoRa airtime, UART out;
+#         duty-cycle airtime budget
+# ========================================
+
+import math
+from collections import deque
+
+BAUDRATE = 9600
+BITS_PER_BYTE = 10          # старт + 8 бит + стоп
+
+# ========== Время в эфире LoRa ==========
+# Формула Semtech (AN1200.13): преамбула + символы заголовка и нагрузки.
+# cr = 1..4 для 4/5..4/8; при символе длиннее 16 мс включается
+# оптимизация низкой скорости (DE).
+def lora_airtime(payload_len, sf=9, bw=125000, cr=1, preamble=8, explicit_header=True, crc=True):
+    t_sym = (2 ** sf) / bw
+    de = 1 if t_sym > 0.016 else 0
+    ih = 0 if explicit_header else 1
+    numerator = 8 * payload_len - 4 * sf + 28 + 16 * int(crc) - 20 * ih
+    payload_symbols = 8 + max(math.ceil(numerator / (4 * (sf - 2 * de))) * (cr + 4), 0)
+    return (preamble + 4.25) * t_sym + payload_symbols * t_sym
+
+def uart_time(size, baudrate=BAUDRATE):
+    return size * BITS_PER_BYTE / baudrate
+
+# Наименьшее время от начала записи кадра в UART отправителя до прихода
+# его последнего байта из UART приёмника (без очереди в модуле)
+def transit_time(size, baudrate=BAUDRATE, **lora):
+    return 2 * uart_time(size, baudrate) + lora_airtime(size, **lora)
+
+# ========== Доля времени в эфире ==========
+# Скользящее окно window секунд: устройство может занимать эфир не больше
+# limit от окна (ETSI EN 300 220: 10% в 433,05–434,79 МГц, 1% в большей
+# части 868 МГц). record() — каждая своя передача; allows() — уложится ли
+# ещё одна в долю share бюджета (share < 1 оставляет остаток другим кадрам).
+# now — time.monotonic().
+class DutyCycle:
+    def __init__(self, limit=0.1, window=3600.0):
+        if not 0 < limit <= 1:
+            raise ValueError(f"duty cycle limit must be in (0, 1], got {limit}")
+        self.limit = limit
+        self.window = window
+        self.budget = limit * window
+        self._sent = deque()    # (время, airtime) передач в окне
+        self._used = 0.0
+
+    def _expire(self, now):
+        while self._sent and self._sent[0][0] <= now - self.window:
+            self._used -= self._sent.popleft()[1]
+
+    def used(self, now):
+        self._expire(now)
+        return max(self._used, 0.0)
+
+    def record(self, airtime, now):
+        self._expire(now)
+        self._sent.append((now, airtime))
+        self._used += airtime
+
+    def allows(self, airtime, now, share=1.0):
+        return self.used(now) + airtime <= self.budget * share
+
+    def stats(self, now):
+        used = self.used(now)
+        return {
+            "used_s": round(used, 3),
+            "budget_s": round(self.budget, 3),
+            "duty": round(used / self.window, 5),
+        }
@@ -0,0 +1,223 @@
+# ========================================
+# Файл: common/arq.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Подтверждение доставки и выборочный повтор кадров (ARQ) по
+#         полудуплексному каналу E22: кадр ACK с битовой картой, окно
+#         повторов с адаптивным таймаутом, очередь ACK с учётом duty cycle
+#   - EN: Acknowledged delivery with selective retransmission (ARQ) over
+#         the half-duplex E22 link: bitmap ACK frame, retransmit window
+#         with adaptive timeout, duty-cycle-aware ACK queue
+# ========================================
+
+import struct
+from collections import OrderedDict
+
+from common.crc import crc8
+from common.devices import HEADER_SIZE, add_header
+from common.loss import SEQ_MASK
+
+# ========== Кадр ACK ==========
+# Приёмник -> отправитель, без шифрования (в подтверждении нет данных):
+#   ACK_MAGIC | seq (4 байта) | карта (8 байт) | CRC8
+# seq — последнее показание принятого кадра (обычно самое новое). Бит i
+# карты — принят seq - i, т.е. подтверждаются сразу ACK_BITS seq: потерянный
+# ACK покрывается следующим. Старый кадр, досланный из буфера
+# (common/spool.py), подтверждается ACK от своего seq.
+# Отправителю с номером устройства (common/devices.py) ACK идёт с тем же
+# номером впереди — на 1 байт длиннее.
+ACK_MAGIC = 0xAC
+ACK_BITS = 64
+ACK_STRUCT = struct.Struct(">BIQ")
+ACK_SIZE = ACK_STRUCT.size + 1
+
+def pack_ack(highest, bitmap, device=None):
+    body = ACK_STRUCT.pack(ACK_MAGIC, highest & SEQ_MASK, bitmap & ((1 << ACK_BITS) - 1))
+    if device is not None:
+        body = add_header(device, body)
+    return body + bytes([crc8(body)])
+
+# Проверка для FrameDecoder(validate=...): CRC8 уже совпал
+def is_ack(frame):
+    offset = len(frame) - ACK_SIZE
+    return offset in (0, HEADER_SIZE) and frame[offset] == ACK_MAGIC
+
+# Номер устройства, которому адресован ACK, или None
+def ack_device(frame):
+    return frame[0] if len(frame) == ACK_SIZE + HEADER_SIZE else None
+
+# (последний seq, карта)
+def parse_ack(frame):
+    _, highest, bitmap = ACK_STRUCT.unpack(bytes(frame[-ACK_SIZE:-1]))
+    return highest, bitmap
+
+def acked(seq, highest, bitmap):
+    age = (highest - seq) & SEQ_MASK
+    return age < ACK_BITS and bool(bitmap >> age & 1)
+
+# ========== Таймаут повтора ==========
+# RFC 6298: сглаженное RTT (srtt) и его разброс (rttvar), RTO = srtt +
+# 4 * rttvar в пределах [minimum, maximum]. Каждый повтор удваивает RTO,
+# пока не придёт новый замер. Замеры — только по кадрам без повторов
+# (алгоритм Карна): по ACK повторённого кадра не понять, на какую
+# из попыток он пришёл.
+class RetransmitTimer:
+    def __init__(self, initial=3.0, minimum=0.5, maximum=60.0, granularity=0.05):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.rto = min(max(initial, minimum), maximum)
+        self.samples = 0
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples += 1
+        self.rto = min(max(self.srtt + max(self.granularity, 4 * self.rttvar), self.minimum), self.maximum)
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, self.maximum)
+
+# ========== Окно повторов ==========
+# Кадр в окне ждёт ACK до своего срока; потом отдаётся в due() на повтор.
+# После max_retries повторов или при переполнении окна (новые данные
+# важнее старых) он снимается как неподтверждённый (expired) — возможно,
+# он дошёл, но ACK потерялись. Кадр, выпавший из карты ACK, не снимается:
+# на его повтор придёт ACK от его собственного seq.
+class _Pending:
+    __slots__ = ("seq", "count", "frame", "sent_at", "deadline", "listen", "retries")
+
+    def __init__(self, seq, count, frame, now, deadline, listen):
+        self.seq = seq
+        self.count = count
+        self.frame = frame
+        self.sent_at = now
+        self.deadline = deadline
+        self.listen = listen
+        self.retries = 0
+
+class RetransmitWindow:
+    def __init__(self, size=8, max_retries=3, timer=None):
+        if size < 1:
+            raise ValueError(f"window size must be positive, got {size}")
+        self.size = size
+        self.max_retries = max_retries
+        self.timer = timer or RetransmitTimer()
+        self._frames = OrderedDict()    # seq первого показания -> _Pending, от старых к новым
+        self.sent = 0
+        self.acked = 0
+        self.retransmits = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, seq):
+        return seq in self._frames
+
+    # Кадр frame (показания seq..seq+count-1) только что записан в UART.
+    # listen — сколько ждать ACK не меньше (эфир кадра и ACK туда и обратно).
+    # Возвращает кадры, снятые из-за переполнения окна.
+    def add(self, seq, count, frame, now, listen=0.0):
+        dropped = []
+        while len(self._frames) >= self.size:
+            dropped.append(self._expire(next(iter(self._frames))))
+        self._frames[seq] = _Pending(seq, count, frame, now, now + max(self.timer.rto, listen), listen)
+        self.sent += 1
+        return dropped
+
+    # Возвращает подтверждённые кадры
+    def ack(self, highest, bitmap, now):
+        confirmed = []
+        for seq, pending in list(self._frames.items()):
+            if all(acked(s & SEQ_MASK, highest, bitmap) for s in range(seq, seq + pending.count)):
+                del self._frames[seq]
+                confirmed.append(pending)
+        self.acked += len(confirmed)
+        # Замер RTT — по кадру, которым вызван ACK (его seq в ACK): другие
+        # кадры могли ждать, пока терялись их собственные ACK
+        for pending in confirmed:
+            if pending.retries == 0 and (pending.seq + pending.count - 1) & SEQ_MASK == highest:
+                self.timer.sample(now - pending.sent_at)
+        return confirmed
+
+    # (самый старый кадр, срок которого прошёл, или None; снятые кадры)
+    def due(self, now):
+        dropped = []
+        for seq, pending in list(self._frames.items()):
+            if pending.deadline > now:
+                continue
+            if pending.retries >= self.max_retries:
+                dropped.append(self._expire(seq))
+                continue
+            return pending, dropped
+        return None, dropped
+
+    def retransmitted(self, pending, now):
+        self.timer.backoff()
+        pending.retries += 1
+        pending.deadline = now + max(self.timer.rto, pending.listen)
+        self.retransmits += 1
+
+    def _expire(self, seq):
+        self.expired += 1
+        return self._frames.pop(seq)
+
+    def stats(self):
+        timer = self.timer
+        return {
+            "in_flight": len(self._frames),
+            "sent": self.sent,
+            "acked": self.acked,
+            "retransmits": self.retransmits,
+            "expired": self.expired,
+            "rto_ms": round(timer.rto * 1000, 1),
+            "srtt_ms": None if timer.srtt is None else round(timer.srtt * 1000, 1),
+        }
+
+# ========== Очередь ACK ==========
+# Приёмник отвечает одним ACK на принятые кадры сразу после них — пока
+# отправитель слушает эфир. ACK, на который не хватает бюджета duty cycle,
+# откладывается и уходит позже одним кадром за все принятые (карта
+# покрывает и их); данные отправителя при этом не задерживаются.
+# Отправителям с разными номерами устройств — по ACK каждому, с картой на
+# момент приёма последнего кадра от него; разным запускам одного
+# устройства (номер запуска в заголовке кадра) — тоже, как у LossTracker.
+class AckScheduler:
+    def __init__(self, duty, airtime):
+        self.duty = duty
+        self.airtime = airtime      # время в эфире одного ACK, с
+        self.pending = {}           # (устройство, запуск; None — без номера) -> (seq, карта) ждущего ACK
+        self.sent = 0
+        self.deferred = 0           # ACK, отложенных из-за duty cycle
+        self._deferring = False
+
+    # highest, bitmap — как в pack_ack(), от последнего показания кадра
+    def received(self, device, highest, bitmap, run=None):
+        self.pending[device, run] = (highest, bitmap)
+
+    # [(устройство, seq, карта)], которым пора отправить ACK (он уже учтён
+    # в бюджете)
+    def due(self, now):
+        ready = []
+        while self.pending and self.duty.allows(self.airtime, now):
+            device, run = next(iter(self.pending))
+            highest, bitmap = self.pending.pop((device, run))
+            self.duty.record(self.airtime, now)
+            self.sent += 1
+            ready.append((device, highest, bitmap))
+        if self.pending and not self._deferring:
+            self.deferred += 1
+        self._deferring = bool(self.pending)
+        return ready
+
+    def stats(self, now):
+        return dict(sent=self.sent, deferred=self.deferred, **self.duty.stats(now))
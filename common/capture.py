@@ -0,0 +1,130 @@
+# ========================================
+# Файл: common/capture.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Запись сырых байт UART в компактный двоичный файл и чтение через mmap
+#   - EN: Compact binary capture of raw UART chunks and mmap-based reading
+# ========================================
+
+import mmap
+import os
+import struct
+import time
+
+# Файл: заголовок, затем записи подряд.
+#   заголовок  4s  "RCAP"
+#              B   версия
+#              3x  резерв
+#              d   Unix-время начала записи
+#   запись     Q   микросекунды от начала записи (time.monotonic)
+#              H   длина куска; 0 — таймаут чтения (пауза в линии)
+#              ... байты куска
+CAPTURE_MAGIC = b"RCAP"
+CAPTURE_VERSION = 1
+HEADER = struct.Struct("<4sB3xd")
+RECORD = struct.Struct("<QH")
+MAX_CHUNK = 0xFFFF
+
+class CaptureError(Exception):
+    pass
+
+# ========== Запись ==========
+# Файл открывается один раз с буфером; на диск — по flush() (вместе с CSV)
+class CaptureWriter:
+    def __init__(self, path, buffer_size=64 * 1024):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "wb", buffering=buffer_size)
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self._file.write(HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, self.started_at))
+        self.chunks = 0
+        self.bytes = 0
+        self.closed = False
+
+    def write(self, chunk):
+        offset = int((time.monotonic() - self._start) * 1_000_000)
+        view = memoryview(chunk)
+        # Кусок длиннее 64 КиБ делится на записи с тем же временем
+        for start in range(0, max(len(view), 1), MAX_CHUNK):
+            part = view[start:start + MAX_CHUNK]
+            self._file.write(RECORD.pack(offset, len(part)))
+            self._file.write(part)
+        self.chunks += 1
+        self.bytes += len(view)
+
+    # Таймаут чтения: при воспроизведении на этом месте вызывается drain()
+    def mark_timeout(self):
+        self.write(b"")
+
+    def flush(self, fsync=True):
+        if self.closed:
+            return
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.closed = True
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ========== Чтение ==========
+# Файл отображается в память; куски отдаются как memoryview без копирования.
+# Оборванная последняя запись (сбой питания) молча пропускается.
+class CaptureReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise CaptureError(f"{path}: file is too short for a capture header")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.started_at = HEADER.unpack_from(self._map)
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+            self.close()
+            raise CaptureError(f"{path}: not a capture file (magic {magic!r}, version {version})")
+        self._view = memoryview(self._map)
+
+    # (секунды от начала записи, кусок); пустой кусок — таймаут чтения
+    def __iter__(self):
+        view = self._view
+        end = len(view)
+        pos = HEADER.size
+        unpack = RECORD.unpack_from
+        record_size = RECORD.size
+        while pos + record_size <= end:
+            offset, length = unpack(view, pos)
+            pos += record_size
+            if pos + length > end:
+                return
+            yield offset / 1_000_000, view[pos:pos + length]
+            pos += length
+
+    def close(self):
+        view = getattr(self, "_view", None)
+        if view is not None:
+            view.release()
+            self._view = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # у вызывающего ещё есть кусок; отображение закроет сборщик мусора
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
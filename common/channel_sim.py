@@ -0,0 +1,351 @@
+# ========================================
+# Файл: common/channel_sim.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Виртуальный последовательный порт и модель канала E22 (LoRa) для
+#         проверки скриптов без модулей: скорость UART, время в эфире,
+#         потери, искажения битов, обрывы пакетов, полудуплекс,
+#         ускоренное время
+#   - EN: Virtual serial port and E22 (LoRa) channel model for hardware-free
+#         runs: UART byte timing, airtime, loss, bit flips, truncation,
+#         half-duplex collisions, accelerated clock
+# ========================================
+
+import bisect
+import math
+import random
+import threading
+import time
+import types
+from collections import deque
+from datetime import datetime
+
+from common.airtime import BAUDRATE, lora_airtime, uart_time
+
+_real_time = time.time
+_real_monotonic = time.monotonic
+_real_sleep = time.sleep
+
+# ========== Параметры E22 ==========
+MAX_PACKET = 240            # E22 делит длинную запись на пакеты по 240 байт
+MODULE_BUFFER = 1000        # буфер передачи модуля; при переполнении пакет теряется
+
+# ========== Виртуальное время ==========
+# Время идёт в speed раз быстрее реального. install() подменяет time.time,
+# time.monotonic и time.sleep во всём процессе, поэтому скрипты и модули
+# common работают в ускоренном времени без изменений. datetime.now()
+# подменить нельзя — для этого есть virtual_datetime().
+class VirtualClock:
+    def __init__(self, speed=1.0):
+        if speed <= 0:
+            raise ValueError(f"speed must be positive, got {speed}")
+        self.speed = speed
+        self._real_start = _real_monotonic()
+        self._mono_start = self._real_start
+        self._time_start = _real_time()
+        self._installed = False
+
+    def monotonic(self):
+        return self._mono_start + (_real_monotonic() - self._real_start) * self.speed
+
+    def time(self):
+        return self._time_start + (_real_monotonic() - self._real_start) * self.speed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            _real_sleep(seconds / self.speed)
+
+    def real_seconds(self, seconds):
+        return None if seconds is None else seconds / self.speed
+
+    def install(self):
+        time.time, time.monotonic, time.sleep = self.time, self.monotonic, self.sleep
+        self._installed = True
+        return self
+
+    def uninstall(self):
+        if self._installed:
+            time.time, time.monotonic, time.sleep = _real_time, _real_monotonic, _real_sleep
+            self._installed = False
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    # Замена datetime для скриптов: module.datetime = clock.virtual_datetime()
+    def virtual_datetime(self):
+        clock = self
+
+        class VirtualDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock.time(), tz)
+
+        return VirtualDatetime
+
+REAL_CLOCK = VirtualClock(1.0)
+
+# Часы другого устройства: time() уходит от clock на offset секунд и
+# дрейфует на drift_ppm миллионных долей. Подменяют time и datetime
+# одного скрипта (монотонные часы и sleep — общие):
+#   module.time = skewed.as_module(); module.datetime = skewed.virtual_datetime()
+class SkewedClock:
+    def __init__(self, clock, offset=0.0, drift_ppm=0.0):
+        self.clock = clock
+        self.offset = offset
+        self.drift = drift_ppm * 1e-6
+        self._origin = clock.time()
+
+    def time(self):
+        now = self.clock.time()
+        return now + self.offset + (now - self._origin) * self.drift
+
+    def monotonic(self):
+        return self.clock.monotonic()
+
+    def sleep(self, seconds):
+        self.clock.sleep(seconds)
+
+    virtual_datetime = VirtualClock.virtual_datetime
+
+    def as_module(self):
+        return types.SimpleNamespace(time=self.time, monotonic=self.monotonic, sleep=self.sleep,
+                                     perf_counter=time.perf_counter)
+
+# ========== Канал в одну сторону ==========
+# Запись в порт -> UART до модуля -> очередь модуля -> эфир (с потерями и
+# искажениями) -> UART приёмника. Байты становятся доступны для чтения
+# по одному, в момент, когда они дошли бы по UART 9600.
+#
+#   loss      — вероятность потери пакета целиком
+#   ber       — вероятность инверсии каждого бита
+#   truncate  — вероятность обрыва пакета на случайной длине
+#
+# Пакет в эфире становится байтами приёмника, только когда его передача
+# закончилась: до этого встречный пакет (полудуплекс, share_air()) ещё
+# может его испортить.
+class Channel:
+    def __init__(self, clock=REAL_CLOCK, baudrate=BAUDRATE, loss=0.0, ber=0.0, truncate=0.0,
+                 sf=9, bw=125000, cr=1, preamble=8, seed=None):
+        self.clock = clock
+        self.baudrate = baudrate
+        self.loss = loss
+        self.ber = ber
+        self.truncate = truncate
+        self.airtime_params = {"sf": sf, "bw": bw, "cr": cr, "preamble": preamble}
+        self._random = random.Random(seed)
+        self._cond = threading.Condition()
+        self._times = []        # время доступности каждого байта, по возрастанию
+        self._bytes = bytearray()
+        self._uart_free = 0.0   # когда освободится UART отправителя
+        self._air_free = 0.0    # когда освободится эфир
+        self._queued = deque()  # (начало передачи, размер) ещё не ушедших пакетов
+        self._in_air = deque()  # [начало, конец, байты или None] — ещё передаются
+        self.peer = None        # встречный канал при общем эфире
+        self.packets = 0
+        self.lost = 0
+        self.collisions = 0
+        self.overflows = 0
+        self.corrupted = 0
+        self.truncated = 0
+        self.bit_flips = 0
+        self.airtime = 0.0
+
+    def stats(self):
+        return {
+            "packets": self.packets,
+            "lost": self.lost,
+            "overflows": self.overflows,
+            "corrupted": self.corrupted,
+            "truncated": self.truncated,
+            "collisions": self.collisions,
+            "bit_flips": self.bit_flips,
+            "airtime_s": round(self.airtime, 3),
+        }
+
+    # ========== Передача ==========
+    def send(self, data):
+        now = self.clock.monotonic()
+        with self._cond:
+            for start in range(0, len(data), MAX_PACKET):
+                self._send_packet(bytes(data[start:start + MAX_PACKET]), now)
+            self._cond.notify_all()
+        return len(data)
+
+    def _send_packet(self, packet, now):
+        self.packets += 1
+        while self._queued and self._queued[0][0] <= now:
+            self._queued.popleft()
+        if sum(size for _, size in self._queued) + len(packet) > MODULE_BUFFER:
+            self.overflows += 1
+            return
+        in_module = max(now, self._uart_free) + uart_time(len(packet), self.baudrate)
+        self._uart_free = in_module
+        airtime = lora_airtime(len(packet), **self.airtime_params)
+        start = max(in_module, self._air_free)
+        self._air_free = start + airtime
+        self.airtime += airtime
+        self._queued.append((start, len(packet)))
+
+        entry = [start, self._air_free, self._impair(packet)]
+        if self.peer is not None:
+            self._collide(entry)
+        self._in_air.append(entry)
+
+    # Полудуплекс: модуль не слышит, пока передаёт сам, поэтому пакеты
+    # встречных направлений, перекрывшиеся в эфире, теряются оба
+    def _collide(self, entry):
+        start, end, _ = entry
+        for other in self.peer._in_air:
+            if other[0] < end and start < other[1]:
+                if other[2] is not None:
+                    other[2] = None
+                    self.peer.collisions += 1
+                if entry[2] is not None:
+                    entry[2] = None
+                    self.collisions += 1
+
+    # Пакеты, чья передача закончилась к now, — в байты для чтения
+    def _land(self, now):
+        byte_time = uart_time(1, self.baudrate)
+        while self._in_air and self._in_air[0][1] <= now:
+            _, end, packet = self._in_air.popleft()
+            if packet is None:
+                continue
+            at = max(end, self._times[-1] if self._times else 0.0)
+            for i, byte in enumerate(packet):
+                self._times.append(at + (i + 1) * byte_time)
+                self._bytes.append(byte)
+
+    def _impair(self, packet):
+        rnd = self._random
+        if self.loss and rnd.random() < self.loss:
+            self.lost += 1
+            return None
+        if self.truncate and len(packet) > 1 and rnd.random() < self.truncate:
+            self.truncated += 1
+            packet = packet[:rnd.randrange(1, len(packet))]
+        if self.ber:
+            flips = self._bit_flips(len(packet) * 8)
+            if flips:
+                packet = bytearray(packet)
+                for bit in flips:
+                    packet[bit >> 3] ^= 1 << (bit & 7)
+                self.corrupted += 1
+                self.bit_flips += len(flips)
+        return bytes(packet)
+
+    def _bit_flips(self, bits):
+        # Номера искажённых битов: геометрические промежутки вместо
+        # розыгрыша каждого бита
+        flips = []
+        if self.ber >= 1:
+            return list(range(bits))
+        log_q = math.log(1 - self.ber)
+        position = -1
+        while True:
+            position += 1 + int(math.log(1 - self._random.random()) / log_q)
+            if position >= bits:
+                return flips
+            flips.append(position)
+
+    # ========== Приём ==========
+    def available(self):
+        now = self.clock.monotonic()
+        with self._cond:
+            self._land(now)
+            return bisect.bisect_right(self._times, now)
+
+    # Ждёт хотя бы один байт не дольше timeout секунд (виртуальных)
+    def receive(self, size, timeout=None):
+        deadline = None if timeout is None else self.clock.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = self.clock.monotonic()
+                self._land(now)
+                ready = bisect.bisect_right(self._times, now)
+                if ready:
+                    count = min(size, ready)
+                    data = bytes(self._bytes[:count])
+                    del self._bytes[:count]
+                    del self._times[:count]
+                    return data
+                if deadline is not None and now >= deadline:
+                    return b""
+                wake = self._times[0] if self._times else None
+                if self._in_air:
+                    wake = self._in_air[0][1] if wake is None else min(wake, self._in_air[0][1])
+                if deadline is not None:
+                    wake = deadline if wake is None else min(wake, deadline)
+                wait = None if wake is None else max(wake - now, 0.0)
+                self._cond.wait(self.clock.real_seconds(wait))
+
+    def clear(self):
+        with self._cond:
+            self._bytes.clear()
+            self._times.clear()
+
+    # Общий эфир с встречным каналом (полудуплекс); вызывается до начала
+    # передачи — каналы начинают делить одну блокировку
+    def share_air(self, other):
+        other._cond = self._cond
+        self.peer, other.peer = other, self
+
+# ========== Виртуальный порт ==========
+# Повторяет используемую часть pyserial.Serial: read(), write(),
+# in_waiting, timeout, reset_input_buffer(), close().
+class VirtualSerial:
+    def __init__(self, tx, rx, timeout=None):
+        self.tx = tx
+        self.rx = rx
+        self.timeout = timeout
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        return self.rx.available() if self.rx is not None else 0
+
+    def read(self, size=1):
+        if self.rx is None or size <= 0:
+            return b""
+        return self.rx.receive(size, self.timeout)
+
+    def write(self, data):
+        if not self.is_open:
+            raise OSError("port is closed")
+        return self.tx.send(data) if self.tx is not None else len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        if self.rx is not None:
+            self.rx.clear()
+
+    def close(self):
+        self.is_open = False
+
+    # Подмена модуля serial в скрипте: module.serial = port.as_module()
+    def as_module(self):
+        port = self
+
+        class SerialModule:
+            @staticmethod
+            def Serial(*args, timeout=None, **kwargs):
+                port.timeout = timeout
+                port.is_open = True
+                return port
+
+        return SerialModule
+
+# Пара портов, соединённых каналами в обе стороны; half_duplex — общий
+# эфир, как у двух модулей E22 на одном канале
+def make_link(clock=REAL_CLOCK, seed=None, half_duplex=False, **params):
+    forward = Channel(clock, seed=seed, **params)
+    backward = Channel(clock, seed=None if seed is None else seed + 1, **params)
+    if half_duplex:
+        forward.share_air(backward)
+    return VirtualSerial(forward, backward), VirtualSerial(backward, forward)
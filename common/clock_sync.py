@@ -0,0 +1,110 @@
+# ========================================
+# Файл: common/clock_sync.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Оценка смещения и дрейфа часов отправителя относительно приёмника
+#         по временам отправки и приёма; задержка в одну сторону
+#   - EN: Sender/receiver clock offset and drift estimate from send and
+#         arrival times; one-way latency
+# ========================================
+
+# Разность d = приём - отправка = смещение часов + время в пути.
+# Время в пути не бывает меньше времени передачи кадра, а очереди и
+# повторы его только увеличивают, поэтому по каждому окну window секунд
+# берётся наименьшее d (нижняя огибающая), и через эти точки проводится
+# прямая методом наименьших квадратов: наклон — дрейф, значение —
+# смещение плюс наименьшее время в пути. Суммы копятся на ходу, память
+# не растёт с длиной запуска.
+#
+# Задержка в одну сторону = d - прямая(t) + floor, где floor — расчётное
+# время передачи кадра (common/airtime.py). Оценка верна, пока часы
+# приёмника не переводят скачком (NTP step); плавная подстройка — тот же
+# дрейф.
+class ClockSync:
+    def __init__(self, window=600.0):
+        self.window = window
+        self.samples = 0
+        self.points = 0
+        self.min_delay = None
+        self._origin = None   # время первого приёма; t считается от него
+        self._last = 0.0
+        self._bucket = None
+        self._best = None     # (t, d) наименьшее d в текущем окне
+        self._sums = [0.0, 0.0, 0.0, 0.0]  # t, d, t*t, t*d
+
+    # Возвращает d = received_at - sent_at, секунды
+    def add(self, sent_at, received_at):
+        if self._origin is None:
+            self._origin = received_at
+        t = received_at - self._origin
+        d = received_at - sent_at
+        self.samples += 1
+        self._last = t
+        if self.min_delay is None or d < self.min_delay:
+            self.min_delay = d
+        bucket = int(t // self.window)
+        if bucket != self._bucket:
+            self._close_window()
+            self._bucket = bucket
+        if self._best is None or d < self._best[1]:
+            self._best = (t, d)
+        return d
+
+    def _close_window(self):
+        if self._best is None:
+            return
+        t, d = self._best
+        sums = self._sums
+        sums[0] += t
+        sums[1] += d
+        sums[2] += t * t
+        sums[3] += t * d
+        self.points += 1
+        self._best = None
+
+    # (значение в t = 0, наклон) по закрытым окнам и минимуму текущего
+    def _fit(self):
+        n = self.points
+        st, sd, stt, std = self._sums
+        if self._best is not None:
+            t, d = self._best
+            n += 1
+            st, sd, stt, std = st + t, sd + d, stt + t * t, std + t * d
+        if n == 0:
+            return None
+        denominator = n * stt - st * st
+        if n < 2 or denominator <= 1e-9 * max(stt, 1.0):
+            return sd / n, 0.0
+        slope = (n * std - st * sd) / denominator
+        return (sd - slope * st) / n, slope
+
+    # Смещение часов приёмника относительно отправителя вместе с
+    # наименьшим временем в пути, в момент приёма received_at
+    def offset(self, received_at):
+        fit = self._fit()
+        if fit is None:
+            return None
+        intercept, slope = fit
+        return intercept + slope * (received_at - self._origin)
+
+    def drift(self):
+        fit = self._fit()
+        return 0.0 if fit is None else fit[1]
+
+    # Задержка в одну сторону, секунды; None до первого add()
+    def latency(self, sent_at, received_at, floor=0.0):
+        offset = self.offset(received_at)
+        if offset is None:
+            return None
+        return received_at - sent_at - offset + floor
+
+    def stats(self):
+        offset = None if self._origin is None else self.offset(self._origin + self._last)
+        return {
+            "samples": self.samples,
+            "points": self.points + (self._best is not None),
+            "offset_ms": 0.0 if offset is None else round(offset * 1000, 3),
+            "drift_ppm": round(self.drift() * 1e6, 3),
+            "min_delay_ms": 0.0 if self.min_delay is None else round(self.min_delay * 1000, 3),
+        }
@@ -0,0 +1,118 @@
+# ========================================
+# Файл: common/codec.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: AES-128 ECB + PKCS7 с однократным выводом ключа и пакетной обработкой
+#   - EN: AES-128 ECB + PKCS7 with one-time key derivation and batch APIs
+# ========================================
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+BLOCK_SIZE = AES.block_size
+
+# ========== Ключ ==========
+# Строка дополняется пробелами до 16 байт ("cat" -> b"cat             "),
+# готовый ключ в bytes используется как есть
+def derive_key(key):
+    if isinstance(key, str):
+        return key.ljust(16)[:16].encode()
+    return bytes(key)
+
+# ========== Снятие PKCS7 без копирования ==========
+def unpad_view(data):
+    view = memoryview(data)
+    if not view or len(view) % BLOCK_SIZE:
+        return None
+    pad_len = view[-1]
+    if not 1 <= pad_len <= BLOCK_SIZE:
+        return None
+    for byte in view[-pad_len:]:
+        if byte != pad_len:
+            return None
+    return view[:-pad_len]
+
+# ========== Кодек ==========
+# ECB не хранит состояния между блоками, поэтому один объект шифра можно
+# использовать для всех пакетов вместо AES.new() на каждый пакет.
+class AesCodec:
+    def __init__(self, key):
+        self.key = derive_key(key)
+        self._cipher = AES.new(self.key, AES.MODE_ECB)
+
+    # ========== Один пакет ==========
+    def encrypt(self, message):
+        if isinstance(message, str):
+            message = message.encode()
+        return self._cipher.encrypt(pad(message, BLOCK_SIZE))
+
+    def encrypt_raw(self, data):
+        # Данные уже кратны 16 байтам, PKCS7 не добавляется
+        return self._cipher.encrypt(data)
+
+    def decrypt(self, ciphertext):
+        try:
+            plain = unpad_view(self._cipher.decrypt(ciphertext))
+            return None if plain is None else str(plain, "utf-8")
+        except Exception:
+            return None
+
+    def decrypt_raw(self, ciphertext):
+        try:
+            return self._cipher.decrypt(ciphertext)
+        except Exception:
+            return None
+
+    # ========== Пакетная обработка ==========
+    # Все сообщения шифруются одним вызовом encrypt(); результат — список
+    # memoryview на общий буфер (без копирования каждого пакета)
+    def encrypt_batch(self, messages):
+        buf = bytearray()
+        bounds = []
+        for message in messages:
+            if isinstance(message, str):
+                message = message.encode()
+            start = len(buf)
+            buf += pad(message, BLOCK_SIZE)
+            bounds.append((start, len(buf)))
+        if not buf:
+            return []
+        out = memoryview(bytearray(len(buf)))
+        self._cipher.encrypt(buf, output=out)
+        return [out[start:end] for start, end in bounds]
+
+    # Шифротексты склеиваются и расшифровываются одним вызовом decrypt();
+    # возвращается список memoryview открытого текста (с PKCS7)
+    def decrypt_batch_raw(self, ciphertexts):
+        buf = bytearray()
+        bounds = []
+        for ciphertext in ciphertexts:
+            if len(ciphertext) % BLOCK_SIZE:
+                raise ValueError(f"ciphertext length {len(ciphertext)} is not a multiple of {BLOCK_SIZE}")
+            start = len(buf)
+            buf += ciphertext
+            bounds.append((start, len(buf)))
+        if not buf:
+            return []
+        out = memoryview(bytearray(len(buf)))
+        self._cipher.decrypt(buf, output=out)
+        return [out[start:end] for start, end in bounds]
+
+    # То же с PKCS7 и декодированием; None — для пакетов, которые не
+    # расшифровались (неверное выравнивание, дополнение или UTF-8)
+    def decrypt_batch(self, ciphertexts):
+        ciphertexts = list(ciphertexts)
+        valid = [len(c) > 0 and len(c) % BLOCK_SIZE == 0 for c in ciphertexts]
+        plains = iter(self.decrypt_batch_raw([c for c, ok in zip(ciphertexts, valid) if ok]))
+        result = []
+        for ok in valid:
+            if not ok:
+                result.append(None)
+                continue
+            plain = unpad_view(next(plains))
+            try:
+                result.append(None if plain is None else str(plain, "utf-8"))
+            except UnicodeDecodeError:
+                result.append(None)
+        return result
@@ -0,0 +1,71 @@
+# ========================================
+# Файл: common/crc.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Табличный CRC8 (полином 0x07) и пакетная проверка кадров
+#   - EN: Table-driven CRC8 (poly 0x07) and batch frame verification
+# ========================================
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: на Pi Zero его может не быть
+    np = None
+
+CRC8_POLY = 0x07
+HAVE_NUMPY = np is not None
+
+# ========== Таблица CRC8 ==========
+def _build_table(poly):
+    table = []
+    for value in range(256):
+        crc = value
+        for _ in range(8):
+            crc = (crc << 1) ^ poly if crc & 0x80 else crc << 1
+            crc &= 0xFF
+        table.append(crc)
+    return tuple(table)
+
+CRC8_TABLE = _build_table(CRC8_POLY)
+_NP_TABLE = np.array(CRC8_TABLE, dtype=np.uint8) if HAVE_NUMPY else None
+
+# ========== CRC8 одного буфера ==========
+def crc8(data: bytes, crc: int = 0) -> int:
+    # crc позволяет продолжить подсчёт по частям (заголовок + данные)
+    table = CRC8_TABLE
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+# ========== Пакетная проверка кадров ==========
+# buf — подряд идущие кадры длиной frame_len, последний байт каждого — CRC8.
+# Возвращает список bool: совпал ли CRC у каждого кадра.
+def crc8_many(buf, frame_len: int, use_numpy=None) -> list:
+    if frame_len < 2:
+        raise ValueError(f"frame_len must be >= 2, got {frame_len}")
+    if len(buf) % frame_len:
+        raise ValueError(f"buffer length {len(buf)} is not a multiple of {frame_len}")
+    if use_numpy is None:
+        use_numpy = HAVE_NUMPY
+    if use_numpy and HAVE_NUMPY:
+        return _crc8_many_numpy(buf, frame_len)
+    return _crc8_many_py(buf, frame_len)
+
+def _crc8_many_py(buf, frame_len):
+    table = CRC8_TABLE
+    view = memoryview(buf).cast("B")
+    result = []
+    for start in range(0, len(view), frame_len):
+        crc = 0
+        for byte in view[start:start + frame_len - 1]:
+            crc = table[crc ^ byte]
+        result.append(crc == view[start + frame_len - 1])
+    return result
+
+def _crc8_many_numpy(buf, frame_len):
+    # Один проход по столбцам: на каждом шаге обновляется CRC всех кадров сразу
+    frames = np.frombuffer(buf, dtype=np.uint8).reshape(-1, frame_len)
+    crc = np.zeros(frames.shape[0], dtype=np.uint8)
+    for column in range(frame_len - 1):
+        crc = _NP_TABLE[crc ^ frames[:, column]]
+    return (crc == frames[:, -1]).tolist()
@@ -0,0 +1,218 @@
+# ========================================
+# Файл: common/dataset.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Сборка всех sent_run_*/received_run_* CSV в типизированный
+#         столбцовый набор, разбитый по расстоянию и запуску; дозапись
+#         только новых и изменившихся запусков; быстрая загрузка
+#   - EN: Typed columnar dataset of every sent_run_*/received_run_* CSV,
+#         partitioned by distance and run; incremental updates; fast load
+# ========================================
+
+import csv
+import glob
+import json
+import os
+import re
+from urllib.parse import quote, unquote
+
+from common.link_stats import HAVE_PYARROW, run_name
+
+if HAVE_PYARROW:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.parquet
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy набор не собрать; CSV по-прежнему читает link_stats
+    np = None
+
+HAVE_NUMPY = np is not None
+
+# Раскладка: <out>/<роль>/distance_m=<м|unknown>/run=<имя>/part.<parquet|npz>
+# (разбиение hive: pyarrow.dataset восстанавливает distance_m и run сам).
+# manifest.json — размер и время изменения каждого исходного CSV.
+ROLES = ("sent", "received")
+MANIFEST = "manifest.json"
+UNKNOWN_DISTANCE = "unknown"
+
+_FILE_NAME = re.compile(r"^(sent|received|gateway)_run_(\d+)(?:_(\d+)m)?\.csv$")
+
+# Пропуск: NaN в дробных столбцах, -1 в целых (seq, device, sender_run) в файлах .npz;
+# в Parquet — null
+MISSING_INT = -1
+
+# Столбцы каждой роли и их типы; чего нет в старом CSV — пропуск
+SCHEMAS = {
+    "sent": [
+        ("packet_id", "int64"), ("timestamp", "datetime64[s]"),
+        ("temperature", "int16"), ("pressure", "int16"), ("humidity", "int16"),
+        ("density", "int16"), ("concentration", "int16"),
+        ("seq", "int64"), ("sent_at", "float64"), ("device", "int64"),
+    ],
+    "received": [
+        ("packet_id", "int64"), ("timestamp", "datetime64[s]"),
+        ("temperature", "int16"), ("pressure", "int16"), ("humidity", "int16"),
+        ("density", "int16"), ("concentration", "int16"), ("crc_ok", "bool"),
+        ("seq", "int64"), ("sent_at", "float64"), ("received_at", "float64"), ("latency_ms", "float64"),
+        ("device", "int64"), ("sender_run", "int64"),
+    ],
+}
+
+# ========== Поиск исходных файлов ==========
+# [(роль, имя запуска, расстояние или None, путь)]
+def find_sources(root):
+    sources = []
+    pattern = os.path.join(root, "**", "*_run_*.csv")
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        match = _FILE_NAME.match(os.path.basename(path))
+        if not match:
+            continue
+        distance = int(match.group(3)) if match.group(3) else None
+        role = "sent" if match.group(1) == "sent" else "received"   # строки шлюза — принятые
+        sources.append((role, run_name(path, root), distance, path))
+    return sources
+
+def _signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+# ========== Чтение CSV ==========
+_PARSERS = {
+    "int64": int,
+    "int16": int,
+    "float64": float,
+    "bool": lambda value: value == "True",
+    "datetime64[s]": str,   # разбирает NumPy целым столбцом
+}
+
+# Возвращает ({столбец: np.ndarray}, пропущено строк). Оборванная или
+# испорченная строка (сбой питания посреди записи) пропускается.
+def read_csv(path, role):
+    schema = SCHEMAS[role]
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        index = {name: i for i, name in enumerate(header)}
+        fields = [(name, index.get(name), _PARSERS[dtype]) for name, dtype in schema]
+        width = len(header)
+        values = {name: [] for name, _ in schema}
+        skipped = 0
+        for row in reader:
+            if len(row) != width:
+                skipped += 1
+                continue
+            try:
+                parsed = [None if i is None or row[i] == "" else parse(row[i]) for _, i, parse in fields]
+            except ValueError:
+                skipped += 1
+                continue
+            for (name, _, _), value in zip(fields, parsed):
+                values[name].append(value)
+    columns = {}
+    for name, dtype in schema:
+        column = values[name]
+        if dtype == "float64":
+            columns[name] = np.array([np.nan if v is None else v for v in column], dtype=dtype)
+        elif dtype == "int64":
+            columns[name] = np.array([MISSING_INT if v is None else v for v in column], dtype=dtype)
+        elif dtype == "bool":
+            columns[name] = np.array([bool(v) for v in column], dtype=dtype)
+        elif dtype == "datetime64[s]":
+            columns[name] = np.array(["NaT" if v is None else v for v in column], dtype=dtype)
+        else:
+            columns[name] = np.array([0 if v is None else v for v in column], dtype=dtype)
+    return columns, skipped
+
+# ========== Запись частей ==========
+def _partition_dir(out, role, run, distance):
+    distance = UNKNOWN_DISTANCE if distance is None else str(distance)
+    return os.path.join(out, role, f"distance_m={distance}", f"run={quote(run, safe='')}")
+
+def _write_part(directory, columns):
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))  # часть запуска перезаписывается целиком
+    if HAVE_PYARROW:
+        arrays = {}
+        for name, column in columns.items():
+            if column.dtype.kind == "f":
+                arrays[name] = pyarrow.array(column, mask=np.isnan(column))
+            elif name in ("seq", "device", "sender_run"):
+                arrays[name] = pyarrow.array(column, mask=column == MISSING_INT)
+            else:
+                arrays[name] = pyarrow.array(column)
+        path = os.path.join(directory, "part.parquet")
+        pyarrow.parquet.write_table(pyarrow.table(arrays), path)
+    else:
+        path = os.path.join(directory, "part.npz")
+        np.savez(path, **columns)
+    return path
+
+# ========== Сборка ==========
+# Пересобираются только запуски, у которых появился или изменился хоть
+# один исходный CSV (идущий 24h-запуск дописывается при каждой сборке);
+# full=True — всё заново. Возвращает {"converted": [...], "unchanged": N,
+# "rows": N, "skipped_rows": N}.
+def build(root, out, full=False):
+    if not HAVE_NUMPY:
+        raise RuntimeError("numpy is required to build the columnar dataset")
+    manifest_path = os.path.join(out, MANIFEST)
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    fmt = "parquet" if HAVE_PYARROW else "npz"
+    if manifest.get("format", fmt) != fmt:
+        manifest = {}  # формат сменился (поставили pyarrow) — пересборка
+    entries = manifest.get("sources", {})
+
+    result = {"converted": [], "unchanged": 0, "rows": 0, "skipped_rows": 0}
+    for role, run, distance, path in find_sources(root):
+        key = f"{role}:{run}"
+        signature = _signature(path)
+        if entries.get(key, {}).get("signature") == signature:
+            result["unchanged"] += 1
+            continue
+        columns, skipped = read_csv(path, role)
+        _write_part(_partition_dir(out, role, run, distance), columns)
+        rows = len(columns["packet_id"])
+        entries[key] = {"path": os.path.relpath(path, root), "signature": signature,
+                        "distance_m": distance, "rows": rows}
+        result["converted"].append(key)
+        result["rows"] += rows
+        result["skipped_rows"] += skipped
+
+    # Манифест — запись во временный файл и переименование: после сбоя
+    # остаётся прежний целый манифест, и сборка просто повторится
+    os.makedirs(out, exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"format": fmt, "sources": entries}, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+    return result
+
+# ========== Загрузка ==========
+# Все части роли с добавленными столбцами run и distance_m (-1 — неизвестно):
+# pyarrow.Table при наличии pyarrow, иначе {столбец: np.ndarray}
+def load(out, role):
+    directory = os.path.join(out, role)
+    if HAVE_PYARROW:
+        return pyarrow.dataset.dataset(directory, format="parquet", partitioning="hive").to_table()
+    parts = sorted(glob.glob(os.path.join(directory, "distance_m=*", "run=*", "part.npz")))
+    names = [name for name, _ in SCHEMAS[role]]
+    chunks = {name: [] for name in names + ["run", "distance_m"]}
+    for path in parts:
+        run_dir = os.path.dirname(path)
+        run = unquote(os.path.basename(run_dir).split("=", 1)[1])
+        distance = os.path.basename(os.path.dirname(run_dir)).split("=", 1)[1]
+        with np.load(path) as part:
+            size = len(part["packet_id"])
+            for name in names:
+                chunks[name].append(part[name])
+        chunks["run"].append(np.full(size, run, dtype=object))
+        chunks["distance_m"].append(np.full(size, MISSING_INT if distance == UNKNOWN_DISTANCE else int(distance),
+                                            dtype="int64"))
+    return {name: np.concatenate(arrays) if arrays else np.array([]) for name, arrays in chunks.items()}
@@ -0,0 +1,81 @@
+# ========================================
+# Файл: common/devices.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Заголовок кадра (номер устройства, номер запуска) и таблица
+#         ключей AES по устройствам (шифры создаются один раз, поиск по
+#         номеру — словарь)
+#   - EN: Frame header (device ID, run ID) and per-device AES key table
+#         (ciphers built once, dictionary lookup per frame)
+# ========================================
+
+import json
+
+from common.codec import BLOCK_SIZE, AesCodec
+
+# Заголовок кадра (открыто, перед шифротекстом; CRC8 покрывает и его):
+#   номер устройства (1 байт) — отправитель среди нескольких
+#   номер запуска (2 байта)   — приёмник пишет строки в файл запуска отправителя
+# Шифротекст кратен 16 байтам, поэтому состав заголовка виден по остатку
+# длины кадра без CRC8 от деления на 16: 0 — без заголовка (прежние
+# отправители принимаются как раньше), 1 — устройство, 2 — запуск,
+# 3 — устройство и запуск.
+HEADER_SIZE = 1
+RUN_ID_SIZE = 2
+MAX_DEVICE_ID = 255
+RUN_ID_MASK = 0xFFFF
+
+def add_header(device_id, data, run_id=None):
+    header = b""
+    if device_id is not None:
+        if not 0 <= device_id <= MAX_DEVICE_ID:
+            raise ValueError(f"device ID must be in 0..{MAX_DEVICE_ID}, got {device_id}")
+        header = bytes([device_id])
+    if run_id is not None:
+        header += (run_id & RUN_ID_MASK).to_bytes(RUN_ID_SIZE, "big")
+    return header + data
+
+# data — кадр без CRC8; возвращает (номер устройства или None, номер
+# запуска или None, шифротекст)
+def split_header(data):
+    size = len(data) % BLOCK_SIZE
+    if size == 0:
+        return None, None, data
+    device = data[0] if size & HEADER_SIZE else None
+    run = int.from_bytes(data[size - RUN_ID_SIZE:size], "big") if size & RUN_ID_SIZE else None
+    return device, run, data[size:]
+
+# Длины кадров со всеми вариантами заголовка — для FrameDecoder
+def addressed_sizes(frame_sizes):
+    extra = (0, HEADER_SIZE, RUN_ID_SIZE, HEADER_SIZE + RUN_ID_SIZE)
+    return tuple(sorted({size + e for size in frame_sizes for e in extra}))
+
+# ========== Таблица ключей ==========
+# Файл JSON {"номер устройства": "ключ", ...}, например {"1": "field-1", "2": "field-2"}.
+# Ключи выводятся и шифры создаются при загрузке; codec() — поиск в
+# словаре на каждый кадр. Кадр без номера и устройство, которого нет в
+# таблице, расшифровываются ключом по умолчанию (прежний общий ключ).
+class KeyTable:
+    def __init__(self, default_key, keys=None):
+        self.default = AesCodec(default_key)
+        self._codecs = {}
+        for device, key in (keys or {}).items():
+            device = int(device)
+            if not 0 <= device <= MAX_DEVICE_ID:
+                raise ValueError(f"device ID must be in 0..{MAX_DEVICE_ID}, got {device}")
+            self._codecs[device] = AesCodec(key)
+
+    @classmethod
+    def load(cls, path, default_key):
+        with open(path, encoding="utf-8") as f:
+            return cls(default_key, json.load(f))
+
+    def __len__(self):
+        return len(self._codecs)
+
+    def __contains__(self, device):
+        return device in self._codecs
+
+    def codec(self, device):
+        return self._codecs.get(device, self.default)
@@ -0,0 +1,204 @@
+# ========================================
+# Файл: common/fec.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Код Рида — Соломона над GF(256): исправление искажённых байт
+#         кадра вместо его потери
+#   - EN: Reed-Solomon code over GF(256): corrects corrupted frame bytes
+#         instead of dropping the frame
+# ========================================
+
+# Систематический код: к кадру (шифротекст + CRC8) дописываются parity
+# проверочных байт, кадр остаётся читаемым как есть. Исправляется до
+# parity // 2 искажённых байт в любых местах кадра — т.е. до parity // 2
+# одиночных ошибок битов или пакет ошибок в пределах одного байта.
+# Кадр длиннее 255 байт не кодируется (у E22 пакет до 240 байт).
+#
+# Многочлены — списки коэффициентов от старшей степени к младшей.
+# Поле: примитивный многочлен 0x11D, порождающий элемент 2.
+FIELD_POLY = 0x11D
+MAX_CODEWORD = 255
+
+_EXP = [0] * 512
+_LOG = [0] * 256
+
+def _build_tables():
+    x = 1
+    for i in range(255):
+        _EXP[i] = x
+        _LOG[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= FIELD_POLY
+    for i in range(255, 512):
+        _EXP[i] = _EXP[i - 255]
+
+_build_tables()
+
+# ========== Арифметика GF(256) ==========
+def _mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+def _div(a, b):
+    if a == 0:
+        return 0
+    return _EXP[(_LOG[a] + 255 - _LOG[b]) % 255]
+
+def _pow(a, power):
+    return _EXP[(_LOG[a] * power) % 255]
+
+def _inverse(a):
+    return _EXP[255 - _LOG[a]]
+
+def _poly_scale(p, x):
+    return [_mul(c, x) for c in p]
+
+def _poly_add(p, q):
+    r = [0] * max(len(p), len(q))
+    for i, c in enumerate(p):
+        r[i + len(r) - len(p)] = c
+    for i, c in enumerate(q):
+        r[i + len(r) - len(q)] ^= c
+    return r
+
+def _poly_mul(p, q):
+    r = [0] * (len(p) + len(q) - 1)
+    for j, b in enumerate(q):
+        if b:
+            for i, a in enumerate(p):
+                if a:
+                    r[i + j] ^= _mul(a, b)
+    return r
+
+def _poly_eval(p, x):
+    y = p[0]
+    for c in p[1:]:
+        y = _mul(y, x) ^ c
+    return y
+
+# Деление на нормированный многочлен; возвращает остаток
+def _poly_mod(dividend, divisor):
+    out = list(dividend)
+    for i in range(len(dividend) - len(divisor) + 1):
+        coef = out[i]
+        if coef:
+            for j in range(1, len(divisor)):
+                if divisor[j]:
+                    out[i + j] ^= _mul(divisor[j], coef)
+    return out[-(len(divisor) - 1):]
+
+# ========== Код ==========
+class ReedSolomon:
+    def __init__(self, parity):
+        if parity < 2 or parity % 2:
+            raise ValueError(f"parity must be an even number >= 2, got {parity}")
+        self.parity = parity
+        generator = [1]
+        for i in range(parity):
+            generator = _poly_mul(generator, [1, _EXP[i]])
+        self._generator = generator
+        self._generator_log = [_LOG[c] if c else None for c in generator]
+
+    # Размер кадра с проверочными байтами
+    def encoded_size(self, size):
+        return size + self.parity
+
+    def encode(self, data):
+        if len(data) + self.parity > MAX_CODEWORD:
+            raise ValueError(f"{len(data)} bytes do not fit one codeword of {MAX_CODEWORD}")
+        buf = bytearray(data) + bytearray(self.parity)
+        generator_log = self._generator_log
+        for i in range(len(data)):
+            coef = buf[i]
+            if coef:
+                log_coef = _LOG[coef]
+                for j in range(1, len(generator_log)):
+                    if generator_log[j] is not None:
+                        buf[i + j] ^= _EXP[log_coef + generator_log[j]]
+        return bytes(data) + bytes(buf[len(data):])
+
+    def _syndromes(self, codeword):
+        syndromes = []
+        for i in range(self.parity):
+            y = 0
+            for byte in codeword:
+                y = (_EXP[_LOG[y] + i] if y else 0) ^ byte
+            syndromes.append(y)
+        return syndromes
+
+    # Возвращает (данные без проверочных байт, исправлено байт) или None,
+    # если ошибок больше, чем код может исправить
+    def decode(self, codeword):
+        codeword = bytes(codeword)
+        syndromes = self._syndromes(codeword)
+        if not any(syndromes):
+            return codeword[:-self.parity], 0
+        locator = self._error_locator(syndromes)
+        if locator is None:
+            return None
+        positions = self._error_positions(locator, len(codeword))
+        if positions is None:
+            return None
+        corrected = self._correct(bytearray(codeword), syndromes, positions)
+        # Ошибок больше parity // 2 иногда дают «исправление» в другое
+        # кодовое слово не того кадра; такое слово не проходит проверку
+        if any(self._syndromes(corrected)):
+            return None
+        return bytes(corrected[:-self.parity]), len(positions)
+
+    # ========== Декодирование ==========
+    # Многочлен локаторов ошибок (Берлекэмп — Мэсси)
+    def _error_locator(self, syndromes):
+        locator = [1]
+        previous = [1]
+        for i in range(self.parity):
+            delta = syndromes[i]
+            for j in range(1, len(locator)):
+                if i - j >= 0:
+                    delta ^= _mul(locator[-(j + 1)], syndromes[i - j])
+            previous = previous + [0]
+            if delta:
+                if len(previous) > len(locator):
+                    new_locator = _poly_scale(previous, delta)
+                    previous = _poly_scale(locator, _inverse(delta))
+                    locator = new_locator
+                locator = _poly_add(locator, _poly_scale(previous, delta))
+        while locator and locator[0] == 0:
+            del locator[0]
+        if (len(locator) - 1) * 2 > self.parity:
+            return None
+        return locator
+
+    # Номера искажённых байт (поиск Ченя)
+    def _error_positions(self, locator, size):
+        errors = len(locator) - 1
+        reversed_locator = locator[::-1]
+        positions = [size - 1 - i for i in range(size) if _poly_eval(reversed_locator, _pow(2, i)) == 0]
+        if len(positions) != errors:
+            return None
+        return positions
+
+    # Величины ошибок (алгоритм Форни) и исправление на месте
+    def _correct(self, codeword, syndromes, positions):
+        coef_positions = [len(codeword) - 1 - p for p in positions]
+        locator = [1]
+        for i in coef_positions:
+            locator = _poly_mul(locator, _poly_add([1], [_pow(2, i), 0]))
+        # Синдромы с ведущим нулём — как в выводе формулы Форни
+        padded = [0] + syndromes
+        evaluator = _poly_mod(_poly_mul(padded[::-1], locator), [1] + [0] * len(locator))[::-1]
+        x_values = [_pow(2, p) for p in coef_positions]
+        for i, x in enumerate(x_values):
+            x_inverse = _inverse(x)
+            denominator = 1
+            for j, other in enumerate(x_values):
+                if j != i:
+                    denominator = _mul(denominator, 1 ^ _mul(x_inverse, other))
+            if denominator == 0:
+                return codeword
+            y = _mul(x, _poly_eval(evaluator[::-1], x_inverse))
+            codeword[positions[i]] ^= _div(y, denominator)
+        return codeword
@@ -0,0 +1,236 @@
+# ========================================
+# Файл: common/framing.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Потоковый разбор кадров UART с ресинхронизацией по CRC8
+#   - EN: Streaming UART frame decoder with CRC8 resynchronisation
+# ========================================
+
+import time
+from collections import deque
+
+from common.crc import crc8
+
+# Кадр = AES-шифротекст (блоки по 16 байт) + 1 байт CRC8; по умолчанию
+# 1..3 блока, агрегированные кадры длиннее (см. common/payload.py)
+FRAME_SIZES = (17, 33, 49)
+BUFFER_CAPACITY = 4096
+RECENT_SIZES = 4         # длин недавно принятых кадров, проверяемых первыми
+
+# ========== Декодер кадров ==========
+# Байты из UART складываются в буфер фиксированного размера. Кадр ищется
+# по смещению, где CRC8 совпадает для одной из длин FRAME_SIZES; если ни
+# одна длина не подходит — сдвиг на один байт (ресинхронизация).
+#
+# feed() — генератор: кадры отдаются как memoryview на внутренний буфер без
+# копирования, поэтому кадр действителен только до следующего шага генератора.
+#
+# validate(frame) -> bool — необязательная доп. проверка кадра с верным CRC8:
+# на случайных байтах CRC8 совпадает с вероятностью 1/256, этого мало при
+# переборе смещений и длин.
+#
+# Длин много (агрегация, варианты заголовка из common/devices.py), и на
+# начале настоящего кадра каждая более короткая длина — ещё один шанс
+# ложного совпадения CRC8, который validate отбрасывает ценой расшифровки.
+# Отправитель шлёт кадры одной-двух длин, поэтому длины последних принятых
+# кадров проверяются первыми, остальные — по возрастанию. Пока в буфере
+# меньше наибольшей из этих длин, поиск ждёт: кадр, скорее всего, ещё
+# приходит. Когда байт хватает, а ни одна умещающаяся длина не подошла,
+# смещение сдвигается сразу, без ожидания самой длинной длины: иначе кадр
+# за мусором ждал бы следующего кадра или паузы. До первого кадра ждётся
+# самая длинная длина.
+#
+# feed(chunk, received_at) запоминает время прихода куска; received_at
+# выданного кадра — время куска, в котором пришёл его последний байт, а не
+# время разбора (кадр мог ждать в буфере паузы или следующего куска).
+#
+# fec — необязательный код (common/fec.py): в линии кадр длиннее на
+# проверочные байты, он сначала исправляется, затем проверяется CRC8;
+# отдаётся исправленный кадр (bytes) без проверочных байт.
+class FrameDecoder:
+    def __init__(self, frame_sizes=FRAME_SIZES, capacity=BUFFER_CAPACITY, validate=None, fec=None):
+        self.frame_sizes = tuple(sorted(set(frame_sizes)))
+        if not self.frame_sizes or self.frame_sizes[0] < 2:
+            raise ValueError(f"invalid frame sizes: {frame_sizes}")
+        self.fec = fec
+        self._wire_sizes = self.frame_sizes if fec is None else \
+            tuple(fec.encoded_size(size) for size in self.frame_sizes)
+        if capacity < 2 * self._wire_sizes[-1]:
+            raise ValueError(f"capacity {capacity} is too small for frames of {self._wire_sizes[-1]} bytes")
+        self.validate = validate
+        self._recent = []        # длины в линии последних принятых кадров, новые первыми
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self._in_resync = False
+        self._total = 0          # байт, поданных с начала
+        self._arrivals = deque() # (номер байта после куска, время прихода куска)
+        self.received_at = None  # время прихода последнего выданного кадра
+        self.frames = 0          # принятых кадров
+        self.resyncs = 0         # случаев потери синхронизации
+        self.skipped_bytes = 0   # байт, отброшенных при поиске кадра
+        self.rejected = 0        # кадров с верным CRC8, не прошедших validate
+        self.corrected = 0       # кадров, исправленных fec
+        self.corrected_bytes = 0 # исправленных байт в них
+
+    def __len__(self):
+        return self._end - self._start
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "resyncs": self.resyncs,
+            "skipped_bytes": self.skipped_bytes,
+            "rejected": self.rejected,
+            "corrected": self.corrected,
+            "corrected_bytes": self.corrected_bytes,
+            "buffered": len(self),
+        }
+
+    def reset(self):
+        self._start = self._end = 0
+        self._in_resync = False
+        self._arrivals.clear()
+
+    # received_at — время прихода куска (по умолчанию — текущее)
+    def feed(self, chunk, received_at=None):
+        if received_at is None:
+            received_at = time.time()
+        # Большой кусок (например, при воспроизведении записи) подаётся
+        # в буфер частями, поэтому байты не теряются при переполнении
+        data = memoryview(chunk).cast("B")
+        pos = 0
+        while True:
+            room = len(self._buf) - (self._end - self._start)
+            part = data[pos:pos + room]
+            pos += len(part)
+            if part:
+                # Куски, все байты которых уже разобраны или отброшены
+                consumed = self._total - len(self)
+                while self._arrivals and self._arrivals[0][0] <= consumed:
+                    self._arrivals.popleft()
+                self._append(part)
+                self._arrivals.append((self._total, received_at))
+            yield from self._decode()
+            if pos >= len(data):
+                return
+
+    # Пауза в потоке (таймаут чтения UART) означает, что недошедший хвост
+    # кадра уже не придёт: кадры ищутся без ожидания более длинных, а
+    # остаток короче минимального кадра отбрасывается
+    def drain(self):
+        yield from self._decode(final=True)
+        self._skip(self._end - self._start)
+        self._start = self._end
+        self._arrivals.clear()
+
+    # ========== Буфер ==========
+    def _append(self, chunk):
+        size = len(chunk)
+        if self._end + size > len(self._buf):
+            # Перенос хвоста в начало: размер bytearray не меняется,
+            # поэтому выданные ранее memoryview не мешают
+            pending = self._end - self._start
+            self._buf[:pending] = self._buf[self._start:self._end]
+            self._start, self._end = 0, pending
+        self._buf[self._end:self._end + size] = chunk
+        self._end += size
+        self._total += size
+
+    def _skip(self, count):
+        if count <= 0:
+            return
+        if not self._in_resync:
+            self._in_resync = True
+            self.resyncs += 1
+        self.skipped_bytes += count
+
+    # ========== Поиск кадров ==========
+    def _decode(self, final=False):
+        sizes = self._wire_sizes
+        match = self._match if self.fec is None else self._match_fec
+        while self._end - self._start >= sizes[0]:
+            available = self._end - self._start
+            expected = max(self._recent) if self._recent else sizes[-1]
+            if not final and available < expected:
+                return  # ожидаемый кадр ещё не дошёл целиком
+            frame, size = match(self._start, available)
+            if frame is None:
+                self._skip(1)
+                self._start += 1
+                continue
+            self._start += size
+            self._in_resync = False
+            self.frames += 1
+            self._remember(size)
+            self.received_at = self._arrival(self._total - (self._end - self._start))
+            yield frame
+
+    # Время прихода куска, в котором был байт с номером position - 1;
+    # куски, целиком лежащие до него, больше не нужны
+    def _arrival(self, position):
+        arrivals = self._arrivals
+        while len(arrivals) > 1 and arrivals[0][0] < position:
+            arrivals.popleft()
+        return arrivals[0][1]
+
+    def _remember(self, size):
+        recent = self._recent
+        if recent and recent[0] == size:
+            return
+        if size in recent:
+            recent.remove(size)
+        recent.insert(0, size)
+        del recent[RECENT_SIZES:]
+
+    # Кадр с верным CRC8 — ещё через validate
+    def _accept(self, candidate):
+        if self.validate is not None and not self.validate(candidate):
+            self.rejected += 1
+            return False
+        return True
+
+    # (кадр, его длина в линии) или (None, 0)
+    def _match(self, start, available):
+        view = self._view
+        for size in self._recent:
+            if size <= available and crc8(view[start:start + size - 1]) == view[start + size - 1]:
+                candidate = view[start:start + size]
+                if self._accept(candidate):
+                    return candidate, size
+        # CRC8 считается нарастающим итогом: длины перебираются по
+        # возрастанию, и каждый байт смещения проходит через CRC один раз
+        crc = 0
+        covered = 0
+        for size in self.frame_sizes:
+            if size > available:
+                break
+            crc = crc8(view[start + covered:start + size - 1], crc)
+            covered = size - 1
+            if crc != view[start + covered] or size in self._recent:
+                continue
+            candidate = view[start:start + size]
+            if self._accept(candidate):
+                return candidate, size
+        return None, 0
+
+    def _match_fec(self, start, available):
+        view = self._view
+        for wire_size in self._recent + [size for size in self._wire_sizes if size not in self._recent]:
+            if wire_size > available:
+                continue
+            decoded = self.fec.decode(view[start:start + wire_size])
+            if decoded is None:
+                continue
+            frame, fixed = decoded
+            if crc8(frame[:-1]) != frame[-1]:
+                continue
+            if not self._accept(frame):
+                continue
+            if fixed:
+                self.corrected += 1
+                self.corrected_bytes += fixed
+            return frame, wire_size
+        return None, 0
@@ -0,0 +1,83 @@
+# ========================================
+# Файл: common/latency.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Гистограммы времени этапов с фиксированными корзинами (p50/p95/p99/max)
+#   - EN: Fixed-bucket per-stage latency histograms (p50/p95/p99/max)
+# ========================================
+
+import bisect
+import math
+
+# Верхние границы корзин, секунды: 1-2-5 от 1 мкс до 10 с; всё дольше —
+# в последней корзине (для неё процентиль = максимум)
+BUCKETS = tuple(m * 10.0 ** e for e in range(-6, 1) for m in (1, 2, 5)) + (10.0,)
+
+# ========== Гистограмма ==========
+# Запись — один bisect и три сложения; память не растёт с числом замеров.
+# Процентиль — верхняя граница корзины (не больше максимума), т.е. оценка сверху.
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # Замеры другой гистограммы с теми же корзинами (сводка по нескольким)
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index == len(self.bounds):
+                    return self.max
+                return min(self.bounds[index], self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+# ========== Этапы ==========
+# recorded — сумма всех замеров: вложенный этап можно вычесть из
+# охватывающего (время поиска кадров = обработка куска - расшифровка - ...)
+class StageLatency:
+    def __init__(self, stages, bounds=BUCKETS):
+        self.stages = tuple(stages)
+        self.histograms = {stage: Histogram(bounds) for stage in self.stages}
+        self.recorded = 0.0
+
+    def record(self, stage, seconds):
+        self.histograms[stage].record(seconds)
+        self.recorded += seconds
+
+    def summary(self):
+        return {stage: self.histograms[stage].summary() for stage in self.stages
+                if self.histograms[stage].count}
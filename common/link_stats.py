@@ -0,0 +1,245 @@
+# ========================================
+# Файл: common/link_stats.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Сопоставление sent/received CSV и статистика канала (PDR, потери, задержка)
+#   - EN: Sent/received CSV merge and link statistics (PDR, loss bursts, latency)
+# ========================================
+
+import csv
+import glob
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+# Пара файлов одного запуска: sent_run_3_200m.csv + received_run_3_200m.csv
+RunFiles = namedtuple("RunFiles", "name run_number distance sent_path received_path")
+
+_RUN_NAME = re.compile(r"^sent_run_(\d+)(?:_(\d+)m)?\.csv$")
+RECEIVED_PREFIXES = ("received_", "gateway_")   # приёмник 24h и шлюз
+
+MERGED_COLUMNS = ['run', 'run_number', 'distance_m', 'key', 'packet_id', 'seq',
+                  'sent_time', 'received_time', 'delivered', 'latency_s', 'clock_delta_s', 'hour']
+
+# ========== Поиск запусков ==========
+# sent-файлы ищутся рекурсивно; received — в соседней папке received с тем
+# же суффиксом (data/sender/sent_run_1.csv -> data/received/received_run_1.csv).
+# Файл отправителя с номером устройства лежит в sender/device=N/ и
+# сопоставляется только с received/device=N/ того же устройства: seq у
+# каждого отправителя свои. Номер запуска в имени — запуск отправителя,
+# если кадры несут его номер. Файлы шлюза (gateway_run_N.csv) разложены
+# так же и считаются принятыми.
+def find_runs(root):
+    runs = []
+    pattern = os.path.join(root, "**", "sent_run_*.csv")
+    for sent_path in sorted(glob.glob(pattern, recursive=True)):
+        match = _RUN_NAME.match(os.path.basename(sent_path))
+        if not match:
+            continue
+        suffix = os.path.basename(sent_path)[len("sent_"):]
+        directory = os.path.dirname(sent_path)
+        partition = os.path.basename(directory)
+        if partition.startswith("device="):
+            directory = os.path.dirname(directory)
+        else:
+            partition = ""
+        received_dir = os.path.join(os.path.dirname(directory), "received", partition)
+        distance = int(match.group(2)) if match.group(2) else None
+        for prefix in RECEIVED_PREFIXES:
+            received_path = os.path.join(received_dir, prefix + suffix)
+            if os.path.exists(received_path):
+                runs.append(RunFiles(run_name(received_path, root), int(match.group(1)), distance, sent_path,
+                                     received_path))
+    return runs
+
+# Имя запуска по файлу sent_/received_: папка эксперимента относительно
+# root + суффикс ("24h_exp_results/run_1", "run_3_200m"); у файла из папки
+# устройства (received/device=2/received_run_1.csv) — и она ("run_1/device=2")
+def run_name(path, root):
+    directory = os.path.dirname(path)
+    partition = os.path.basename(directory)
+    if partition.startswith("device="):
+        directory = os.path.dirname(directory)
+    base = os.path.relpath(os.path.dirname(os.path.dirname(directory)), root)
+    name = os.path.basename(path).split("_", 1)[1][:-len(".csv")]
+    if base != os.curdir:
+        name = f"{base.replace(os.sep, '/')}/{name}"
+    if partition.startswith("device="):
+        name = f"{name}/{partition}"
+    return name
+
+# ========== Чтение CSV ==========
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+# Возвращает (ключ, столбцы); ключ — seq, если он есть в обоих файлах,
+# иначе packet_id (секунда отправки, уникальна при интервале >= 1 с)
+def _join_key(sent_header, received_header):
+    return 'seq' if 'seq' in sent_header and 'seq' in received_header else 'packet_id'
+
+def _read(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        return header, list(reader)
+
+# ========== Сопоставление ==========
+# Хеш-индекс по ключу принятых строк; каждой отправленной строке — одна
+# запись с признаком доставки. Повторы на приёмнике считаются один раз.
+# latency_s — только из столбца latency_ms приёмника (в одну сторону, с
+# поправкой на часы отправителя, common/clock_sync.py); без него None.
+# clock_delta_s — разность секундных отметок timestamp по часам двух
+# устройств: включает расхождение часов (до десятков тысяч секунд), это не
+# задержка, а её разброс (p95 - min) от часов не зависит.
+def merge_run(run):
+    sent_header, sent_rows = _read(run.sent_path)
+    received_header, received_rows = _read(run.received_path)
+    key = _join_key(sent_header, received_header)
+    s_key, s_id, s_time = (sent_header.index(c) for c in (key, 'packet_id', 'timestamp'))
+    s_seq = sent_header.index('seq') if 'seq' in sent_header else None
+    s_dist = sent_header.index('distance_m') if 'distance_m' in sent_header else None
+    r_key, r_time = (received_header.index(c) for c in (key, 'timestamp'))
+    r_latency = received_header.index('latency_ms') if 'latency_ms' in received_header else None
+
+    received = {}
+    for row in received_rows:
+        if len(row) > max(r_key, r_time) and row[r_key]:
+            latency_ms = row[r_latency] if r_latency is not None and len(row) > r_latency else ''
+            received.setdefault(row[r_key], (row[r_time], latency_ms))
+
+    distance = run.distance
+    if distance is None and s_dist is not None and sent_rows and sent_rows[0][s_dist]:
+        distance = int(sent_rows[0][s_dist])
+
+    merged = []
+    start = None
+    for row in sent_rows:
+        if len(row) <= max(s_key, s_id, s_time):
+            continue  # оборванная последняя строка
+        sent_time = _parse_time(row[s_time])
+        if start is None:
+            start = sent_time
+        match = received.get(row[s_key])
+        delivered = match is not None
+        received_time = _parse_time(match[0]) if delivered else None
+        latency = float(match[1]) / 1000 if delivered and match[1] else None
+        clock_delta = received_time - sent_time if received_time is not None and sent_time is not None else None
+        merged.append({
+            'run': run.name,
+            'run_number': run.run_number,
+            'distance_m': distance,
+            'key': key,
+            'packet_id': int(row[s_id]),
+            'seq': int(row[s_seq]) if s_seq is not None and row[s_seq] else None,
+            'sent_time': sent_time,
+            'received_time': received_time,
+            'delivered': delivered,
+            'latency_s': latency,
+            'clock_delta_s': clock_delta,
+            'hour': int((sent_time - start) // 3600) if sent_time is not None and start is not None else None,
+        })
+    return merged
+
+# ========== Статистика ==========
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# Серии подряд недоставленных пакетов в порядке отправки
+def loss_bursts(delivered):
+    bursts = []
+    run = 0
+    for ok in delivered:
+        if ok:
+            if run:
+                bursts.append(run)
+            run = 0
+        else:
+            run += 1
+    if run:
+        bursts.append(run)
+    return bursts
+
+# Задержка — только по latency_ms приёмника; у запуска без неё None
+def run_stats(merged):
+    sent = len(merged)
+    delivered = sum(1 for m in merged if m['delivered'])
+    bursts = loss_bursts(m['delivered'] for m in merged)
+    latencies = sorted(m['latency_s'] for m in merged if m['latency_s'] is not None)
+    first = merged[0] if merged else {}
+    return {
+        'run': first.get('run'),
+        'run_number': first.get('run_number'),
+        'distance_m': first.get('distance_m'),
+        'sent': sent,
+        'delivered': delivered,
+        'lost': sent - delivered,
+        'pdr': round(delivered / sent, 4) if sent else 0.0,
+        'bursts': len(bursts),
+        'max_burst': max(bursts, default=0),
+        'mean_burst': round(sum(bursts) / len(bursts), 2) if bursts else 0.0,
+        'latency_min_s': _percentile(latencies, 0.0),
+        'latency_p50_s': _percentile(latencies, 0.5),
+        'latency_p95_s': _percentile(latencies, 0.95),
+        'latency_max_s': latencies[-1] if latencies else None,
+    }
+
+# PDR по расстоянию: суммы по всем запускам на этом расстоянии
+def distance_stats(all_run_stats):
+    totals = {}
+    for stats in all_run_stats:
+        entry = totals.setdefault(stats['distance_m'], {'distance_m': stats['distance_m'], 'runs': 0,
+                                                        'sent': 0, 'delivered': 0})
+        entry['runs'] += 1
+        entry['sent'] += stats['sent']
+        entry['delivered'] += stats['delivered']
+    result = []
+    for distance in sorted(totals, key=lambda d: (d is None, d)):
+        entry = totals[distance]
+        entry['pdr'] = round(entry['delivered'] / entry['sent'], 4) if entry['sent'] else 0.0
+        result.append(entry)
+    return result
+
+# PDR по часам от начала запуска (для суточных запусков)
+def hourly_stats(merged):
+    hours = {}
+    for m in merged:
+        if m['hour'] is None:
+            continue
+        entry = hours.setdefault(m['hour'], [0, 0])
+        entry[0] += 1
+        entry[1] += m['delivered']
+    return [{'run': merged[0]['run'], 'hour': hour, 'sent': sent, 'delivered': delivered,
+             'pdr': round(delivered / sent, 4)}
+            for hour, (sent, delivered) in sorted(hours.items())]
+
+# ========== Запись ==========
+# Parquet при наличии pyarrow, иначе CSV с теми же столбцами.
+# Возвращает путь записанного файла.
+def write_table(rows, path_base, columns=None):
+    columns = columns or (list(rows[0]) if rows else [])
+    if HAVE_PYARROW:
+        path = path_base + ".parquet"
+        table = pyarrow.table({c: [row.get(c) for row in rows] for c in columns})
+        pyarrow.parquet.write_table(table, path)
+        return path
+    path = path_base + ".csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(['' if row.get(c) is None else row.get(c) for c in columns])
+    return path
@@ -0,0 +1,135 @@
+# ========================================
+# Файл: common/loss.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Учёт потерь пакетов по seq на приёмнике (скользящая битовая карта)
+#   - EN: Receiver-side packet loss accounting by seq (sliding bitmap)
+# ========================================
+
+WINDOW = 1024           # seq, в пределах которых учитываются опоздавшие и повторы
+
+SEQ_MASK = 0xFFFFFFFF   # seq в кадре — 32 бита
+_SEQ_HALF = 1 << 31
+
+# Результаты add()
+NEW = "new"             # следующий или более новый seq
+LATE = "late"           # пришёл после более новых и закрыл пропуск
+DUPLICATE = "duplicate" # такой seq уже принят
+STALE = "stale"         # старше окна: повтор или опоздание уже не различить
+
+# ========== Учёт потерь ==========
+# Бит i карты означает, что принят seq (highest - i). Пропуск, который ещё
+# в окне, может закрыться опоздавшим пакетом; биты, вышедшие за окно,
+# окончательны и идут в учёт серий потерь (burst).
+#
+#   expected — seq от первого принятого до последнего, включительно
+#   lost     — expected минус принятые без повторов
+#   pdr      — доля доставленных (packet delivery ratio)
+#   bursts   — число серий подряд потерянных seq, max_burst — самая длинная
+class LossTracker:
+    def __init__(self, window=WINDOW):
+        if window < 1:
+            raise ValueError(f"window must be positive, got {window}")
+        self.window = window
+        self.first = None       # первый принятый seq (развёрнутый)
+        self.highest = None     # последний по порядку seq (развёрнутый)
+        self._bits = 0
+        self.received = 0
+        self.late = 0
+        self.duplicates = 0
+        self.stale = 0
+        # Серии потерь среди битов, вышедших за окно
+        self._bursts = 0
+        self._max_burst = 0
+        self._run = 0
+
+    def add(self, seq):
+        seq &= SEQ_MASK
+        if self.highest is None:
+            self.first = self.highest = seq
+            self._bits = 1
+            self.received = 1
+            return NEW
+        # Разность по модулю 2^32: переход seq через 0 не ломает учёт
+        diff = ((seq - self.highest + _SEQ_HALF) & SEQ_MASK) - _SEQ_HALF
+        if diff > 0:
+            self._advance(diff)
+            self.highest += diff
+            self._bits |= 1
+            self.received += 1
+            return NEW
+        age = -diff
+        if age >= self.window or age > self.highest - self.first:
+            self.stale += 1
+            return STALE
+        if self._bits >> age & 1:
+            self.duplicates += 1
+            return DUPLICATE
+        self._bits |= 1 << age
+        self.received += 1
+        self.late += 1
+        return LATE
+
+    def _advance(self, shift):
+        # Биты, уходящие за окно, — от старых к новым
+        valid = min(self.window, self.highest - self.first + 1)
+        for age in range(valid - 1, max(self.window - shift, 0) - 1, -1):
+            self._settle(self._bits >> age & 1, 1)
+        # Пропуск длиннее окна целиком уходит за окно потерянным
+        if shift > self.window:
+            self._settle(0, shift - self.window)
+        self._bits = (self._bits << shift) & ((1 << self.window) - 1)
+
+    def _settle(self, received, count):
+        if received:
+            if self._run:
+                self._bursts += 1
+                self._max_burst = max(self._max_burst, self._run)
+                self._run = 0
+        else:
+            self._run += count
+
+    # Для подтверждения (common/arq.py): (seq, биты width seq до него,
+    # бит i — принят seq - i) или None, пока ничего не принято. seq — уже
+    # принятый (по умолчанию последний): ACK на опоздавший кадр строится от
+    # него самого. Если seq старше окна, известен только он сам и ещё
+    # count - 1 seq перед ним (показания того же кадра).
+    def bitmap(self, width, seq=None, count=1):
+        if self.highest is None:
+            return None
+        if seq is None:
+            seq = self.highest
+        age = (self.highest - seq) & SEQ_MASK
+        if age >= self.window or age > self.highest - self.first:
+            return seq & SEQ_MASK, (1 << min(count, width)) - 1
+        return seq & SEQ_MASK, (self._bits >> age) & ((1 << min(width, self.window - age)) - 1)
+
+    # ========== Статистика ==========
+    def expected(self):
+        return 0 if self.highest is None else self.highest - self.first + 1
+
+    def stats(self):
+        expected = self.expected()
+        # Серии с учётом ещё не окончательных битов окна
+        bursts, max_burst, run = self._bursts, self._max_burst, self._run
+        valid = min(self.window, expected)
+        for age in range(valid - 1, -1, -1):
+            if self._bits >> age & 1:
+                if run:
+                    bursts += 1
+                    max_burst = max(max_burst, run)
+                    run = 0
+            else:
+                run += 1
+        return {
+            "received": self.received,
+            "expected": expected,
+            "lost": expected - self.received,
+            "pdr": round(self.received / expected, 4) if expected else 0.0,
+            "bursts": bursts,
+            "max_burst": max_burst,
+            "late": self.late,
+            "duplicates": self.duplicates,
+            "stale": self.stale,
+        }
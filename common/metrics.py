@@ -0,0 +1,137 @@
+# ========================================
+# Файл: common/metrics.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: HTTP-точка /metrics в текстовом формате Prometheus для скриптов
+#         24h; отдельный поток, цикл UART не блокируется
+#   - EN: Prometheus text-format /metrics endpoint for the 24h scripts on
+#         a background thread that never blocks the UART loop
+# ========================================
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOST = "127.0.0.1"     # только локально; для сбора с другой машины — "0.0.0.0"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ========== Реестр ==========
+# Метрика — имя, тип, описание и функция, которая возвращает значение в
+# момент запроса: число, {значение метки: число} (если задан label),
+# common.latency.Histogram или None (метрика пропускается). Функции
+# только читают счётчики, которые поток UART и так ведёт, поэтому сам
+# цикл UART ничего не делает ради метрик; чтение int из другого потока
+# безопасно под GIL.
+class MetricsServer:
+    def __init__(self, port, host=HOST, prefix=""):
+        self.port = port
+        self.host = host
+        self.prefix = prefix
+        self.started = time.monotonic()
+        self._metrics = []
+        self._server = None
+        self._thread = None
+        self.scrapes = 0
+        self.gauge("uptime_seconds", "Seconds since the metrics endpoint started",
+                   lambda: time.monotonic() - self.started)
+
+    def counter(self, name, help, func, label=None):
+        self._metrics.append((self.prefix + name, "counter", help, func, label))
+
+    def gauge(self, name, help, func, label=None):
+        self._metrics.append((self.prefix + name, "gauge", help, func, label))
+
+    def histogram(self, name, help, func):
+        self._metrics.append((self.prefix + name, "histogram", help, func, None))
+
+    # ========== Текстовый формат ==========
+    def render(self):
+        lines = []
+        for name, kind, help, func, label in self._metrics:
+            try:
+                value = func()
+            except Exception:
+                continue  # источник ещё не создан или уже закрыт
+            if value is None:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                lines.extend(_histogram_lines(name, value))
+            elif label is not None:
+                for key, number in value.items():
+                    lines.append(f'{name}{{{label}="{key}"}} {_number(number)}')
+            else:
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    # ========== HTTP ==========
+    def start(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                metrics.scrapes += 1
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # без вывода в консоль на каждый опрос
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]  # при port=0 — выбранный системой
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+
+# Накопительные корзины le, как в гистограммах Prometheus
+def _histogram_lines(name, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum {_number(histogram.total)}")
+    lines.append(f"{name}_count {histogram.count}")
+    return lines
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return f"{value:.6g}"
+
+# ========== Общие метрики ==========
+# Файлы запуска (RunWriter): объём записи и время fsync
+def add_run_writer_metrics(metrics, get_run_writer):
+    metrics.counter("bytes_written_total", "Bytes written to the run CSV and log",
+                    lambda: get_run_writer().bytes)
+    metrics.counter("fsyncs_total", "fsync calls on the run CSV and log",
+                    lambda: get_run_writer().fsyncs)
+    metrics.histogram("fsync_seconds", "Duration of one fsync of the run CSV or log",
+                      lambda: get_run_writer().fsync_latency)
+
+# Возраст последнего события по time.monotonic(); None — события ещё не было
+def age(get_moment):
+    def value():
+        moment = get_moment()
+        return None if moment is None else time.monotonic() - moment
+    return value
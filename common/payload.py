@@ -0,0 +1,196 @@
+# ========================================
+# Файл: common/payload.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Текстовый, компактный двоичный и агрегированный форматы нагрузки
+#   - EN: Text, compact binary and multi-sample aggregate payload formats
+# ========================================
+
+import struct
+from collections import namedtuple
+
+from common.codec import BLOCK_SIZE, unpad_view
+
+# Одно показание из кадра. sampled_at — Unix-время снятия показания, если
+# кадр его несёт (агрегированный формат); sent_at — время отправки с
+# миллисекундами (текстовый и двоичный форматы); иначе None
+Reading = namedtuple("Reading", "seq packet_id params sampled_at sent_at", defaults=(None,))
+
+# ========== Текстовый формат ==========
+# "1750820056,29,983,60,4,95" — packet_id и пять показаний; после PKCS7
+# это 32 байта шифротекста, кадр 33 байта. Седьмое поле — необязательный
+# seq ("1750820056,29,983,60,4,95,2879"), до 99999 кадр остаётся 33 байта.
+# packet_id может быть временем отправки с миллисекундами
+# ("1750820056.123,..."), но с seq это 34+ символа и кадр 49 байт, поэтому
+# 24h-отправитель шлёт в тексте целые секунды: миллисекунды — только в
+# двоичном формате, который умещается в один блок.
+TEXT_FIELDS = 6
+
+# timestamp — int (секунды, как раньше) или float (с миллисекундами)
+def pack_text(timestamp, params, seq=None):
+    first = f"{timestamp:.3f}" if isinstance(timestamp, float) else str(timestamp)
+    text = f"{first}," + ",".join(map(str, params))
+    return text if seq is None else f"{text},{seq & 0xFFFFFFFF}"
+
+# Возвращает (seq, packet_id, params, sent_at); seq и sent_at — None для
+# пакетов без них
+def parse_text(decrypted):
+    parts = decrypted.split(",")
+    if len(parts) == TEXT_FIELDS:
+        seq = None
+    elif len(parts) == TEXT_FIELDS + 1:
+        seq = int(parts.pop())
+    else:
+        return None
+    # ValueError при мусоре
+    if "." in parts[0]:
+        sent_at = float(parts[0])
+        packet_id = int(sent_at)
+    else:
+        sent_at = None
+        packet_id = int(parts[0])
+    return seq, packet_id, list(map(int, parts[1:])), sent_at
+
+# ========== Двоичный формат ==========
+# Ровно один блок AES (16 байт, без PKCS7), кадр 17 байт:
+#   I  маркер формата 0xB3 в старшем байте, seq в младших 24 битах
+#      (переполнение через 194 дня при отправке раз в секунду)
+#   I  время отправки, Unix-время в секундах (оно же packet_id)
+#   H  миллисекунды времени отправки
+#   b  температура, H давление, B влажность, B плотность, B концентрация
+# Прежний вариант 0xB1 (">BIIbHBBBx": seq 32 бита, без миллисекунд)
+# по-прежнему разбирается.
+BINARY_MAGIC = 0xB3
+BINARY_STRUCT = struct.Struct(">IIHbHBBB")
+BINARY_SEQ_MASK = 0xFFFFFF
+BINARY_V1_MAGIC = 0xB1
+BINARY_V1_STRUCT = struct.Struct(">BIIbHBBBx")
+BINARY_SIZE = BINARY_STRUCT.size          # 16
+BINARY_FRAME_SIZE = BINARY_SIZE + 1       # + CRC8
+
+# sent_at — Unix-время отправки (float с миллисекундами или int)
+def pack_binary(seq, sent_at, params):
+    seconds = int(sent_at)
+    millis = int(round((sent_at - seconds) * 1000))
+    if millis >= 1000:
+        seconds, millis = seconds + 1, 0
+    try:
+        return BINARY_STRUCT.pack(BINARY_MAGIC << 24 | seq & BINARY_SEQ_MASK, seconds, millis, *params)
+    except struct.error as e:
+        raise ValueError(f"params {params} do not fit the binary payload: {e}") from None
+
+# Возвращает (seq, packet_id, params, sent_at) или None
+def unpack_binary(plain):
+    if plain is None or len(plain) != BINARY_SIZE:
+        return None
+    if plain[0] == BINARY_MAGIC:
+        word, seconds, millis, *params = BINARY_STRUCT.unpack(plain)
+        if millis > 999:
+            return None
+        return word & BINARY_SEQ_MASK, seconds, params, seconds + millis / 1000
+    if plain[0] == BINARY_V1_MAGIC:
+        _, seq, seconds, *params = BINARY_V1_STRUCT.unpack(plain)
+        return seq, seconds, params, None
+    return None
+
+# ========== Агрегированный формат ==========
+# N показаний в одном кадре (PKCS7 до кратности 16):
+#   заголовок  B маркер 0xB2, I seq первого показания, I время первого, B N
+#   первое     b H B B B — показание целиком
+#   остальные  H — секунды от первого, 5 x b — разности с первым показанием
+# Кадр до 225 байт: у E22 пакет больше 240 байт делится на части.
+AGGREGATE_MAGIC = 0xB2
+AGGREGATE_HEADER = struct.Struct(">BIIB")
+AGGREGATE_FIRST = struct.Struct(">bHBBB")
+AGGREGATE_DELTA = struct.Struct(">Hbbbbb")
+MAX_AGGREGATE = 30
+AGGREGATE_FRAME_SIZES = tuple(BLOCK_SIZE * blocks + 1 for blocks in range(1, 15))
+
+# samples — список (timestamp, params); можно ли добавить ещё одно показание
+def aggregate_fits(samples, timestamp, params):
+    if not samples:
+        return True
+    if len(samples) >= MAX_AGGREGATE:
+        return False
+    first_time, first_params = samples[0]
+    if not 0 <= timestamp - first_time <= 0xFFFF:
+        return False
+    return all(-128 <= value - base <= 127 for value, base in zip(params, first_params))
+
+def pack_aggregate(seq, samples):
+    if not 1 <= len(samples) <= MAX_AGGREGATE:
+        raise ValueError(f"aggregate needs 1..{MAX_AGGREGATE} samples, got {len(samples)}")
+    first_time, first_params = samples[0]
+    try:
+        parts = [AGGREGATE_HEADER.pack(AGGREGATE_MAGIC, seq & 0xFFFFFFFF, first_time, len(samples)),
+                 AGGREGATE_FIRST.pack(*first_params)]
+        for timestamp, params in samples[1:]:
+            deltas = [value - base for value, base in zip(params, first_params)]
+            parts.append(AGGREGATE_DELTA.pack(timestamp - first_time, *deltas))
+    except struct.error as e:
+        raise ValueError(f"samples do not fit the aggregate payload: {e}") from None
+    return b"".join(parts)
+
+def unpack_aggregate(plain):
+    if len(plain) < AGGREGATE_HEADER.size + AGGREGATE_FIRST.size or plain[0] != AGGREGATE_MAGIC:
+        return None
+    _, seq, first_time, count = AGGREGATE_HEADER.unpack_from(plain)
+    if count < 1 or len(plain) != AGGREGATE_HEADER.size + AGGREGATE_FIRST.size + \
+            AGGREGATE_DELTA.size * (count - 1):
+        return None
+    first_params = list(AGGREGATE_FIRST.unpack_from(plain, AGGREGATE_HEADER.size))
+    readings = [Reading(seq, first_time, first_params, first_time)]
+    offset = AGGREGATE_HEADER.size + AGGREGATE_FIRST.size
+    for index in range(1, count):
+        dt, *deltas = AGGREGATE_DELTA.unpack_from(plain, offset)
+        offset += AGGREGATE_DELTA.size
+        params = [base + delta for base, delta in zip(first_params, deltas)]
+        readings.append(Reading((seq + index) & 0xFFFFFFFF, first_time + dt, params, first_time + dt))
+    return readings
+
+# ========== Определение формата ==========
+# Текстовый пакет не короче 20 символов, поэтому его шифротекст всегда
+# 32+ байта; 16 байт шифротекста — только двоичный формат
+def is_binary(ciphertext):
+    return len(ciphertext) == BINARY_SIZE
+
+# ========== Разбор кадра ==========
+# reason совпадает с ключом сообщения в TEXT/TEXTS приёмников
+class PayloadError(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+# data — шифротекст кадра без CRC8; возвращает список Reading: одно
+# показание для текстового и двоичного форматов, N — для агрегированного
+def decode_payload(codec, data):
+    return parse_payload(data, codec.decrypt_raw(data))
+
+# То же по уже расшифрованному plain (decrypt_raw(data), с PKCS7) — чтобы
+# расшифровку и разбор можно было замерить по отдельности
+def parse_payload(data, plain):
+    if is_binary(data):
+        reading = unpack_binary(plain)
+        if reading is None:
+            raise PayloadError('format_error')
+        seq, packet_id, params, sent_at = reading
+        return [Reading(seq, packet_id, params, None, sent_at)]
+    plain = None if plain is None else unpad_view(plain)
+    if plain is None:
+        raise PayloadError('decrypt_fail')
+    if plain and plain[0] == AGGREGATE_MAGIC:
+        readings = unpack_aggregate(plain)
+        if readings is None:
+            raise PayloadError('format_error')
+        return readings
+    try:
+        reading = parse_text(str(plain, "utf-8"))
+    except UnicodeDecodeError:
+        raise PayloadError('decrypt_fail') from None
+    except ValueError:
+        raise PayloadError('value_error') from None
+    if reading is None:
+        raise PayloadError('format_error')
+    seq, packet_id, params, sent_at = reading
+    return [Reading(seq, packet_id, params, None, sent_at)]
@@ -0,0 +1,136 @@
+# ========================================
+# Файл: common/receive.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Общий путь приёма 24h-приёмника и шлюза: проверка и расшифровка
+#         кадров, потери и часы каждого запуска отправителя, раскладка
+#         строк по файлам
+#   - EN: Receive path shared by the 24h receiver and the gateway: frame
+#         validation and decoding, loss and clock state per sender run,
+#         row routing to files
+# ========================================
+
+import time
+
+from common.clock_sync import ClockSync
+from common.devices import split_header
+from common.latency import Histogram
+from common.loss import DUPLICATE, LossTracker
+from common.payload import PayloadError, decode_payload, parse_payload
+
+PAYLOAD_ERRORS = ("decrypt_fail", "format_error", "value_error")
+CLOCK_SYNC_WINDOW = 600  # с на точку нижней огибающей часов отправителя
+
+# ========== Кадры ==========
+# validate — для FrameDecoder(validate=...): CRC8 на сдвинутых байтах
+# совпадает 1 раз из 256, поэтому кадр должен ещё расшифроваться в
+# показания. Показания запоминаются, и read() тот же кадр повторно не
+# расшифровывает.
+#
+# latency — необязательный common.latency.StageLatency: время этапов
+# decrypt и parse.
+class FrameReader:
+    def __init__(self, keys, latency=None):
+        self.keys = keys
+        self.latency = latency
+        self.payload_errors = dict.fromkeys(PAYLOAD_ERRORS, 0)
+        self._decoded = (None, None, None, None)  # (кадр, устройство, запуск, показания)
+
+    def validate(self, frame):
+        try:
+            self._decoded = (frame,) + self._decode(frame)
+        except PayloadError as e:
+            self.payload_errors[e.reason] += 1
+            return False
+        return True
+
+    # (устройство, запуск, показания) кадра с верным CRC8; PayloadError,
+    # если он не расшифровался (уже учтено в payload_errors)
+    def read(self, frame):
+        if self._decoded[0] is frame:
+            return self._decoded[1:]
+        try:
+            return self._decode(frame)
+        except PayloadError as e:
+            self.payload_errors[e.reason] += 1
+            raise
+
+    def _decode(self, frame):
+        device, run, data = split_header(frame[:-1])
+        codec = self.keys.codec(device)
+        if self.latency is None:
+            return device, run, decode_payload(codec, data)
+        started = time.perf_counter()
+        plain = codec.decrypt_raw(data)
+        decrypted = time.perf_counter()
+        self.latency.record("decrypt", decrypted - started)
+        try:
+            return device, run, parse_payload(data, plain)
+        finally:
+            self.latency.record("parse", time.perf_counter() - decrypted)
+
+# ========== Запуски отправителей ==========
+# Потери и часы каждого запуска отправителя: свои для кадров с номером
+# устройства или запуска, общие — для кадров без заголовка. Новый номер
+# запуска начинает новую последовательность seq, поэтому перезапущенный
+# отправитель не считается серией повторов.
+class Links:
+    def __init__(self, clock_window=CLOCK_SYNC_WINDOW):
+        self.clock_window = clock_window
+        self.loss = LossTracker()
+        self.clock_sync = ClockSync(clock_window)
+        self.devices = {}         # (устройство, запуск) -> (LossTracker, ClockSync)
+        self.one_way = Histogram()  # задержка в одну сторону кадров с временем отправки
+
+    def link(self, device, run=None):
+        if device is None and run is None:
+            return self.loss, self.clock_sync
+        state = self.devices.get((device, run))
+        if state is None:
+            state = self.devices[device, run] = (LossTracker(), ClockSync(self.clock_window))
+        return state
+
+    # Все LossTracker — для сумм в метриках
+    def trackers(self):
+        return [self.loss] + [tracker for tracker, _ in list(self.devices.values())]
+
+    # Показания кадра, пришедшего в received_at: (показание, повтор,
+    # задержка в с или None). floor — время кадра в эфире: им заменяется
+    # наименьшая реальная задержка, которую поглощает смещение часов.
+    # skip_duplicates — повтор (ACK на него потерялся) отдаётся без учёта
+    # часов и задержки: показание уже сохранено.
+    def receive(self, device, run, readings, received_at, floor=0.0, skip_duplicates=False):
+        tracker, sync = self.link(device, run)
+        for reading in readings:
+            duplicate = reading.seq is not None and tracker.add(reading.seq) == DUPLICATE
+            delay = None
+            if reading.sent_at is not None and not (duplicate and skip_duplicates):
+                sync.add(reading.sent_at, received_at)
+                delay = sync.latency(reading.sent_at, received_at, floor)
+                self.one_way.record(max(delay, 0.0))
+            yield reading, duplicate, delay
+
+# ========== Раскладка строк ==========
+# <root>[/device=N]/<prefix>_run_R.csv: R — запуск отправителя, если кадр
+# нёс номер запуска, иначе собственный запуск приёмника; в таблице header
+# должны быть столбцы device и sender_run.
+class RowRouter:
+    def __init__(self, header, run_number, root="data/received", prefix="received"):
+        self.run_number = run_number
+        self.root = root
+        self.prefix = prefix
+        self._device = header.index("device")
+        self._run = header.index("sender_run")
+
+    def csv_path(self, run, device=None):
+        directory = self.root if device is None else f"{self.root}/device={device}"
+        return f"{directory}/{self.prefix}_run_{run}.csv"
+
+    def run(self, row):
+        run = row[self._run]
+        return self.run_number if run == "" else run
+
+    def path(self, row):
+        device = row[self._device]
+        return self.csv_path(self.run(row), None if device == "" else device)
@@ -0,0 +1,50 @@
+# ========================================
+# Файл: common/run_counter.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Выдача номеров запусков из файла-счётчика под блокировкой:
+#         O(1) вместо просмотра всех логов, без гонки двух процессов
+#   - EN: Run numbers from a lock-protected counter file: O(1) instead of
+#         listing every log, no race between two processes
+# ========================================
+
+import os
+import re
+
+try:
+    import fcntl
+    HAVE_FCNTL = True
+except ImportError:
+    HAVE_FCNTL = False   # Windows: без блокировки, как раньше
+
+COUNTER_FILE = "run_counter"
+_LOG_NAME = re.compile(r"^log_run_(\d+)\.txt$")
+
+# Последний номер по именам log_run_N.txt — только при первом запуске со
+# счётчиком (или если файл счётчика испорчен), чтобы нумерация продолжилась
+def _scan_logs(log_dir):
+    numbers = [int(m.group(1)) for m in map(_LOG_NAME.match, os.listdir(log_dir)) if m]
+    return max(numbers, default=0)
+
+# Следующий номер запуска. Счётчик читается и увеличивается под
+# исключительной блокировкой (flock): два процесса, стартующие вместе
+# (отправитель и приёмник на одной машине), получают разные номера.
+def next_run_number(log_dir="logs", name=COUNTER_FILE):
+    os.makedirs(log_dir, exist_ok=True)
+    fd = os.open(os.path.join(log_dir, name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if HAVE_FCNTL:
+            fcntl.flock(fd, fcntl.LOCK_EX)   # снимается при закрытии
+        try:
+            last = int(os.read(fd, 32).decode("ascii").strip())
+        except (UnicodeDecodeError, ValueError):
+            last = _scan_logs(log_dir)
+        number = last + 1
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{number}\n".encode("ascii"))
+        os.fsync(fd)
+        return number
+    finally:
+        os.close(fd)
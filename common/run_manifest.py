@@ -0,0 +1,96 @@
+# ========================================
+# Файл: common/run_manifest.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Состояние идущего запуска на диске (номер, начало, длительность,
+#         последний seq) для продолжения того же запуска после перезагрузки
+#   - EN: On-disk state of the running run (number, start, duration, last
+#         seq) so the same run resumes after a reboot
+# ========================================
+
+import json
+import os
+import time
+
+# Файл JSON, например logs/sender_manifest.json:
+#   run         — номер запуска
+#   started_at  — Unix-время начала
+#   duration    — заданная длительность, с
+#   updated_at  — время последней записи (нижняя граница прошедшего
+#                 времени, если часы после перезагрузки ушли назад)
+#   seq         — seq, с которого отправитель продолжит после сбоя: граница
+#                 занятого блока, больше любого уже отправленного
+#   resumes     — сколько раз запуск продолжался после сбоя
+#   finished    — запуск завершён штатно, следующий старт начнёт новый
+# Запись — во временный файл с fsync и переименование: после сбоя на диске
+# либо прежнее, либо новое содержимое целиком.
+class RunManifest:
+    def __init__(self, path):
+        self.path = path
+        self.state = None
+        self.writes = 0
+
+    # Незавершённый запуск, у которого ещё осталось время, или None
+    def resume(self, duration, now=None):
+        now = time.time() if now is None else now
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get("finished", True):
+            return None
+        if state.get("duration") != duration:
+            return None  # Другая длительность — уже другой эксперимент
+        self.state = state
+        if self.remaining(now) <= 0:
+            self.state = None
+            return None
+        state["resumes"] = state.get("resumes", 0) + 1
+        self._write(now)
+        return state
+
+    def start(self, run, duration, now=None, **fields):
+        now = time.time() if now is None else now
+        self.state = dict(run=run, started_at=now, duration=duration, updated_at=now, seq=0, resumes=0,
+                          finished=False, **fields)
+        self._write(now)
+        return self.state
+
+    # Секунд до конца запуска
+    def remaining(self, now=None):
+        now = time.time() if now is None else now
+        elapsed = max(now, self.state["updated_at"]) - self.state["started_at"]
+        return self.state["duration"] - elapsed
+
+    def update(self, now=None, **fields):
+        self.state.update(fields)
+        self._write(time.time() if now is None else now)
+
+    def finish(self, now=None):
+        self.update(now, finished=True)
+
+    def _write(self, now):
+        self.state["updated_at"] = max(now, self.state.get("updated_at", now))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.writes += 1
+        # Переименование на диске — вместе с записью каталога
+        try:
+            fd = os.open(directory or os.curdir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,278 @@
+# ========================================
+# Файл: common/run_writer.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: CSV и лог запуска, открытые один раз, со сбросом по политике
+#   - EN: Run CSV and log kept open for the whole run, flushed by policy
+# ========================================
+
+import csv
+import os
+import signal
+import time
+from collections import OrderedDict
+
+from common.latency import Histogram
+
+BUFFER_SIZE = 64 * 1024
+MAX_OPEN_PARTITIONS = 16   # открытых CSV разделов, кроме основного
+
+# ========== Оборванная последняя строка ==========
+# Сбой питания посреди записи оставляет в конце файла неполную строку (или
+# нули, если размер файла уже записан, а данные — нет). Она обрезается до
+# последнего перевода строки, чтобы продолженный запуск дописывал целые
+# строки. Возвращает число отрезанных байт.
+def truncate_torn_line(path, block=4096):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    if size == 0:
+        return 0
+    with open(path, "r+b") as f:
+        end = cut = size
+        while end > 0:
+            start = max(end - block, 0)
+            f.seek(start)
+            chunk = f.read(end - start)
+            stripped = chunk.rstrip(b"\x00")
+            if stripped:
+                if end == cut and stripped.endswith(b"\n") and len(stripped) == len(chunk):
+                    return 0  # Файл цел
+                newline = stripped.rfind(b"\n")
+                if newline >= 0:
+                    cut = start + newline + 1
+                    break
+            end = start
+        else:
+            cut = 0
+        f.truncate(cut)
+        f.flush()
+        os.fsync(f.fileno())
+    return size - cut
+
+# ========== Файлы запуска ==========
+# Политика сброса на диск (flush + fsync), срабатывает то, что раньше:
+#   flush_rows=1          — после каждой строки (как раньше в скриптах)
+#   flush_rows=N          — после N строк CSV/лога
+#   flush_interval=T      — не реже, чем раз в T секунд (проверяется при
+#                           записи и в maybe_flush())
+#   flush_rows=0, None    — только по flush()/close(), в т.ч. по сигналу
+#
+# Хранилище строк задают методы _open_rows/_write_row/_flush_rows/
+# _close_rows: здесь это CSV, в common/sqlite_store.py — SQLite.
+class RunWriter:
+    def __init__(self, csv_path, log_path, header, flush_rows=1, flush_interval=None, fsync=True):
+        self.csv_path = csv_path
+        self.log_path = log_path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        for path in (csv_path, log_path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self.rows = 0
+        self.lines = 0
+        self.bytes = 0                     # записано в CSV и лог (до сброса на диск)
+        self.flushes = 0
+        self.fsyncs = 0
+        self.fsync_latency = Histogram()   # время одного os.fsync, секунды
+        self.closed = False
+        self.truncated = truncate_torn_line(log_path)  # байт оборванных строк, отрезанных при открытии
+        self._open_rows(header)
+        self._log = open(log_path, "a", encoding="utf-8", buffering=BUFFER_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ========== Запись ==========
+    def write_row(self, row):
+        self.bytes += self._write_row(row)
+        self.rows += 1
+        self._written()
+
+    def write_line(self, line):
+        data = line + "\n"
+        self._log.write(data)
+        self.bytes += len(data.encode("utf-8"))
+        self.lines += 1
+        self._written()
+
+    def _written(self):
+        self._unflushed += 1
+        if self.flush_rows and self._unflushed >= self.flush_rows:
+            self.flush()
+        else:
+            self.maybe_flush()
+
+    # ========== Сброс на диск ==========
+    def maybe_flush(self):
+        if self.flush_interval is not None and self._unflushed and \
+                time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.closed:
+            return
+        self._flush_rows()
+        self._sync_file(self._log)
+        self.flushes += 1
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def _sync_file(self, f):
+        f.flush()
+        if self.fsync:
+            started = time.perf_counter()
+            os.fsync(f.fileno())
+            self.fsync_latency.record(time.perf_counter() - started)
+            self.fsyncs += 1
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.closed = True
+            self._close_rows()
+            self._log.close()
+
+    # ========== Строки в CSV ==========
+    def _open_rows(self, header):
+        self.truncated += truncate_torn_line(self.csv_path)
+        new_csv = not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0
+        self._csv = open(self.csv_path, "a", newline="", buffering=BUFFER_SIZE)
+        self._csv_writer = csv.writer(self._csv)
+        if new_csv:
+            self._csv_writer.writerow(header)
+
+    # Возвращает число записанных байт: CSV — ASCII, поэтому число
+    # символов от writerow() равно числу байт
+    def _write_row(self, row):
+        return self._csv_writer.writerow(row)
+
+    def _flush_rows(self):
+        self._sync_file(self._csv)
+
+    def _close_rows(self):
+        self._csv.close()
+
+    def stats(self):
+        return {
+            "rows": self.rows,
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "flushes": self.flushes,
+            "fsyncs": self.fsyncs,
+        }
+
+# ========== CSV по устройствам ==========
+# Строки раскладываются по нескольким CSV. partition — имя столбца
+# (номер устройства): строки с непустым значением пишутся в
+# <папка csv_path>/<столбец>=<значение>/<имя csv_path>, остальные — в сам
+# csv_path. Или функция строка -> путь CSV (None — csv_path). Файлы
+# открываются при первой строке и ищутся по пути в словаре; лог общий.
+#
+# Разделов может быть много (устройство x запуск отправителя за сутки),
+# поэтому открытыми держатся только max_open последних по записи: самый
+# давний при открытии нового сбрасывается на диск и закрывается, а
+# следующая его строка откроет файл заново на дозапись. csv_path открыт
+# всегда.
+class PartitionedRunWriter(RunWriter):
+    def __init__(self, csv_path, log_path, header, partition="device", flush_rows=1, flush_interval=None,
+                 fsync=True, max_open=MAX_OPEN_PARTITIONS):
+        if max_open < 1:
+            raise ValueError(f"max_open must be positive, got {max_open}")
+        self._partition = partition
+        self.max_open = max_open
+        super().__init__(csv_path, log_path, header, flush_rows, flush_interval, fsync)
+
+    def _open_rows(self, header):
+        self.header = list(header)
+        if not callable(self._partition):
+            self._index = self.header.index(self._partition)
+        super()._open_rows(header)
+        self._partitions = OrderedDict()  # путь -> (файл, csv.writer), давние первыми
+        self._paths = {self.csv_path: None}  # все пути, в которые писали, в порядке первого открытия
+        self._dirty = {self.csv_path}   # fsync только файлов, в которые писали после сброса
+
+    # Пути CSV запуска в порядке первого открытия (csv_path — первый),
+    # включая уже закрытые
+    @property
+    def paths(self):
+        return list(self._paths)
+
+    def partition_path(self, value):
+        directory, name = os.path.split(self.csv_path)
+        return os.path.join(directory, f"{self._partition}={value}", name)
+
+    def _row_path(self, row):
+        if callable(self._partition):
+            return self._partition(row) or self.csv_path
+        value = row[self._index]
+        return self.csv_path if value == '' or value is None else self.partition_path(value)
+
+    def _write_row(self, row):
+        path = self._row_path(row)
+        self._dirty.add(path)
+        if path == self.csv_path:
+            return self._csv_writer.writerow(row)
+        partition = self._partitions.get(path)
+        if partition is None:
+            partition = self._open_partition(path)
+        else:
+            self._partitions.move_to_end(path)
+        return partition[1].writerow(row)
+
+    def _open_partition(self, path):
+        if len(self._partitions) >= self.max_open:
+            self._evict()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.truncated += truncate_torn_line(path)
+        new_csv = not os.path.exists(path) or os.path.getsize(path) == 0
+        f = open(path, "a", newline="", buffering=BUFFER_SIZE)
+        partition = self._partitions[path] = (f, csv.writer(f))
+        self._paths[path] = None
+        if new_csv:
+            partition[1].writerow(self.header)
+        return partition
+
+    # Самый давний раздел: несброшенные строки — на диск, файл закрывается
+    def _evict(self):
+        path, (f, _) = self._partitions.popitem(last=False)
+        try:
+            if path in self._dirty:
+                self._dirty.discard(path)
+                self._sync_file(f)
+        finally:
+            f.close()
+
+    def _flush_rows(self):
+        for path in self._dirty:
+            self._sync_file(self._csv if path == self.csv_path else self._partitions[path][0])
+        self._dirty.clear()
+
+    def _close_rows(self):
+        self._csv.close()
+        for f, _ in self._partitions.values():
+            f.close()
+
+# ========== Завершение по сигналу ==========
+# SIGTERM (systemctl stop, shutdown) превращается в SystemExit, поэтому
+# блоки finally скриптов закрывают RunWriter и сбрасывают буферы на диск.
+def exit_on_signal(signums=(signal.SIGTERM,)):
+    def handler(signum, frame):
+        raise SystemExit(128 + signum)
+    for signum in signums:
+        signal.signal(signum, handler)
@@ -0,0 +1,88 @@
+# ========================================
+# Файл: common/scheduler.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Планировщик отправки по монотонным часам без накопления дрейфа
+#   - EN: Drift-free transmit scheduler on monotonic deadlines
+# ========================================
+
+import random
+import time
+
+SKIP = "skip"           # Опоздали больше чем на интервал — пропущенные такты отбрасываются
+CATCH_UP = "catch_up"   # ...или выполняются подряд без ожидания
+POLICIES = (SKIP, CATCH_UP)
+
+# ========== Планировщик ==========
+# Такт k наступает в start + k * interval (+ случайный сдвиг до dither
+# секунд, если задан). Срок считается от старта, а не от конца прошлого
+# такта, поэтому время работы цикла (шифрование, fsync, запись в UART) не
+# накапливается: за 24 ч при интервале 30 с будет ровно 2880 тактов.
+#
+# jitter — на сколько секунд такт запущен позже своего срока (с учётом dither).
+# clock и sleep подменяются для ускоренного времени в симуляции.
+class TickScheduler:
+    def __init__(self, interval, policy=SKIP, dither=0.0, clock=None, sleep=None):
+        if interval <= 0:
+            raise ValueError(f"interval must be positive, got {interval}")
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy {policy!r}, expected one of {POLICIES}")
+        if not 0 <= dither < interval:
+            raise ValueError(f"dither must be in [0, {interval}), got {dither}")
+        self.interval = interval
+        self.policy = policy
+        self.dither = dither
+        # Функции времени берутся при создании, а не при импорте модуля
+        self.clock = clock or time.monotonic
+        self.sleep = sleep or time.sleep
+        self.start = None
+        self.next_tick = 0       # номер следующего такта
+        self.ticks = 0           # выполненных тактов
+        self.skipped = 0         # пропущенных по политике SKIP
+        self.late = 0            # тактов, запущенных позже следующего срока
+        self.last_jitter = 0.0
+        self.max_jitter = 0.0
+        self._jitter_sum = 0.0
+
+    def deadline(self, tick):
+        return self.start + tick * self.interval
+
+    # Ждёт срока следующего такта и возвращает его номер. Первый вызов
+    # запускает отсчёт, такт 0 выполняется сразу.
+    def wait(self):
+        if self.start is None:
+            self.start = self.clock()
+        tick = self.next_tick
+        now = self.clock()
+        # Срок следующего такта уже прошёл — этот такт опоздал на интервал
+        overdue = int((now - self.deadline(tick)) // self.interval)
+        if overdue > 0:
+            self.late += 1
+            if self.policy == SKIP:
+                self.skipped += overdue
+                tick += overdue
+        target = self.deadline(tick)
+        if self.dither:
+            target += random.uniform(0, self.dither)
+        delay = target - now
+        if delay > 0:
+            self.sleep(delay)
+        jitter = max(0.0, self.clock() - target)
+        self.last_jitter = jitter
+        self._jitter_sum += jitter
+        if jitter > self.max_jitter:
+            self.max_jitter = jitter
+        self.ticks += 1
+        self.next_tick = tick + 1
+        return tick
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "skipped": self.skipped,
+            "late": self.late,
+            "jitter_last_ms": round(self.last_jitter * 1000, 3),
+            "jitter_mean_ms": round(self._jitter_sum / self.ticks * 1000, 3) if self.ticks else 0.0,
+            "jitter_max_ms": round(self.max_jitter * 1000, 3),
+        }
@@ -0,0 +1,178 @@
+# ========================================
+# Файл: common/spool.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Кольцевой буфер кадров на диске (mmap, записи фиксированного
+#         размера) для отправителя: неотправленные и неподтверждённые
+#         кадры переживают перезагрузку и досылаются позже
+#   - EN: On-disk ring spool of frames (mmap, fixed-size records) for the
+#         sender: unsent and unacknowledged frames survive a reboot and are
+#         sent later
+# ========================================
+
+import mmap
+import os
+import struct
+
+# Файл: заголовок, затем capacity записей по record_size байт.
+#   заголовок  4s  "SPL1"
+#              I   capacity — записей в кольце
+#              I   record_size
+#              Q   head — номер самой старой записи (растёт без конца,
+#                  место в файле — номер % capacity)
+#              Q   tail — номер следующей записи
+#              I   next_seq — seq после последнего показания в буфере
+#   запись     B   состояние: 0 — свободна (кадр доставлен), 1 — ждёт
+#              I   seq первого показания в кадре
+#              H   показаний в кадре
+#              H   длина кадра
+#              ... кадр
+# При sync=True запись сбрасывается на диск (msync своих страниц) раньше,
+# чем заголовок с новым tail: после сбоя посреди записи кадр просто не
+# виден. Удалённые из середины записи освобождаются на месте, head
+# проходит по свободным.
+SPOOL_MAGIC = b"SPL1"
+HEADER = struct.Struct(">4sIIQQI")
+HEADER_SIZE = 64
+RECORD = struct.Struct(">BIHH")
+MAX_FRAME = 240          # Пакет E22 — не больше 240 байт
+
+_FREE = 0
+_PENDING = 1
+
+class Spool:
+    def __init__(self, path, capacity=2880, frame_size=MAX_FRAME, sync=True):
+        if capacity < 1:
+            raise ValueError(f"spool capacity must be positive, got {capacity}")
+        self.path = path
+        self.sync = sync
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a+b")
+        self._map = None
+        self.dropped = 0      # Кадров, вытесненных новыми при заполненном буфере
+        self._open(capacity, RECORD.size + frame_size)
+
+    def _open(self, capacity, record_size):
+        size = os.fstat(self._file.fileno()).st_size
+        header = None
+        if size >= HEADER_SIZE:
+            self._file.seek(0)
+            header = HEADER.unpack(self._file.read(HEADER.size))
+            if header[0] != SPOOL_MAGIC or size < HEADER_SIZE + header[1] * header[2]:
+                header = None
+        # Пустой буфер пересоздаётся под новые параметры (next_seq
+        # сохраняется), непустой сохраняет свои
+        if header is None or (header[4] == header[3] and header[1:3] != (capacity, record_size)):
+            next_seq = header[5] if header is not None else 0
+            self._file.truncate(0)
+            self._file.write(bytes(HEADER_SIZE + capacity * record_size))
+            self._file.flush()
+            header = (SPOOL_MAGIC, capacity, record_size, 0, 0, next_seq)
+        _, self.capacity, self.record_size, self._head, self._tail, self.next_seq = header
+        self._map = mmap.mmap(self._file.fileno(), HEADER_SIZE + self.capacity * self.record_size)
+        self._write_header()
+        # seq -> номер записи; строится один раз, дальше поиск по словарю
+        self._index = {}
+        for number in range(self._head, self._tail):
+            state, seq, _, _ = RECORD.unpack_from(self._map, self._offset(number))
+            if state == _PENDING:
+                self._index[seq] = number
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, seq):
+        return seq in self._index
+
+    def _offset(self, number):
+        return HEADER_SIZE + (number % self.capacity) * self.record_size
+
+    def _write_header(self):
+        HEADER.pack_into(self._map, 0, SPOOL_MAGIC, self.capacity, self.record_size,
+                         self._head, self._tail, self.next_seq)
+
+    # msync только страниц [offset, offset + size): начало — по границе страницы
+    def _flush(self, offset, size):
+        if self.sync:
+            start = offset - offset % mmap.PAGESIZE
+            self._map.flush(start, offset + size - start)
+
+    # ========== Запись и удаление ==========
+    # Кадр frame (показания seq..seq+count-1). При заполненном буфере
+    # вытесняется самый старый кадр (новые данные важнее); возвращает
+    # его seq или None.
+    def push(self, seq, count, frame):
+        if len(frame) > self.record_size - RECORD.size:
+            raise ValueError(f"{len(frame)}-byte frame does not fit a {self.record_size}-byte spool record")
+        if seq in self._index:
+            self.remove(seq)
+        dropped = None
+        if self._tail - self._head >= self.capacity:
+            state, dropped, _, _ = RECORD.unpack_from(self._map, self._offset(self._head))
+            if state == _PENDING:
+                del self._index[dropped]
+                self.dropped += 1
+            else:
+                dropped = None
+            self._head += 1
+            self._skip_free()
+        offset = self._offset(self._tail)
+        RECORD.pack_into(self._map, offset, _PENDING, seq, count, len(frame))
+        self._map[offset + RECORD.size:offset + RECORD.size + len(frame)] = frame
+        self._flush(offset, RECORD.size + len(frame))
+        self._index[seq] = self._tail
+        self._tail += 1
+        self.next_seq = max(self.next_seq, seq + count)
+        self._write_header()
+        self._flush(0, HEADER.size)
+        return dropped
+
+    # Кадр доставлен (или подтверждён); False — его нет в буфере
+    def remove(self, seq):
+        number = self._index.pop(seq, None)
+        if number is None:
+            return False
+        offset = self._offset(number)
+        self._map[offset] = _FREE
+        self._skip_free()
+        self._write_header()
+        self._flush(offset, 1)
+        self._flush(0, HEADER.size)
+        return True
+
+    def _skip_free(self):
+        while self._head < self._tail and self._map[self._offset(self._head)] == _FREE:
+            self._head += 1
+
+    # ========== Чтение ==========
+    # (seq, count, frame) от старых к новым: словарь хранит записи в
+    # порядке добавления. Обход ленивый — буфер во время него не меняется.
+    def __iter__(self):
+        for number in self._index.values():
+            offset = self._offset(number)
+            _, seq, count, length = RECORD.unpack_from(self._map, offset)
+            yield seq, count, bytes(self._map[offset + RECORD.size:offset + RECORD.size + length])
+
+    def stats(self):
+        return {
+            "pending": len(self._index),
+            "capacity": self.capacity,
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
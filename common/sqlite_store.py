@@ -0,0 +1,212 @@
+# ========================================
+# Файл: common/sqlite_store.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Хранение строк запусков в SQLite (WAL, пакетные транзакции,
+#         индексы по запуску/seq/времени), выгрузка в CSV, PDR за час
+#   - EN: SQLite storage for run rows (WAL, batched transactions, indexes
+#         on run/seq/time), CSV export and per-hour PDR
+# ========================================
+
+import csv
+import os
+import sqlite3
+import time
+
+from common.run_writer import RunWriter
+
+TABLE = "readings"
+
+# Тип столбцов по имени; остальные — INTEGER (показания). BOOLEAN в
+# SQLite — целое 0/1, при выгрузке снова True/False, как в CSV.
+COLUMN_TYPES = {
+    "timestamp": "TEXT",
+    "crc_ok": "BOOLEAN",
+    "sent_at": "REAL",
+    "received_at": "REAL",
+    "latency_ms": "REAL",
+}
+
+# Время, по которому строится индекс и считаются часы запуска:
+# приём на приёмнике, отправка на отправителе
+TIME_COLUMNS = ("received_at", "sent_at")
+
+# ========== Запись ==========
+# Тот же интерфейс и политика сброса, что у RunWriter (в т.ч. с
+# WriterThread), но строки копятся в памяти и уходят одной транзакцией
+# при сбросе: flush_rows=20 — одна транзакция (и один fsync WAL) на 20
+# строк. Лог запуска остаётся текстовым файлом.
+#
+# Одна база на все запуски; run — номер запуска, первый столбец таблицы,
+# или функция строка -> номер (приёмник берёт запуск отправителя из
+# заголовка кадра). Столбцы, которых нет в существующей базе (новая версия
+# скрипта), добавляются ALTER TABLE.
+class SqliteWriter(RunWriter):
+    def __init__(self, db_path, log_path, header, run, flush_rows=1, flush_interval=None, fsync=True):
+        self.run = run
+        super().__init__(db_path, log_path, header, flush_rows, flush_interval, fsync)
+
+    def _open_rows(self, header):
+        self.header = list(header)
+        # Соединение создаётся в главном потоке, а пишет в него поток записи
+        # (по одному за раз) — отсюда check_same_thread=False
+        self._db = connect(self.csv_path, check_same_thread=False)
+        self._db.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+        create_table(self._db, self.header)
+        columns = ", ".join(["run"] + [_quote(c) for c in self.header])
+        marks = ", ".join("?" * (len(self.header) + 1))
+        self._insert = f"INSERT INTO {TABLE} ({columns}) VALUES ({marks})"
+        self._pending = []
+
+    # Пустые поля CSV ('') хранятся как NULL; размер — как у строки CSV
+    def _write_row(self, row):
+        if len(row) != len(self.header):
+            raise ValueError(f"row has {len(row)} fields, header has {len(self.header)}")
+        run = self.run(row) if callable(self.run) else self.run
+        self._pending.append([run] + [None if value == '' else value for value in row])
+        return sum(len(str(value)) for value in row) + len(row)
+
+    def _flush_rows(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        started = time.perf_counter()
+        try:
+            self._db.execute("BEGIN")
+            self._db.executemany(self._insert, rows)
+            self._db.execute("COMMIT")
+        except sqlite3.Error:
+            if self._db.in_transaction:
+                self._db.execute("ROLLBACK")
+            raise
+        if self.fsync:
+            self.fsync_latency.record(time.perf_counter() - started)
+            self.fsyncs += 1
+
+    def _close_rows(self):
+        self._db.close()
+
+# ========== База ==========
+# isolation_level=None: транзакции открываются явно (BEGIN/COMMIT)
+def connect(db_path, **kwargs):
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(db_path, isolation_level=None, **kwargs)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def columns(db):
+    return [row[1] for row in db.execute(f"PRAGMA table_info({TABLE})")]
+
+def create_table(db, header):
+    definition = ", ".join(f"{_quote(c)} {COLUMN_TYPES.get(c, 'INTEGER')}" for c in header)
+    db.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (run INTEGER NOT NULL, {definition})")
+    existing = set(columns(db))
+    for column in header:
+        if column not in existing:
+            db.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_quote(column)} {COLUMN_TYPES.get(column, 'INTEGER')}")
+    # Поиск строки запуска по seq/packet_id, выборка часа запуска и строк
+    # одного устройства или запуска отправителя — по индексу
+    for column in ("seq", "packet_id", "device", "sender_run") + TIME_COLUMNS:
+        if column in header:
+            db.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_run_{column} ON {TABLE} (run, {_quote(column)})")
+
+def time_column(db):
+    present = columns(db)
+    return next((c for c in TIME_COLUMNS if c in present), None)
+
+# ========== Запросы ==========
+def runs(db):
+    return [row[0] for row in db.execute(f"SELECT DISTINCT run FROM {TABLE} ORDER BY run")]
+
+# Строки запуска в порядке вставки, в формате CSV скриптов
+def export_csv(db, run, path, where="", params=()):
+    header = [c for c in columns(db) if c != "run"]
+    booleans = {i for i, c in enumerate(header) if COLUMN_TYPES.get(c) == "BOOLEAN"}
+    cursor = db.execute(f"SELECT {', '.join(_quote(c) for c in header)} FROM {TABLE} "
+                        f"WHERE run = ?{where} ORDER BY rowid", (run, *params))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for row in cursor:
+            writer.writerow(['' if value is None else bool(value) if i in booleans else value
+                             for i, value in enumerate(row)])
+            count += 1
+    return count
+
+# Запуск run в раскладке CSV приёмника: строки устройства N — в
+# <directory>/device=N/<prefix>_run_<run>.csv, без номера — в
+# <directory>/<prefix>_run_<run>.csv (файл без строк не создаётся, если
+# есть строки устройств). Возвращает [(путь, строк)].
+def export_run(db, run, directory, prefix):
+    name = f"{prefix}_run_{run}.csv"
+    path = os.path.join(directory, name)
+    if "device" not in columns(db):
+        return [(path, export_csv(db, run, path))]
+    devices = [row[0] for row in db.execute(
+        f"SELECT DISTINCT device FROM {TABLE} WHERE run = ? AND device IS NOT NULL ORDER BY device", (run,))]
+    exported = []
+    unaddressed = db.execute(f"SELECT 1 FROM {TABLE} WHERE run = ? AND device IS NULL LIMIT 1", (run,)).fetchone()
+    if unaddressed is not None or not devices:
+        exported.append((path, export_csv(db, run, path, " AND device IS NULL")))
+    for device in devices:
+        path = os.path.join(directory, f"device={device}", name)
+        exported.append((path, export_csv(db, run, path, " AND device = ?", (device,))))
+    return exported
+
+# PDR за час hour запуска run (от первой строки запуска): принятые
+# различные seq против ожидаемых. Ожидаемые — от seq, следующего за
+# наибольшим принятым до этого часа, до наибольшего за час: пропуск на
+# границе часов относится к часу, в котором связь восстановилась, а не
+# теряется между ними. Строк раньше нет (начало запуска) — от наименьшего
+# seq за час; потери в самом конце запуска без данных отправителя не видны.
+# Все выборки идут по индексу (run, время) — без просмотра всей таблицы.
+# У каждого отправителя свои seq, поэтому считаются только строки одного
+# устройства и запуска отправителя: device, sender_run — как в заголовке
+# кадра, None — кадры без них (как у LossTracker приёмника).
+def hour_pdr(db, run, hour, device=None, sender_run=None):
+    column = time_column(db)
+    if column is None:
+        raise ValueError("the table has no time column to split a run into hours")
+    column = _quote(column)
+    start = db.execute(f"SELECT MIN({column}) FROM {TABLE} WHERE run = ?", (run,)).fetchone()[0]
+    if start is None:
+        return None
+    low = start + hour * 3600
+    where, params = sender_filter(db, device, sender_run)
+    before = db.execute(f"SELECT MAX(seq) FROM {TABLE} WHERE run = ? AND {column} < ?{where}",
+                        (run, low, *params)).fetchone()[0]
+    # Опоздавшие seq, уже ожидавшиеся в прошлых часах, здесь не считаются
+    received, first, last = db.execute(
+        f"SELECT COUNT(DISTINCT seq), MIN(seq), MAX(seq) FROM {TABLE} "
+        f"WHERE run = ? AND {column} >= ? AND {column} < ? AND seq > ?{where}",
+        (run, low, low + 3600, -1 if before is None else before, *params)).fetchone()
+    if before is not None:
+        first = before + 1
+    expected = 0 if last is None else last - first + 1
+    return {
+        "run": run,
+        "hour": hour,
+        "device": device,
+        "sender_run": sender_run,
+        "received": received,
+        "expected": expected,
+        "pdr": round(received / expected, 4) if expected else 0.0,
+    }
+
+# Условие " AND ..." на строки одного отправителя; IS сравнивает и NULL.
+# Столбца нет в базе (база отправителя, прежняя версия) — условия на него нет.
+def sender_filter(db, device=None, sender_run=None):
+    present = columns(db)
+    conditions = [(name, value) for name, value in (("device", device), ("sender_run", sender_run))
+                  if name in present]
+    return "".join(f" AND {_quote(name)} IS ?" for name, _ in conditions), [value for _, value in conditions]
@@ -0,0 +1,118 @@
+# ========================================
+# Файл: common/writer_thread.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Запись CSV и логов в отдельном потоке через ограниченную очередь
+#   - EN: CSV and log writing on a dedicated thread behind a bounded queue
+# ========================================
+
+import queue
+import threading
+import time
+
+QUEUE_SIZE = 1000       # Записей в очереди, после чего новые отбрасываются
+BATCH_SIZE = 20         # fsync после стольких записей...
+FLUSH_INTERVAL = 60     # ...или не реже, чем раз в столько секунд
+
+_STOP = object()
+
+# ========== Поток записи ==========
+# Поток чтения UART только кладёт записи в очередь (put_nowait не блокирует).
+# Поток записи передаёт их в RunWriter и делает групповой fsync: один на
+# BATCH_SIZE записей или на FLUSH_INTERVAL секунд, что наступит раньше.
+# Если очередь полна, запись отбрасывается и учитывается в dropped.
+# RunWriter должен быть создан с ручной политикой (flush_rows=0), а
+# закрывает его владелец после close() потока.
+class WriterThread:
+    def __init__(self, run_writer, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, on_error=None):
+        self.run_writer = run_writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    # ========== Вызовы из потока UART ==========
+    def write_row(self, row):
+        return self._put((self.run_writer.write_row, row))
+
+    def write_line(self, line):
+        return self._put((self.run_writer.write_line, line))
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "written": self.written,
+            "dropped": self.dropped,
+            "fsyncs": self.run_writer.fsyncs,
+            "errors": self.errors,
+        }
+
+    def close(self, timeout=None):
+        # Стоп-метка ставится блокирующе: всё, что уже в очереди, будет записано
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    # ========== Поток записи ==========
+    def _run(self):
+        while True:
+            timeout = max(0.0, self._last_sync + self.flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._sync()
+                continue
+            if item is _STOP:
+                break
+            write, payload = item
+            try:
+                write(payload)
+                self._pending += 1
+                self.written += 1
+            except Exception as e:
+                self._error(e)
+            if self._pending >= self.batch_size or \
+                    time.monotonic() - self._last_sync >= self.flush_interval:
+                self._sync()
+        self._sync()
+
+    def _sync(self):
+        if self._pending:
+            try:
+                self.run_writer.flush()
+            except Exception as e:
+                self._error(e)
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _error(self, exc):
+        self.errors += 1
+        if self.on_error is not None:
+            self.on_error(exc)
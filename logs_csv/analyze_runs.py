@@ -0,0 +1,104 @@
+# ========================================
+# Файл: analyze_runs.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Сопоставление sent/received CSV всех запусков и статистика канала
+#         (вместо ручной сборки combined_data.xlsx)
+#   - EN: Merge sent/received CSV of all runs and compute link statistics
+#         (replaces the manual combined_data.xlsx step)
+# ========================================
+#
+# Пример:
+#   python logs_csv/analyze_runs.py experimental_results_logs_csv --out analysis
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.link_stats import (MERGED_COLUMNS, distance_stats, find_runs, hourly_stats,
+                               merge_run, run_stats, write_table)
+
+TEXT = {
+    'rus': {
+        'title': "=== Статистика канала по запускам ===",
+        'no_runs': "Пары sent_run_*.csv / received_run_*.csv не найдены в {}",
+        'header': "{:<40} {:>6} {:>7} {:>6} {:>8} {:>7} {:>9} {:>10}",
+        'columns': ("Запуск", "Дист.", "Отпр.", "Дост.", "PDR", "Серий", "Макс.сер.", "Задержка"),
+        'distance': "Расстояние {}: запусков {}, PDR {:.2%} ({} из {})",
+        'no_distance': "—",
+        'written': "Записано: {}",
+        'done': "Готово за {:.2f} с: запусков {}, пакетов {}",
+    },
+    'eng': {
+        'title': "=== Link statistics per run ===",
+        'no_runs': "No sent_run_*.csv / received_run_*.csv pairs found in {}",
+        'header': "{:<40} {:>6} {:>7} {:>6} {:>8} {:>7} {:>9} {:>10}",
+        'columns': ("Run", "Dist.", "Sent", "Recv", "PDR", "Bursts", "Max burst", "Latency"),
+        'distance': "Distance {}: {} runs, PDR {:.2%} ({} of {})",
+        'no_distance': "—",
+        'written': "Written: {}",
+        'done': "Done in {:.2f} s: {} runs, {} packets",
+    }
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Merge sent/received CSV and compute link statistics")
+    parser.add_argument("root", nargs="?", default="experimental_results_logs_csv",
+                        help="directory searched recursively for sent_run_*.csv")
+    parser.add_argument("--out", default="analysis", help="output directory")
+    parser.add_argument("--lang", choices=("rus", "eng"), default="rus")
+    return parser.parse_args()
+
+def print_run(T, stats):
+    distance = '' if stats['distance_m'] is None else f"{stats['distance_m']}m"
+    # Медиана latency_ms приёмника; разность отметок двух часов — не задержка
+    latency = '' if stats['latency_p50_s'] is None else f"{stats['latency_p50_s'] * 1000:.0f} ms"
+    print(T['header'].format(stats['run'], distance, stats['sent'], stats['delivered'],
+                             f"{stats['pdr']:.2%}", stats['bursts'], stats['max_burst'], latency))
+
+# ========== Запуск ==========
+def main():
+    args = parse_args()
+    T = TEXT[args.lang]
+    started = time.perf_counter()
+    print(T['title'])
+
+    runs = find_runs(args.root)
+    if not runs:
+        print(T['no_runs'].format(args.root))
+        return 1
+
+    merged_all, all_stats, hourly_all = [], [], []
+    print(T['header'].format(*T['columns']))
+    for run in runs:
+        merged = merge_run(run)
+        if not merged:
+            continue
+        stats = run_stats(merged)
+        print_run(T, stats)
+        merged_all.extend(merged)
+        all_stats.append(stats)
+        hourly_all.extend(hourly_stats(merged))
+
+    print()
+    per_distance = distance_stats(all_stats)
+    for entry in per_distance:
+        distance = T['no_distance'] if entry['distance_m'] is None else f"{entry['distance_m']}m"
+        print(T['distance'].format(distance, entry['runs'], entry['pdr'], entry['delivered'], entry['sent']))
+
+    os.makedirs(args.out, exist_ok=True)
+    print()
+    for rows, name, columns in ((merged_all, "merged", MERGED_COLUMNS),
+                                (all_stats, "runs", None),
+                                (per_distance, "distances", None),
+                                (hourly_all, "hourly", None)):
+        print(T['written'].format(write_table(rows, os.path.join(args.out, name), columns)))
+
+    print(T['done'].format(time.perf_counter() - started, len(all_stats), len(merged_all)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
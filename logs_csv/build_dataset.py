@@ -0,0 +1,86 @@
+# ========================================
+# Файл: build_dataset.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Сборка всех sent_run_*/received_run_* CSV в столбцовый набор
+#         (Parquet при наличии pyarrow, иначе .npz), по расстоянию и запуску;
+#         повторный запуск дописывает только новые и изменившиеся запуски
+#   - EN: Build a columnar dataset (Parquet with pyarrow, else .npz) of all
+#         sent_run_*/received_run_* CSV, partitioned by distance and run;
+#         reruns only convert new or changed runs
+# ========================================
+#
+# Пример:
+#   python logs_csv/build_dataset.py experimental_results_logs_csv --out dataset
+#
+# Загрузка в анализе:
+#   from common.dataset import load
+#   received = load("dataset", "received")
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.dataset import HAVE_NUMPY, HAVE_PYARROW, ROLES, build, load
+
+TEXT = {
+    'rus': {
+        'title': "=== Сборка столбцового набора ({}) ===",
+        'no_numpy': "Нужен NumPy: pip install numpy",
+        'converted': "Собрано: {}",
+        'summary': "Файлов собрано: {}, без изменений: {}, строк: {}, пропущено испорченных строк: {}",
+        'loaded': "Загрузка {}: {} строк за {:.3f} с",
+        'done': "Готово за {:.2f} с",
+    },
+    'eng': {
+        'title': "=== Building the columnar dataset ({}) ===",
+        'no_numpy': "NumPy is required: pip install numpy",
+        'converted': "Converted: {}",
+        'summary': "Files converted: {}, unchanged: {}, rows: {}, skipped torn rows: {}",
+        'loaded': "Load {}: {} rows in {:.3f} s",
+        'done': "Done in {:.2f} s",
+    }
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compact run CSVs into a partitioned columnar dataset")
+    parser.add_argument("root", nargs="?", default="experimental_results_logs_csv",
+                        help="directory searched recursively for sent_run_*/received_run_*.csv")
+    parser.add_argument("--out", default="dataset", help="dataset directory")
+    parser.add_argument("--full", action="store_true", help="rebuild everything instead of only new runs")
+    parser.add_argument("--lang", choices=("rus", "eng"), default="rus")
+    return parser.parse_args()
+
+# ========== Запуск ==========
+def main():
+    args = parse_args()
+    T = TEXT[args.lang]
+    if not HAVE_NUMPY:
+        print(T['no_numpy'])
+        return 1
+    started = time.perf_counter()
+    print(T['title'].format("Parquet" if HAVE_PYARROW else "npz"))
+
+    result = build(args.root, args.out, args.full)
+    for key in result['converted']:
+        print(T['converted'].format(key))
+    print(T['summary'].format(len(result['converted']), result['unchanged'],
+                              result['rows'], result['skipped_rows']))
+
+    # Проверка набора: сколько строк и как быстро читается каждая роль
+    for role in ROLES:
+        if not os.path.isdir(os.path.join(args.out, role)):
+            continue
+        load_started = time.perf_counter()
+        data = load(args.out, role)
+        rows = data.num_rows if HAVE_PYARROW else len(data['packet_id'])
+        print(T['loaded'].format(role, rows, time.perf_counter() - load_started))
+
+    print(T['done'].format(time.perf_counter() - started))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
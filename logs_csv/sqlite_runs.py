@@ -0,0 +1,100 @@
+# ========================================
+# Файл: sqlite_runs.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - RU: Выгрузка запусков из базы SQLite (STORAGE = "sqlite") в прежние
+#         CSV *_run_N.csv и PDR за час запуска по индексу
+#   - EN: Export runs from the SQLite database (STORAGE = "sqlite") to the
+#         usual *_run_N.csv files and indexed per-hour PDR
+# ========================================
+#
+# Примеры:
+#   python logs_csv/sqlite_runs.py export data/received/received.sqlite3 --out data/received
+#   python logs_csv/sqlite_runs.py pdr data/received/received.sqlite3 --run 1 --hour 13
+#   python logs_csv/sqlite_runs.py pdr data/received/received.sqlite3 --run 1 --hour 13 --device 3 --sender-run 7
+
+import argparse
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.sqlite_store import export_run, hour_pdr, runs
+
+TEXT = {
+    'rus': {
+        'no_db': "База {} не найдена",
+        'no_runs': "В базе {} нет запусков",
+        'exported': "Запуск {}: {} строк -> {}",
+        'no_run': "Запуска {} нет в базе",
+        'pdr': "Запуск {run}, час {hour}: PDR {pdr:.2%} ({received} из {expected})",
+        'db_error': "Ошибка базы {}: {}",
+    },
+    'eng': {
+        'no_db': "Database {} not found",
+        'no_runs': "No runs in database {}",
+        'exported': "Run {}: {} rows -> {}",
+        'no_run': "Run {} is not in the database",
+        'pdr': "Run {run}, hour {hour}: PDR {pdr:.2%} ({received} of {expected})",
+        'db_error': "Database error {}: {}",
+    }
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export runs from the SQLite storage or query per-hour PDR")
+    parser.add_argument("--lang", choices=("rus", "eng"), default="rus")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write each run to <prefix>_run_N.csv (device=D/ per device)")
+    export.add_argument("db")
+    export.add_argument("--out", default=".", help="output directory")
+    export.add_argument("--run", type=int, action="append", help="run number (repeatable; default: all)")
+    export.add_argument("--prefix", help="file prefix (default: database name, e.g. received)")
+    pdr = commands.add_parser("pdr", help="PDR of one hour of a run")
+    pdr.add_argument("db")
+    pdr.add_argument("--run", type=int, required=True)
+    pdr.add_argument("--hour", type=int, required=True, help="hour from the run start, 0-based")
+    pdr.add_argument("--device", type=int, default=None, help="device ID of the sender (default: frames without one)")
+    pdr.add_argument("--sender-run", type=int, default=None,
+                     help="run ID of the sender (default: frames without one)")
+    return parser.parse_args()
+
+def export(T, db, args):
+    numbers = args.run or runs(db)
+    if not numbers:
+        print(T['no_runs'].format(args.db))
+        return 1
+    prefix = args.prefix or os.path.splitext(os.path.basename(args.db))[0]
+    os.makedirs(args.out, exist_ok=True)
+    for run in numbers:
+        for path, count in export_run(db, run, args.out, prefix):
+            print(T['exported'].format(run, count, path))
+    return 0
+
+def pdr(T, db, args):
+    result = hour_pdr(db, args.run, args.hour, args.device, args.sender_run)
+    if result is None:
+        print(T['no_run'].format(args.run))
+        return 1
+    print(T['pdr'].format(**result))
+    return 0
+
+# ========== Запуск ==========
+def main():
+    args = parse_args()
+    T = TEXT[args.lang]
+    if not os.path.exists(args.db):
+        print(T['no_db'].format(args.db))
+        return 1
+    # Только чтение: можно запускать, пока скрипт 24h пишет в базу (WAL)
+    db = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    try:
+        return export(T, db, args) if args.command == "export" else pdr(T, db, args)
+    except (sqlite3.Error, ValueError) as e:
+        print(T['db_error'].format(args.db, e))
+        return 1
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,437 @@
+# autostart_gateway_24h.py
+#
+# Gateway receiver: several E22 modules (one per channel) served by one
+# process. Every port is watched by a single asyncio event loop through
+# its file descriptor (loop.add_reader, POSIX), so an idle port costs
+# nothing and no thread waits on a read timeout. Each port has its own
+# frame decoder, loss and clock statistics; all readings go to one shared
+# writer, tagged with the port and channel they came from (and the device
+# ID and run ID of senders that put them in their frames). Frames are
+# checked, decoded and tracked by the same common/receive.py code as in
+# the 24h receiver.
+
+import asyncio
+import sys
+import os
+import time
+import serial
+from datetime import datetime
+
+# ========== Shared Modules ==========
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.airtime import DutyCycle, lora_airtime, transit_time
+from common.arq import ACK_BITS, ACK_SIZE, AckScheduler, pack_ack
+from common.devices import KeyTable, addressed_sizes
+from common.fec import ReedSolomon
+from common.framing import FrameDecoder
+from common.latency import Histogram
+from common.metrics import MetricsServer, add_run_writer_metrics, age
+from common.payload import AGGREGATE_FRAME_SIZES, PayloadError
+from common.receive import PAYLOAD_ERRORS, FrameReader, Links, RowRouter
+from common.run_counter import next_run_number
+from common.run_manifest import RunManifest
+from common.run_writer import PartitionedRunWriter, exit_on_signal
+from common.sqlite_store import SqliteWriter
+from common.writer_thread import WriterThread
+
+# ========== Configuration ==========
+# One entry per E22 module; "channel" is the module's configured channel,
+# stored with every row so the runs of different links can be told apart
+PORTS = [
+    {"port": "/dev/ttyUSB0", "channel": 18},
+    {"port": "/dev/ttyUSB1", "channel": 23},
+]
+BAUDRATE = 9600
+AES_KEY = "cat".ljust(16)[:16].encode()
+KEY_TABLE = None          # JSON {"device ID": "key", ...}; frames without a device ID and unlisted devices use AES_KEY
+RECEIVE_DURATION = 86400  # 24 hours in seconds
+START_DELAY = 1           # Delay before starting in seconds
+DEBUG = False
+FLUSH_INTERVAL = 60       # Stats and fsync at least this often (seconds)
+WRITER_QUEUE_SIZE = 1000  # Records waiting for the writer thread before new ones are dropped
+WRITER_BATCH = 20         # One fsync per this many records (or per FLUSH_INTERVAL)
+READ_PAUSE = 1.0          # Silence on a port this long ends a partial frame (the 24h receiver's read timeout)
+REOPEN_INTERVAL = 10      # Seconds between attempts to reopen a port that failed or was unplugged
+CLOCK_SYNC_WINDOW = 600   # Seconds per lower-envelope point of each sender's clock fit
+LORA_PARAMS = {'sf': 9, 'bw': 125000, 'cr': 1, 'preamble': 8}  # E22 air rate, for the transit floor
+FEC_PARITY = 0            # Reed-Solomon parity bytes per frame, same as the senders'
+ARQ = False               # Acknowledge frames on the port they came from so senders (ARQ = True) retransmit lost ones
+DUTY_CYCLE = 0.1          # Share of airtime each module's ACKs may use: 10% at 433 MHz, 1% in most of the 868 MHz band
+DUTY_WINDOW = 3600        # ...over a sliding window of this many seconds
+STORAGE = "csv"           # "sqlite": rows go to SQLITE_PATH instead of a CSV per run
+SQLITE_PATH = "data/received/gateway.sqlite3"
+METRICS_PORT = None       # e.g. 9110: Prometheus metrics on http://127.0.0.1:9110/metrics
+METRICS_HOST = "127.0.0.1"
+RESUME = True             # After a crash or reboot, continue the same run for the time left
+MANIFEST_PATH = "logs/gateway_manifest.json"  # State of the running run (common/run_manifest.py)
+
+CSV_HEADER = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity',
+              'density', 'concentration', 'crc_ok', 'seq', 'sent_at', 'received_at', 'latency_ms',
+              'port', 'channel', 'device', 'sender_run']
+
+run_writer = None         # PartitionedRunWriter (or SqliteWriter) of the current run
+writer = None             # WriterThread shared by all ports
+
+# ========== Language Settings ==========
+LANG = "rus"  # or "eng"
+
+TEXTS = {
+    'rus': {
+        'start': "=== UART-Шлюз (autostart_gateway_24h.py) ===",
+        'start_log': "Приём запущен, портов: {}",
+        'port_open': "Порт {} (канал {}) открыт",
+        'port_error': "Не удалось открыть порт {}: {}",
+        'read_error': "Ошибка чтения порта {}: {} — повторное открытие через {} сек",
+        'decrypt_fail': "{}: ошибка расшифровки пакета",
+        'format_error': "{}: неверный формат расшифрованных данных",
+        'value_error': "{}: ошибка преобразования данных",
+        'duplicate': "{}: повтор пакета seq {} (ID {})",
+        'port_stats': "{port} (канал {channel}): кадров {frames}, ресинхронизаций {resyncs}, исправлено FEC {corrected}, PDR {pdr:.2%} ({received} из {expected}), потеряно {lost}, повторов {duplicates}, задержка p50 {p50_ms} мс",
+        'device_stats': "{port}, {sender}: PDR {pdr:.2%} ({received} из {expected}), потеряно {lost}, повторов {duplicates}",
+        'writer_stats': "Очередь записи: {depth} (макс. {max_depth}), записано: {written}, отброшено: {dropped}, fsync: {fsyncs}, ошибок: {errors}",
+        'user_stop': "Приём остановлен вручную",
+        'sender_device': "устройство {}",
+        'sender_run': "запуск {}",
+        'finished': "Приём завершён",
+        'done': "Готово.",
+        'delay': "Задержка перед запуском: {} сек",
+        'file_error': "Ошибка записи в файл {}: {}",
+        'resumed': "Продолжение запуска {} после сбоя (в {}-й раз): осталось {:.0f} сек, отрезано байт оборванных строк: {}",
+        'ack_error': "{}: ошибка отправки ACK: {}",
+        'ack_stats': "{port}: ACK отправлено {sent}, отложено из-за duty cycle {deferred}, эфир за окно {used_s} из {budget_s} с ({duty:.2%})",
+        'metrics': "Метрики Prometheus: http://{}:{}/metrics",
+        'metrics_error': "Не удалось запустить метрики на порту {}: {}",
+    },
+    'eng': {
+        'start': "=== UART Gateway (autostart_gateway_24h.py) ===",
+        'start_log': "Reception started, ports: {}",
+        'port_open': "Port {} (channel {}) opened",
+        'port_error': "Failed to open port {}: {}",
+        'read_error': "Read error on port {}: {} — reopening in {} sec",
+        'decrypt_fail': "{}: packet decryption failed",
+        'format_error': "{}: invalid decrypted data format",
+        'value_error': "{}: data conversion error",
+        'duplicate': "{}: duplicate packet seq {} (ID {})",
+        'port_stats': "{port} (channel {channel}): frames {frames}, resyncs {resyncs}, FEC corrected {corrected}, PDR {pdr:.2%} ({received} of {expected}), lost {lost}, duplicates {duplicates}, latency p50 {p50_ms} ms",
+        'device_stats': "{port}, {sender}: PDR {pdr:.2%} ({received} of {expected}), lost {lost}, duplicates {duplicates}",
+        'writer_stats': "Write queue: {depth} (max {max_depth}), written: {written}, dropped: {dropped}, fsyncs: {fsyncs}, errors: {errors}",
+        'user_stop': "Reception stopped manually",
+        'sender_device': "device {}",
+        'sender_run': "run {}",
+        'finished': "Reception completed",
+        'done': "Done.",
+        'delay': "Startup delay: {} sec",
+        'file_error': "Error writing to file {}: {}",
+        'resumed': "Resuming run {} after a crash (resume #{}): {:.0f} sec left, torn bytes truncated: {}",
+        'ack_error': "{}: failed to send ACK: {}",
+        'ack_stats': "{port}: ACK sent {sent}, deferred by duty cycle {deferred}, airtime in window {used_s} of {budget_s} s ({duty:.2%})",
+        'metrics': "Prometheus metrics: http://{}:{}/metrics",
+        'metrics_error': "Failed to start metrics on port {}: {}",
+    }
+}
+
+T = TEXTS[LANG]
+
+# One cipher per key for all ports
+KEYS = KeyTable.load(KEY_TABLE, AES_KEY) if KEY_TABLE else KeyTable(AES_KEY)
+FEC = ReedSolomon(FEC_PARITY) if FEC_PARITY else None
+
+# ========== Logging ==========
+# Both go through the writer thread: the event loop never waits on a file
+def log_event(text):
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    line = f"[{timestamp}] {text}"
+    if DEBUG:
+        print(line)
+    if writer is not None:
+        writer.write_line(line)
+    elif run_writer is not None:
+        run_writer.write_line(line)
+
+def writer_error(e):
+    if DEBUG:
+        print(T['file_error'].format(f"{run_writer.csv_path}, {run_writer.log_path}", e))
+
+# ========== One Serial Port ==========
+# Everything here runs on the event loop thread: callbacks never block,
+# the port is opened with timeout=0 and only read when epoll says so.
+class Port:
+    def __init__(self, path, channel, loop):
+        self.path = path
+        self.channel = channel
+        self.loop = loop
+        self.uart = None
+        self.reader = FrameReader(KEYS)
+        self.decoder = FrameDecoder(addressed_sizes(AGGREGATE_FRAME_SIZES), validate=self.reader.validate, fec=FEC)
+        self.links = Links(CLOCK_SYNC_WINDOW)  # Loss and clock state of every sender run on this channel
+        # Each module has its own channel, so its own duty-cycle budget
+        self.acks = AckScheduler(DutyCycle(DUTY_CYCLE, DUTY_WINDOW),
+                                 lora_airtime(ACK_SIZE + FEC_PARITY, **LORA_PARAMS)) if ARQ else None
+        self.uart_bytes = 0
+        self.last_packet_at = None  # time.monotonic() of the last saved reading
+        self._pause = None        # TimerHandle that drains a partial frame after READ_PAUSE
+        self._ack_retry = None    # TimerHandle that retries ACKs held back by the duty cycle
+        self._failing = False     # Open errors are logged once until the port comes back
+
+    def open(self):
+        try:
+            self.uart = serial.Serial(self.path, BAUDRATE, timeout=0)
+            self.loop.add_reader(self.uart.fileno(), self.on_readable)
+        except (OSError, ValueError, serial.SerialException) as e:
+            if not self._failing:
+                self._failing = True
+                log_event(T['port_error'].format(self.path, e))
+            self.close()
+            self.loop.call_later(REOPEN_INTERVAL, self.open)
+            return
+        self._failing = False
+        log_event(T['port_open'].format(self.path, self.channel))
+
+    def close(self):
+        if self._pause is not None:
+            self._pause.cancel()
+            self._pause = None
+        if self._ack_retry is not None:
+            self._ack_retry.cancel()
+            self._ack_retry = None
+        if self.uart is not None:
+            try:
+                self.loop.remove_reader(self.uart.fileno())
+            except (OSError, ValueError):
+                pass
+            self.uart.close()
+            self.uart = None
+
+    # ========== Event Loop Callbacks ==========
+    def on_readable(self):
+        try:
+            raw = self.uart.read(self.uart.in_waiting or 1)
+        except (OSError, serial.SerialException) as e:
+            log_event(T['read_error'].format(self.path, e, REOPEN_INTERVAL))
+            self.close()
+            self.loop.call_later(REOPEN_INTERVAL, self.open)
+            return
+        if not raw:
+            return
+        self.uart_bytes += len(raw)
+        for frame in self.decoder.feed(raw):
+            self.process_frame(frame, self.decoder.received_at)
+        self.send_acks()
+        # A pause on the line ends any partial frame, as a read timeout does
+        if self._pause is not None:
+            self._pause.cancel()
+        self._pause = self.loop.call_later(READ_PAUSE, self.on_pause) if len(self.decoder) else None
+
+    def on_pause(self):
+        self._pause = None
+        # Frames keep the arrival time of their chunk, not the pause time
+        for frame in self.decoder.drain():
+            self.process_frame(frame, self.decoder.received_at)
+        self.send_acks()
+
+    # ========== Frame Processing ==========
+    def process_frame(self, frame, received_at):
+        try:
+            device, run, readings = self.reader.read(frame)
+        except PayloadError as e:
+            log_event(T[e.reason].format(self.path))
+            return
+        floor = transit_time(len(frame) + FEC_PARITY, BAUDRATE, **LORA_PARAMS)
+        for reading, duplicate, delay in self.links.receive(device, run, readings, received_at, floor, ARQ):
+            if duplicate:
+                log_event(T['duplicate'].format(self.path, reading.seq, reading.packet_id))
+                if ARQ:
+                    continue  # A retransmission whose ACK was lost; the reading is already saved
+            sampled_at = reading.sampled_at if reading.sampled_at is not None else received_at
+            save_row(reading, sampled_at, received_at, delay, self.path, self.channel, device, run)
+        if self.acks is not None and readings[-1].seq is not None:
+            tracker = self.links.link(device, run)[0]
+            self.acks.received(device, *tracker.bitmap(ACK_BITS, readings[-1].seq, len(readings)), run)
+        self.last_packet_at = time.monotonic()
+
+    # ========== ARQ ==========
+    # ACKs go out on the module the frames came from, right after them while
+    # the sender is still listening. An ACK the duty cycle holds back is
+    # retried after READ_PAUSE, as often as the 24h receiver's loop does.
+    def send_acks(self):
+        if self._ack_retry is not None:
+            self._ack_retry.cancel()
+            self._ack_retry = None
+        if self.acks is None or not self.acks.pending or self.uart is None:
+            return
+        for device, highest, bitmap in self.acks.due(time.monotonic()):
+            frame = pack_ack(highest, bitmap, device)
+            try:
+                # A few bytes: the write fits in the driver buffer at once
+                self.uart.write(frame if FEC is None else FEC.encode(frame))
+            except (OSError, serial.SerialException) as e:
+                log_event(T['ack_error'].format(self.path, e))
+        if self.acks.pending:
+            self._ack_retry = self.loop.call_later(READ_PAUSE, self.send_acks)
+
+    def stats(self):
+        return dict(port=self.path, channel=self.channel, **self.decoder.stats(), **self.links.loss.stats(),
+                    p50_ms=self.links.one_way.summary()['p50_ms'])
+
+    def device_stats(self):
+        return [dict(port=self.path, sender=sender_label(device, run), **tracker.stats())
+                for (device, run), (tracker, _) in self.links.devices.items()]
+
+def sender_label(device, run):
+    parts = [] if device is None else [T['sender_device'].format(device)]
+    if run is not None:
+        parts.append(T['sender_run'].format(run))
+    return ", ".join(parts)
+
+# ========== Save a Row ==========
+# Same columns as the 24h receiver plus the port and channel of the module
+def save_row(reading, sampled_at, received_at, delay, port, channel, device=None, run=None):
+    timestamp = datetime.fromtimestamp(sampled_at).strftime('%Y-%m-%d %H:%M:%S')
+    row = [reading.packet_id, timestamp] + reading.params + [
+        True, '' if reading.seq is None else reading.seq,
+        '' if reading.sent_at is None else f"{reading.sent_at:.3f}",
+        f"{received_at:.3f}",
+        '' if delay is None else f"{delay * 1000:.1f}",
+        port, channel, '' if device is None else device, '' if run is None else run]
+    writer.write_row(row)
+
+# ========== Main Loop ==========
+async def serve(ports_config, duration, manifest=None):
+    loop = asyncio.get_running_loop()
+    ports = [Port(entry["port"], entry["channel"], loop) for entry in ports_config]
+    for port in ports:
+        port.open()
+    log_event(T['start_log'].format(len(ports)))
+    metrics = None
+    if METRICS_PORT is not None:
+        try:
+            metrics = start_metrics(ports)
+            log_event(T['metrics'].format(METRICS_HOST, metrics.port))
+        except OSError as e:
+            log_event(T['metrics_error'].format(METRICS_PORT, e))
+    stop_at = loop.time() + duration
+    try:
+        # The loop itself only wakes for port data; this task reports stats
+        while loop.time() < stop_at:
+            await asyncio.sleep(min(FLUSH_INTERVAL, stop_at - loop.time()))
+            if loop.time() < stop_at:
+                log_stats(ports)
+                if manifest is not None:
+                    manifest.update()
+    finally:
+        if metrics is not None:
+            metrics.close()
+        for port in ports:
+            port.close()
+            port.on_pause()  # Frames still buffered
+        log_stats(ports)
+
+def log_stats(ports):
+    for port in ports:
+        log_event(T['port_stats'].format(**port.stats()))
+        for stats in port.device_stats():
+            log_event(T['device_stats'].format(**stats))
+        if port.acks is not None:
+            log_event(T['ack_stats'].format(port=port.path, **port.acks.stats(time.monotonic())))
+    log_event(T['writer_stats'].format(**writer.stats()))
+
+# ========== Metrics ==========
+# Same names as the 24h receiver's (prefix lora_gateway_), per port where
+# the receiver has one value; served from a background thread that only
+# reads counters the event loop keeps anyway
+def start_metrics(ports):
+    metrics = MetricsServer(METRICS_PORT, METRICS_HOST, prefix="lora_gateway_")
+    per_port = lambda value: lambda: {port.path: value(port) for port in ports}
+    metrics.counter("frames_total", "Frames with a valid CRC8 and payload",
+                    per_port(lambda port: port.decoder.frames), label="port")
+    metrics.counter("resyncs_total", "CRC8 mismatches that lost frame sync (dropped frames)",
+                    per_port(lambda port: port.decoder.resyncs), label="port")
+    metrics.counter("skipped_bytes_total", "Bytes discarded while searching for a frame",
+                    per_port(lambda port: port.decoder.skipped_bytes), label="port")
+    metrics.counter("fec_corrected_frames_total", "Frames repaired by FEC instead of dropped",
+                    per_port(lambda port: port.decoder.corrected), label="port")
+    metrics.counter("crc_false_matches_total", "Frames whose CRC8 matched but payload did not decode",
+                    per_port(lambda port: port.decoder.rejected), label="port")
+    metrics.counter("payload_errors_total", "Undecodable payloads by reason (decrypt_fail = decrypt failures)",
+                    lambda: {reason: sum(port.reader.payload_errors[reason] for port in ports)
+                             for reason in PAYLOAD_ERRORS}, label="reason")
+    metrics.counter("uart_bytes_total", "Bytes read from the UART",
+                    per_port(lambda port: port.uart_bytes), label="port")
+    metrics.gauge("last_packet_age_seconds", "Seconds since the last reading was saved (any port)",
+                  age(lambda: max((port.last_packet_at for port in ports if port.last_packet_at is not None),
+                                  default=None)))
+    # PDR = received / expected; computed by the scraper, not here
+    metrics.counter("readings_received_total", "Distinct readings received by seq (all devices)",
+                    per_port(lambda port: sum(tracker.received for tracker in port.links.trackers())), label="port")
+    metrics.counter("readings_expected_total", "Readings the seq sequences say were sent (all devices)",
+                    per_port(lambda port: sum(tracker.expected() for tracker in port.links.trackers())), label="port")
+    metrics.gauge("devices", "Sender runs with a device ID or run ID heard so far",
+                  per_port(lambda port: len(port.links.devices)), label="port")
+    metrics.gauge("write_queue_depth", "Records waiting for the writer thread",
+                  lambda: writer.depth() if writer is not None else 0)
+    metrics.counter("write_dropped_total", "Records dropped on a full write queue",
+                    lambda: writer.dropped if writer is not None else 0)
+    add_run_writer_metrics(metrics, lambda: run_writer)
+    # The exposition has no labels on histograms: all ports in one
+    one_way = lambda: sum_histograms(port.links.one_way for port in ports)
+    metrics.histogram("one_way_latency_seconds", "One-way frame latency corrected for the sender clock",
+                      lambda: one_way() if any(port.links.one_way.count for port in ports) else None)
+    if ARQ:
+        metrics.counter("acks_sent_total", "ACK frames sent back to the senders",
+                        per_port(lambda port: port.acks.sent), label="port")
+        metrics.counter("acks_deferred_total", "ACKs held back by the duty-cycle budget",
+                        per_port(lambda port: port.acks.deferred), label="port")
+    return metrics.start()
+
+def sum_histograms(histograms):
+    total = Histogram()
+    for histogram in histograms:
+        total.merge(histogram)
+    return total
+
+def main():
+    global run_writer, writer
+    print(T['start'])
+    # An unfinished run (power loss, reboot) continues under the same number
+    manifest = RunManifest(MANIFEST_PATH) if RESUME else None
+    resumed = manifest.resume(RECEIVE_DURATION) if manifest is not None else None
+    run_number = resumed["run"] if resumed else next_run_number()
+    log_filename = f"logs/log_run_{run_number}.txt"
+    # Same layout as the 24h receiver: data/received[/device=N]/gateway_run_R.csv,
+    # R being the sender's run for frames with a run ID, else the gateway's run
+    router = RowRouter(CSV_HEADER, run_number, prefix="gateway")
+    if STORAGE == "sqlite":
+        run_writer = SqliteWriter(SQLITE_PATH, log_filename, CSV_HEADER, router.run, 0)
+    else:
+        run_writer = PartitionedRunWriter(router.csv_path(run_number), log_filename, CSV_HEADER, router.path, 0)
+    exit_on_signal()
+    if resumed:
+        log_event(T['resumed'].format(run_number, resumed["resumes"], manifest.remaining(), run_writer.truncated))
+    writer = WriterThread(run_writer, WRITER_QUEUE_SIZE, WRITER_BATCH, FLUSH_INTERVAL, writer_error).start()
+
+    log_event(T['delay'].format(START_DELAY))
+    time.sleep(START_DELAY)
+    if resumed:
+        duration = manifest.remaining()
+    else:
+        duration = RECEIVE_DURATION
+        if manifest is not None:
+            manifest.start(run_number, duration)
+    finished = False  # Ended normally or by hand; after a signal the next start resumes
+    try:
+        asyncio.run(serve(PORTS, duration, manifest))
+        finished = True
+    except KeyboardInterrupt:
+        finished = True
+        log_event(T['user_stop'])
+    finally:
+        log_event(T['finished'])
+        if manifest is not None and finished:
+            manifest.finish()
+        writer.close()
+        writer = None
+        run_writer.close()
+        print(T['done'])
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,18 @@
 # Версия: июнь 2025
 # ========================================
 
-import csv
+import sys
 import os
 import time
 import serial
 from datetime import datetime
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+
+# ========== Общие модули ==========
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.codec import AesCodec
+from common.crc import crc8
+from common.run_counter import next_run_number
+from common.run_writer import RunWriter, exit_on_signal
 
 # ========== Конфигурация ==========
 UART_PORT = "/dev/ttyUSB0"
@@ -55,78 +60,54 @@ TEXTS = {
 
 T = TEXTS[LANG]
 
-# ========== CRC8 ==========
-def crc8(data: bytes) -> int:
-    crc = 0
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            crc = (crc << 1) ^ 0x07 if crc & 0x80 else crc << 1
-            crc &= 0xFF
-    return crc
+CSV_HEADER = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity',
+              'density', 'concentration', 'crc_ok']
+
+run_writer = None  # RunWriter текущего запуска
 
 # ========== AES Расшифровка ==========
-def decrypt_message(ciphertext):
-    try:
-        cipher = AES.new(AES_KEY, AES.MODE_ECB)
-        decrypted = unpad(cipher.decrypt(ciphertext), AES.block_size)
-        return decrypted.decode()
-    except Exception:
-        return None
+CODEC = AesCodec(AES_KEY)  # Шифр создаётся один раз, а не на каждый пакет
 
 # ========== Логирование ==========
-def log_event(logfile, text):
+def log_event(text):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     line = f"[{timestamp}] {text}"
     if DEBUG:
         print(line)
-    with open(logfile, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
-
-# ========== Поиск следующего номера запуска ==========
-def get_next_run_number(log_dir="logs"):
-    os.makedirs(log_dir, exist_ok=True)
-    existing = [f for f in os.listdir(log_dir) if f.startswith("log_run_") and f.endswith(".txt")]
-    numbers = []
-    for f in existing:
-        parts = f.replace("log_run_", "").replace(".txt", "")
-        if parts.isdigit():
-            numbers.append(int(parts))
-    return max(numbers, default=0) + 1
+    run_writer.write_line(line)
 
 # ========== Сохранение в CSV ==========
-def save_to_csv(csvfile, packet_id, data, crc_ok):
-    header = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity',
-              'density', 'concentration', 'crc_ok']
+def save_to_csv(packet_id, data, crc_ok):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     row = [packet_id, timestamp] + data + [crc_ok]
-    file_exists = os.path.exists(csvfile)
-    with open(csvfile, 'a', newline='') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(header)
-        writer.writerow(row)
+    run_writer.write_row(row)
 
 # ========== Основной цикл ==========
 def main():
+    global run_writer
     print(T['start'])
 
-    run_number = get_next_run_number()
+    run_number = next_run_number()
     log_filename = f"logs/log_run_{run_number}.txt"
     csv_filename = f"data/received/received_run_{run_number}.csv"
-    os.makedirs("data/received", exist_ok=True)
+
+    # Как и раньше — запись после каждой строки, без fsync (перед выключением
+    # файлы закрываются, и система сама сбрасывает кэш)
+    run_writer = RunWriter(csv_filename, log_filename, CSV_HEADER, flush_rows=1, fsync=False)
+    exit_on_signal()
 
     # Задержка перед стартом
-    log_event(log_filename, T['delay'].format(START_DELAY))
+    log_event(T['delay'].format(START_DELAY))
     time.sleep(START_DELAY)
 
     try:
         uart = serial.Serial(UART_PORT, BAUDRATE, timeout=1)
     except Exception as e:
-        log_event(log_filename, T['port_error'].format(UART_PORT, e))
+        log_event(T['port_error'].format(UART_PORT, e))
+        run_writer.close()
         return
 
-    log_event(log_filename, T['start_log'])
+    log_event(T['start_log'])
     start_time = time.time()
 
     try:
@@ -140,34 +121,35 @@ def main():
             crc_ok = (received_crc == calculated_crc)
 
             if not crc_ok:
-                log_event(log_filename, T['crc_fail'])
+                log_event(T['crc_fail'])
                 continue
 
-            decrypted = decrypt_message(data)
+            decrypted = CODEC.decrypt(data)
             if decrypted is None:
-                log_event(log_filename, T['decrypt_fail'])
+                log_event(T['decrypt_fail'])
                 continue
 
             parts = decrypted.split(",")
             if len(parts) != 6:
-                log_event(log_filename, T['format_error'])
+                log_event(T['format_error'])
                 continue
 
             try:
                 packet_id = int(parts[0])
                 payload = list(map(int, parts[1:]))
             except ValueError:
-                log_event(log_filename, T['value_error'])
+                log_event(T['value_error'])
                 continue
 
-            save_to_csv(csv_filename, packet_id, payload, crc_ok)
-            log_event(log_filename, T['packet_saved'].format(packet_id))
+            save_to_csv(packet_id, payload, crc_ok)
+            log_event(T['packet_saved'].format(packet_id))
 
     except KeyboardInterrupt:
-        log_event(log_filename, T['user_stop'])
+        log_event(T['user_stop'])
     finally:
         uart.close()
-        log_event(log_filename, T['finished'])
+        log_event(T['finished'])
+        run_writer.close()
         os.system("sudo shutdown now")
 
 if __name__ == '__main__':
@@ -1,22 +1,76 @@
 # autostart_receiver_24h.py
+#
+# Replay of a raw capture (CAPTURE_RAW) through the same decode path:
+#   python autostart_receiver_24h.py --replay data/raw/capture_run_1.bin
 
-import csv
+import sys
 import os
 import time
 import serial
 import os.path
+import re
 from datetime import datetime
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+
+# ========== Shared Modules ==========
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.airtime import DutyCycle, lora_airtime, transit_time
+from common.arq import ACK_BITS, ACK_SIZE, AckScheduler, pack_ack
+from common.capture import CaptureReader, CaptureWriter
+from common.devices import KeyTable, addressed_sizes
+from common.fec import ReedSolomon
+from common.framing import FrameDecoder
+from common.latency import StageLatency
+from common.metrics import MetricsServer, add_run_writer_metrics, age
+from common.payload import AGGREGATE_FRAME_SIZES, PayloadError
+from common.receive import FrameReader, Links, RowRouter
+from common.run_counter import next_run_number
+from common.run_manifest import RunManifest
+from common.run_writer import PartitionedRunWriter, exit_on_signal
+from common.sqlite_store import SqliteWriter
+from common.writer_thread import WriterThread
 
 # ========== Configuration ==========
 UART_PORT = "/dev/ttyUSB0"
 BAUDRATE = 9600
 AES_KEY = "cat".ljust(16)[:16].encode()
+KEY_TABLE = None          # JSON {"device ID": "key", ...}; frames without a device ID and unlisted devices use AES_KEY
 RECEIVE_DURATION = 86400  # 24 hours in seconds
 START_DELAY = 1           # Delay before starting in seconds
 DEBUG = False
 FLUSH_INTERVAL = 60       # Flush files every 60 seconds to balance performance and data safety
+FLUSH_ROWS = 20           # ...or after this many CSV/log records (without the writer thread)
+WRITER_THREAD = True      # Write CSV/log on a separate thread so fsync never blocks UART reads
+WRITER_QUEUE_SIZE = 1000  # Records waiting for the writer thread before new ones are dropped
+WRITER_BATCH = 20         # One fsync per this many records (or per FLUSH_INTERVAL)
+CAPTURE_RAW = False       # Also store raw UART bytes in data/raw/capture_run_N.bin for --replay
+LATENCY_STATS = False     # Time every receive stage into histograms, logged every FLUSH_INTERVAL
+LATENCY_STAGES = ('uart_read', 'crc', 'decrypt', 'parse', 'csv_write', 'log_write')
+CLOCK_SYNC_WINDOW = 600   # Seconds per lower-envelope point of the sender clock fit
+LORA_PARAMS = {'sf': 9, 'bw': 125000, 'cr': 1, 'preamble': 8}  # E22 air rate, for the transit floor
+FEC_PARITY = 0            # Reed-Solomon parity bytes per frame, same as the sender's (0 = no FEC, 8 = fixes 4 bytes)
+ARQ = False               # Acknowledge frames so the sender (ARQ = True there too) retransmits lost ones
+DUTY_CYCLE = 0.1          # Share of airtime ACKs may use: 10% at 433 MHz, 1% in most of the 868 MHz band
+DUTY_WINDOW = 3600        # ...over a sliding window of this many seconds
+STORAGE = "csv"           # "sqlite": rows go to SQLITE_PATH (WAL, one transaction per flush) instead of a CSV per run
+SQLITE_PATH = "data/received/received.sqlite3"  # One database for all runs; export: logs_csv/sqlite_runs.py
+METRICS_PORT = None       # e.g. 9108: Prometheus metrics on http://127.0.0.1:9108/metrics
+METRICS_HOST = "127.0.0.1"
+RESUME = True             # After a crash or reboot, continue the same run for the time left
+MANIFEST_PATH = "logs/receiver_manifest.json"  # State of the running run (common/run_manifest.py)
+
+CSV_HEADER = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity',
+              'density', 'concentration', 'crc_ok', 'seq', 'sent_at', 'received_at', 'latency_ms', 'device',
+              'sender_run']
+
+run_writer = None         # RunWriter of the current run
+writer = None             # WriterThread when WRITER_THREAD is enabled
+latency = None            # StageLatency when LATENCY_STATS is enabled
+# Loss (gaps, duplicates, reordering by seq), sender clock offset/drift and
+# one-way latency of every sender run
+links = Links(CLOCK_SYNC_WINDOW)
+uart_bytes = 0            # Bytes read from the UART
+last_packet_at = None     # time.monotonic() of the last saved reading
+acks = None               # AckScheduler when ARQ is enabled
 
 # ========== Language Settings ==========
 LANG = "rus"  # or "eng"
@@ -25,7 +79,6 @@ TEXTS = {
     'rus': {
         'start': "=== UART-Приёмник (autostart_receiver.py) ===",
         'start_log': "Приём по UART запущен",
-        'crc_fail': "CRC не совпадает — пакет отброшен",
         'decrypt_fail': "Ошибка расшифровки пакета",
         'format_error': "Неверный формат расшифрованных данных",
         'value_error': "Ошибка преобразования данных",
@@ -35,12 +88,30 @@ TEXTS = {
         'done': "Готово.",
         'port_error': "Не удалось открыть порт {}: {}",
         'delay': "Задержка перед запуском: {} сек",
-        'file_error': "Ошибка записи в файл {}: {}"
+        'file_error': "Ошибка записи в файл {}: {}",
+        'resync': "CRC не совпадает — ресинхронизация, пропущено байт: {} (всего ресинхронизаций: {})",
+        'decoder_stats': "Кадров: {frames}, ресинхронизаций: {resyncs}, пропущено байт: {skipped_bytes}, исправлено FEC: {corrected} ({corrected_bytes} байт)",
+        'writer_stats': "Очередь записи: {depth} (макс. {max_depth}), записано: {written}, отброшено: {dropped}, fsync: {fsyncs}, ошибок: {errors}",
+        'duplicate': "Повтор пакета seq {} (ID {})",
+        'device': "Устройство {}: {}",
+        'run': "Запуск отправителя {}: {}",
+        'device_run': "Устройство {}, запуск {}: {}",
+        'loss_stats': "PDR: {pdr:.2%} ({received} из {expected}), потеряно: {lost}, серий потерь: {bursts} (макс. {max_burst}), опоздавших: {late}, повторов: {duplicates}, вне окна: {stale}",
+        'capture': "Сырые байты UART пишутся в {}",
+        'replay_start': "Воспроизведение записи {}",
+        'replay_done': "Воспроизведено кусков: {}, байт: {} за {:.2f} с",
+        'latency_stats': "Время этапа {}: n={count}, p50 {p50_ms} мс, p95 {p95_ms} мс, p99 {p99_ms} мс, макс. {max_ms} мс",
+        'clock_stats': "Часы отправителя: смещение {offset_ms} мс, дрейф {drift_ppm} ppm, наим. разность {min_delay_ms} мс (отметок: {samples}, точек: {points})",
+        'one_way_stats': "Задержка в одну сторону: n={count}, p50 {p50_ms} мс, p95 {p95_ms} мс, p99 {p99_ms} мс, макс. {max_ms} мс",
+        'metrics': "Метрики Prometheus: http://{}:{}/metrics",
+        'metrics_error': "Не удалось запустить метрики на порту {}: {}",
+        'resumed': "Продолжение запуска {} после сбоя (в {}-й раз): осталось {:.0f} сек, отрезано байт оборванных строк: {}",
+        'ack_error': "Ошибка отправки ACK: {}",
+        'ack_stats': "ACK: отправлено {sent}, отложено из-за duty cycle {deferred}, эфир за окно {used_s} из {budget_s} с ({duty:.2%})"
     },
     'eng': {
         'start': "=== UART Receiver (autostart_receiver.py) ===",
         'start_log': "UART reception started",
-        'crc_fail': "CRC mismatch — packet dropped",
         'decrypt_fail': "Packet decryption failed",
         'format_error': "Invalid decrypted data format",
         'value_error': "Data conversion error",
@@ -50,144 +121,404 @@ TEXTS = {
         'done': "Done.",
         'port_error': "Failed to open port {}: {}",
         'delay': "Startup delay: {} sec",
-        'file_error': "Error writing to file {}: {}"
+        'file_error': "Error writing to file {}: {}",
+        'resync': "CRC mismatch — resynchronising, skipped {} bytes (resyncs so far: {})",
+        'decoder_stats': "Frames: {frames}, resyncs: {resyncs}, skipped bytes: {skipped_bytes}, FEC corrected: {corrected} ({corrected_bytes} bytes)",
+        'writer_stats': "Write queue: {depth} (max {max_depth}), written: {written}, dropped: {dropped}, fsyncs: {fsyncs}, errors: {errors}",
+        'duplicate': "Duplicate packet seq {} (ID {})",
+        'device': "Device {}: {}",
+        'run': "Sender run {}: {}",
+        'device_run': "Device {}, run {}: {}",
+        'loss_stats': "PDR: {pdr:.2%} ({received} of {expected}), lost: {lost}, loss bursts: {bursts} (max {max_burst}), late: {late}, duplicates: {duplicates}, out of window: {stale}",
+        'capture': "Raw UART bytes are captured to {}",
+        'replay_start': "Replaying capture {}",
+        'replay_done': "Replayed {} chunks, {} bytes in {:.2f} s",
+        'latency_stats': "Stage {} time: n={count}, p50 {p50_ms} ms, p95 {p95_ms} ms, p99 {p99_ms} ms, max {max_ms} ms",
+        'clock_stats': "Sender clock: offset {offset_ms} ms, drift {drift_ppm} ppm, min difference {min_delay_ms} ms (timestamps: {samples}, points: {points})",
+        'one_way_stats': "One-way latency: n={count}, p50 {p50_ms} ms, p95 {p95_ms} ms, p99 {p99_ms} ms, max {max_ms} ms",
+        'metrics': "Prometheus metrics: http://{}:{}/metrics",
+        'metrics_error': "Failed to start metrics on port {}: {}",
+        'resumed': "Resuming run {} after a crash (resume #{}): {:.0f} sec left, torn bytes truncated: {}",
+        'ack_error': "Failed to send ACK: {}",
+        'ack_stats': "ACK: sent {sent}, deferred by duty cycle {deferred}, airtime in window {used_s} of {budget_s} s ({duty:.2%})"
     }
 }
 
 T = TEXTS[LANG]
 
-# ========== CRC8 ==========
-def crc8(data: bytes) -> int:
-    crc = 0
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            crc = (crc << 1) ^ 0x07 if crc & 0x80 else crc << 1
-            crc &= 0xFF
-    return crc
-
 # ========== AES Decryption ==========
-def decrypt_message(ciphertext):
-    try:
-        cipher = AES.new(AES_KEY, AES.MODE_ECB)
-        decrypted = unpad(cipher.decrypt(ciphertext), AES.block_size)
-        return decrypted.decode()
-    except Exception:
-        return None
+# Ciphers are created once per key (per device with KEY_TABLE), not per packet
+KEYS = KeyTable.load(KEY_TABLE, AES_KEY) if KEY_TABLE else KeyTable(AES_KEY)
+FEC = ReedSolomon(FEC_PARITY) if FEC_PARITY else None
+# Candidate frames must also decode (reader.validate for the decoder); the
+# readings are kept, so process_frame() does not decrypt the frame again
+reader = FrameReader(KEYS)
 
 # ========== Logging ==========
-def log_event(logfile, text):
+def log_event(text):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     line = f"[{timestamp}] {text}"
     if DEBUG:
         print(line)
+    started = time.perf_counter() if latency is not None else 0.0
     try:
-        with open(logfile, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
-            f.flush()  # Force write to disk
-            os.fsync(f.fileno())  # Ensure data is committed to disk
+        if writer is not None:
+            writer.write_line(line)
+        elif run_writer is not None:
+            run_writer.write_line(line)
     except Exception as e:
         if DEBUG:
-            print(T['file_error'].format(logfile, e))
-
-# ========== Find Next Run Number ==========
-def get_next_run_number(log_dir="logs"):
-    os.makedirs(log_dir, exist_ok=True)
-    existing = [f for f in os.listdir(log_dir) if f.startswith("log_run_") and f.endswith(".txt")]
-    numbers = []
-    for f in existing:
-        parts = f.replace("log_run_", "").replace(".txt", "")
-        if parts.isdigit():
-            numbers.append(int(parts))
-    return max(numbers, default=0) + 1
+            print(T['file_error'].format(run_writer.log_path, e))
+    if latency is not None:
+        latency.record('log_write', time.perf_counter() - started)
+
+def link_label(device, run, text):
+    if run is None:
+        return T['device'].format(device, text)
+    if device is None:
+        return T['run'].format(run, text)
+    return T['device_run'].format(device, run, text)
 
 # ========== Save to CSV ==========
-def save_to_csv(csvfile, packet_id, data, crc_ok):
-    header = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity',
-              'density', 'concentration', 'crc_ok']
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    row = [packet_id, timestamp] + data + [crc_ok]
+# <root>[/device=N]/received_run_R.csv, R being the sender's run when the
+# frame carried a run ID, else this receiver's own run
+def partitioned_writer(run_number, log_filename, root, *policy):
+    router = RowRouter(CSV_HEADER, run_number, root)
+    return PartitionedRunWriter(router.csv_path(run_number), log_filename, CSV_HEADER, router.path, *policy)
+
+# sampled_at: original sample time of aggregated readings (else receive time)
+# seq: the sender's sequence number, None for frames without one
+# sent_at, received_at, delay: send time from the frame, arrival time and
+# one-way latency in seconds; None when the frame carries no send time
+# device, run: the sender's device ID and run ID from the frame header
+# (rows are partitioned by them), None if absent
+def save_to_csv(packet_id, data, crc_ok, sampled_at=None, seq=None, sent_at=None, received_at=None, delay=None,
+                device=None, run=None):
+    moment = datetime.now() if sampled_at is None else datetime.fromtimestamp(sampled_at)
+    timestamp = moment.strftime('%Y-%m-%d %H:%M:%S')
+    row = [packet_id, timestamp] + data + [
+        crc_ok, '' if seq is None else seq,
+        '' if sent_at is None else f"{sent_at:.3f}",
+        '' if received_at is None else f"{received_at:.3f}",
+        '' if delay is None else f"{delay * 1000:.1f}",
+        '' if device is None else device,
+        '' if run is None else run]
+    started = time.perf_counter() if latency is not None else 0.0
     try:
-        file_exists = os.path.exists(csvfile)
-        with open(csvfile, 'a', newline='') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(header)
-            writer.writerow(row)
-            f.flush()  # Force write to disk
-            os.fsync(f.fileno())  # Ensure data is committed to disk
+        if writer is not None:
+            writer.write_row(row)
+        else:
+            run_writer.write_row(row)
     except Exception as e:
-        log_event(log_filename, T['file_error'].format(csvfile, e))
+        log_event(T['file_error'].format(run_writer.csv_path, e))
+    if latency is not None:
+        latency.record('csv_write', time.perf_counter() - started)
+
+def writer_error(e):
+    if DEBUG:
+        print(T['file_error'].format(f"{run_writer.csv_path}, {run_writer.log_path}", e))
+
+# ========== Frame Processing ==========
+# received_at: arrival time of the chunk that completed the frame (the
+# capture time during replay); now if not given
+def process_frame(frame, received_at=None):
+    global last_packet_at
+    # The decoder only yields frames whose CRC8 matches
+    crc_ok = True
+
+    # Text, binary (17-byte) or aggregated (N readings) payload
+    try:
+        device, run, readings = reader.read(frame)
+    except PayloadError as e:
+        log_event(T[e.reason])
+        return
+
+    if received_at is None:
+        received_at = time.time()
+    floor = transit_time(len(frame) + FEC_PARITY, BAUDRATE, **LORA_PARAMS)
+    for reading, duplicate, delay in links.receive(device, run, readings, received_at, floor, ARQ):
+        if duplicate:
+            log_event(T['duplicate'].format(reading.seq, reading.packet_id))
+            if ARQ:
+                continue  # A retransmission whose ACK was lost; the reading is already saved
+        sampled_at = reading.sampled_at if reading.sampled_at is not None else received_at
+        save_to_csv(reading.packet_id, reading.params, crc_ok, sampled_at, reading.seq,
+                    reading.sent_at, received_at, delay, device, run)
+        log_event(T['packet_saved'].format(reading.packet_id))
+    if acks is not None and readings[-1].seq is not None:
+        # Duplicates too: their ACK was lost. The bitmap counts back from the
+        # frame's own seq, so an old frame the sender resends from its spool
+        # is confirmed too.
+        tracker = links.link(device, run)[0]
+        acks.received(device, *tracker.bitmap(ACK_BITS, readings[-1].seq, len(readings)), run)
+    last_packet_at = time.monotonic()
+
+# One UART read (or a read timeout when raw is empty) through the decoder
+def process_chunk(decoder, raw, received_at=None):
+    # A read timeout is a pause on the line, so a partial frame left
+    # in the decoder will never be completed
+    skipped_before = decoder.skipped_bytes
+    if latency is not None:
+        started, nested = time.perf_counter(), latency.recorded
+    # Each frame gets the arrival time of its own last byte, not the
+    # time of the chunk or pause that let the decoder find it
+    for frame in decoder.feed(raw, received_at) if raw else decoder.drain():
+        process_frame(frame, decoder.received_at)
+    if latency is not None:
+        # CRC8 search is what remains after the stages timed inside it
+        latency.record('crc', time.perf_counter() - started - (latency.recorded - nested))
+
+    if decoder.skipped_bytes != skipped_before:
+        log_event(T['resync'].format(decoder.skipped_bytes - skipped_before, decoder.resyncs))
+
+# ========== ARQ ==========
+# One ACK for everything received so far, sent right after the frame while
+# the sender is still listening (the bitmap also covers earlier ACKs lost)
+def send_ack(uart, device, highest, bitmap):
+    frame = pack_ack(highest, bitmap, device)
+    try:
+        uart.write(frame if FEC is None else FEC.encode(frame))
+    except Exception as e:
+        log_event(T['ack_error'].format(e))
+
+def log_acks():
+    if acks is not None:
+        log_event(T['ack_stats'].format(**acks.stats(time.monotonic())))
+
+def log_loss():
+    if links.loss.received or not links.devices:
+        log_event(T['loss_stats'].format(**links.loss.stats()))
+    for (device, run), (tracker, _) in links.devices.items():
+        log_event(link_label(device, run, T['loss_stats'].format(**tracker.stats())))
+
+def log_latency():
+    if links.clock_sync.samples:
+        log_event(T['clock_stats'].format(**links.clock_sync.stats()))
+    for (device, run), (_, sync) in links.devices.items():
+        if sync.samples:
+            log_event(link_label(device, run, T['clock_stats'].format(**sync.stats())))
+    if links.one_way.count:
+        log_event(T['one_way_stats'].format(**links.one_way.summary()))
+    if latency is None:
+        return
+    for stage, summary in latency.summary().items():
+        log_event(T['latency_stats'].format(stage, **summary))
+
+# ========== Metrics ==========
+# Served from a background thread; every value is read from counters the
+# receive loop keeps anyway, so scraping never waits on the UART loop
+def start_metrics(decoder):
+    metrics = MetricsServer(METRICS_PORT, METRICS_HOST, prefix="lora_receiver_")
+    metrics.counter("frames_total", "Frames with a valid CRC8 and payload", lambda: decoder.frames)
+    metrics.counter("resyncs_total", "CRC8 mismatches that lost frame sync (dropped frames)",
+                    lambda: decoder.resyncs)
+    metrics.counter("skipped_bytes_total", "Bytes discarded while searching for a frame",
+                    lambda: decoder.skipped_bytes)
+    metrics.counter("fec_corrected_frames_total", "Frames repaired by FEC instead of dropped",
+                    lambda: decoder.corrected)
+    metrics.counter("fec_corrected_bytes_total", "Bytes repaired by FEC", lambda: decoder.corrected_bytes)
+    metrics.counter("crc_false_matches_total", "Frames whose CRC8 matched but payload did not decode",
+                    lambda: decoder.rejected)
+    metrics.counter("payload_errors_total", "Undecodable payloads by reason (decrypt_fail = decrypt failures)",
+                    lambda: reader.payload_errors, label="reason")
+    metrics.counter("uart_bytes_total", "Bytes read from the UART", lambda: uart_bytes)
+    metrics.gauge("last_packet_age_seconds", "Seconds since the last reading was saved", age(lambda: last_packet_at))
+    # PDR = received / expected; computed by the scraper, not here
+    metrics.counter("readings_received_total", "Distinct readings received by seq (all devices)",
+                    lambda: sum(tracker.received for tracker in links.trackers()))
+    metrics.counter("readings_expected_total", "Readings the seq sequences say were sent (all devices)",
+                    lambda: sum(tracker.expected() for tracker in links.trackers()))
+    metrics.gauge("devices", "Sender runs with a device ID or run ID heard so far", lambda: len(links.devices))
+    metrics.gauge("write_queue_depth", "Records waiting for the writer thread",
+                  lambda: writer.depth() if writer is not None else 0)
+    metrics.counter("write_dropped_total", "Records dropped on a full write queue",
+                    lambda: writer.dropped if writer is not None else 0)
+    add_run_writer_metrics(metrics, lambda: run_writer)
+    metrics.histogram("one_way_latency_seconds", "One-way frame latency corrected for the sender clock",
+                      lambda: links.one_way if links.one_way.count else None)
+    if acks is not None:
+        metrics.counter("acks_sent_total", "ACK frames sent back to the sender", lambda: acks.sent)
+        metrics.counter("acks_deferred_total", "ACKs held back by the duty-cycle budget", lambda: acks.deferred)
+    return metrics.start()
 
 # ========== Main Loop ==========
 def main():
+    global run_writer, writer, latency, uart_bytes, acks
     print(T['start'])
+    if LATENCY_STATS:
+        latency = reader.latency = StageLatency(LATENCY_STAGES)
+    if ARQ:
+        acks = AckScheduler(DutyCycle(DUTY_CYCLE, DUTY_WINDOW), lora_airtime(ACK_SIZE + FEC_PARITY, **LORA_PARAMS))
 
-    run_number = get_next_run_number()
-    global log_filename
+    # An unfinished run (power loss, reboot) continues under the same
+    # number: the CSV and log are appended to
+    manifest = RunManifest(MANIFEST_PATH) if RESUME else None
+    resumed = manifest.resume(RECEIVE_DURATION) if manifest is not None else None
+    run_number = resumed["run"] if resumed else next_run_number()
     log_filename = f"logs/log_run_{run_number}.txt"
-    csv_filename = f"data/received/received_run_{run_number}.csv"
-    os.makedirs("data/received", exist_ok=True)
+    # Rows of frames with a run ID are filed under the sender's run; in the
+    # CSV files rows of each device ID also go to data/received/device=N/
+    if STORAGE == "sqlite":
+        run = RowRouter(CSV_HEADER, run_number).run
+        storage = lambda *policy: SqliteWriter(SQLITE_PATH, log_filename, CSV_HEADER, run, *policy)
+    else:
+        storage = lambda *policy: partitioned_writer(run_number, log_filename, "data/received", *policy)
+    if WRITER_THREAD:
+        # Group commit is driven by the writer thread
+        run_writer = storage(0)
+    else:
+        run_writer = storage(FLUSH_ROWS, FLUSH_INTERVAL)
+    exit_on_signal()
+    if resumed:
+        log_event(T['resumed'].format(run_number, resumed["resumes"], manifest.remaining(), run_writer.truncated))
 
     # Startup delay
-    log_event(log_filename, T['delay'].format(START_DELAY))
+    log_event(T['delay'].format(START_DELAY))
     time.sleep(START_DELAY)
 
     try:
         uart = serial.Serial(UART_PORT, BAUDRATE, timeout=1)
     except Exception as e:
-        log_event(log_filename, T['port_error'].format(UART_PORT, e))
+        log_event(T['port_error'].format(UART_PORT, e))
+        run_writer.close()
         return
 
-    log_event(log_filename, T['start_log'])
+    capture = None
+    if CAPTURE_RAW:
+        # A resumed run starts a new capture part instead of overwriting the first
+        part = f"_part{resumed['resumes'] + 1}" if resumed else ""
+        capture = CaptureWriter(f"data/raw/capture_run_{run_number}{part}.bin")
+        log_event(T['capture'].format(capture.path))
+
+    if WRITER_THREAD:
+        writer = WriterThread(run_writer, WRITER_QUEUE_SIZE, WRITER_BATCH, FLUSH_INTERVAL, writer_error).start()
+
+    log_event(T['start_log'])
     start_time = time.time()
     last_flush = start_time
+    # A resumed run only gets the time left; the startup delay counts against it
+    if resumed:
+        duration = manifest.remaining()
+    else:
+        duration = RECEIVE_DURATION
+        if manifest is not None:
+            manifest.start(run_number, duration)
+    finished = False  # Ended normally or by hand; after a signal the next start resumes
+    # Every 16*k+1 length up to the largest aggregated frame, plus 1-3
+    # bytes for frames that start with a device ID and/or run ID
+    decoder = FrameDecoder(addressed_sizes(AGGREGATE_FRAME_SIZES), validate=reader.validate, fec=FEC)
+    metrics = None
+    if METRICS_PORT is not None:
+        try:
+            metrics = start_metrics(decoder)
+            log_event(T['metrics'].format(METRICS_HOST, metrics.port))
+        except OSError as e:
+            log_event(T['metrics_error'].format(METRICS_PORT, e))
 
     try:
-        while time.time() - start_time < RECEIVE_DURATION:
-            raw = uart.read(33)
-            if not raw or len(raw) < 17:
-                continue
-
-            data, received_crc = raw[:-1], raw[-1]
-            calculated_crc = crc8(data)
-            crc_ok = (received_crc == calculated_crc)
-
-            if not crc_ok:
-                log_event(log_filename, T['crc_fail'])
-                continue
-
-            decrypted = decrypt_message(data)
-            if decrypted is None:
-                log_event(log_filename, T['decrypt_fail'])
-                continue
-
-            parts = decrypted.split(",")
-            if len(parts) != 6:
-                log_event(log_filename, T['format_error'])
-                continue
+        while time.time() - start_time < duration:
+            if acks is not None and acks.pending:
+                for device, highest, bitmap in acks.due(time.monotonic()):
+                    send_ack(uart, device, highest, bitmap)
 
-            try:
-                packet_id = int(parts[0])
-                payload = list(map(int, parts[1:]))
-            except ValueError:
-                log_event(log_filename, T['value_error'])
-                continue
-
-            save_to_csv(csv_filename, packet_id, payload, crc_ok)
-            log_event(log_filename, T['packet_saved'].format(packet_id))
-
-            # Periodically flush files to disk
+            # Periodically report link quality and write queue health
             current_time = time.time()
             if current_time - last_flush >= FLUSH_INTERVAL:
                 last_flush = current_time
+                log_loss()
+                log_latency()
+                log_acks()
+                if manifest is not None:
+                    # Next seq after the last one received (senders without a header)
+                    manifest.update(seq=None if links.loss.highest is None else links.loss.highest + 1)
+                if capture is not None:
+                    capture.flush()
+                if writer is not None:
+                    log_event(T['writer_stats'].format(**writer.stats()))
+                else:
+                    run_writer.maybe_flush()
+
+            # Read whatever has arrived (at least 1 byte or timeout); frame
+            # boundaries are restored by the decoder, not by the read size
+            if latency is None:
+                raw = uart.read(uart.in_waiting or 1)
+            else:
+                started = time.perf_counter()
+                raw = uart.read(uart.in_waiting or 1)
+                latency.record('uart_read', time.perf_counter() - started)
+            received_at = time.time()
+            if not raw and not len(decoder):
+                continue
+            uart_bytes += len(raw)
+
+            if capture is not None:
+                capture.write(raw)  # An empty chunk marks the timeout for replay
+            process_chunk(decoder, raw, received_at)
+        finished = True
 
     except KeyboardInterrupt:
-        log_event(log_filename, T['user_stop'])
+        finished = True
+        log_event(T['user_stop'])
     finally:
         uart.close()
-        log_event(log_filename, T['finished'])
+        if metrics is not None:
+            metrics.close()
+        if capture is not None:
+            capture.close()
+        log_event(T['decoder_stats'].format(**decoder.stats()))
+        log_loss()
+        log_latency()
+        log_acks()
+        log_event(T['finished'])
+        if manifest is not None and finished:
+            manifest.finish()
+        if writer is not None:
+            writer.close()
+            stats = writer.stats()
+            writer = None  # The final report goes straight to the file
+            log_event(T['writer_stats'].format(**stats))
+        run_writer.close()
+        print(T['done'])
+
+# ========== Replay ==========
+# Feeds a capture through the decoder as fast as the CPU allows; rows get
+# the capture time instead of the replay time. Files are laid out as in the
+# live run (device=N/, sender's run) under data/replay/<capture name>/, so
+# the live files are not appended to.
+def replay(path):
+    global run_writer, latency
+    print(T['start'])
+    if LATENCY_STATS:
+        latency = reader.latency = StageLatency(LATENCY_STAGES)
+    name = os.path.splitext(os.path.basename(path))[0]
+    # capture_run_N[_partK].bin -> run N for frames without a run ID
+    match = re.match(r"capture_run_(\d+)", name)
+    run_number = int(match.group(1)) if match else name
+    run_writer = partitioned_writer(run_number, f"logs/replay_{name}.txt", f"data/replay/{name}",
+                                    FLUSH_ROWS, FLUSH_INTERVAL)
+    decoder = FrameDecoder(addressed_sizes(AGGREGATE_FRAME_SIZES), validate=reader.validate, fec=FEC)
+    log_event(T['replay_start'].format(path))
+    started = time.perf_counter()
+    chunks = size = 0
+    try:
+        with CaptureReader(path) as capture:
+            received_at = capture.started_at
+            for offset, raw in capture:
+                received_at = capture.started_at + offset
+                process_chunk(decoder, raw, received_at)
+                chunks += 1
+                size += len(raw)
+            process_chunk(decoder, b"", received_at)
+    finally:
+        log_event(T['decoder_stats'].format(**decoder.stats()))
+        log_loss()
+        log_latency()
+        log_event(T['replay_done'].format(chunks, size, time.perf_counter() - started))
+        run_writer.close()
         print(T['done'])
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) == 3 and sys.argv[1] == '--replay':
+        replay(sys.argv[2])
+    else:
+        main()
@@ -8,13 +8,17 @@
 #   - Расшифровка AES и сохранение в CSV
 # ========================================
 
-import csv
+import sys
 import os
 import time
 import serial
 from datetime import datetime
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+
+# ========== Общие модули ==========
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.codec import AesCodec
+from common.crc import crc8
+from common.run_writer import RunWriter
 
 # ========== Язык ==========
 def choose_language():
@@ -69,47 +73,25 @@ UART_PORT = "/dev/ttyUSB0"
 BAUDRATE = 9600
 AES_KEY = "cat".ljust(16)[:16].encode()
 DEBUG = False
-
-# ========== CRC8 ==========
-def crc8(data: bytes) -> int:
-    crc = 0
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            crc = (crc << 1) ^ 0x07 if crc & 0x80 else crc << 1
-            crc &= 0xFF
-    return crc
+CSV_HEADER = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity',
+              'density', 'concentration', 'crc_ok']
 
 # ========== AES Расшифровка ==========
-def decrypt_message(ciphertext):
-    try:
-        cipher = AES.new(AES_KEY, AES.MODE_ECB)
-        decrypted = unpad(cipher.decrypt(ciphertext), AES.block_size)
-        return decrypted.decode()
-    except Exception:
-        return None
+CODEC = AesCodec(AES_KEY)  # Шифр создаётся один раз, а не на каждый пакет
 
 # ========== Логирование ==========
-def log_event(logfile, text):
+def log_event(run_writer, text):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     line = f"[{timestamp}] {text}"
     if DEBUG:
         print(line)
-    with open(logfile, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    run_writer.write_line(line)
 
 # ========== Сохранение в CSV ==========
-def save_to_csv(csvfile, packet_id, data, crc_ok):
-    header = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity',
-              'density', 'concentration', 'crc_ok']
+def save_to_csv(run_writer, packet_id, data, crc_ok):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     row = [packet_id, timestamp] + data + [crc_ok]
-    file_exists = os.path.exists(csvfile)
-    with open(csvfile, 'a', newline='') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(header)
-        writer.writerow(row)
+    run_writer.write_row(row)
 
 # ========== Основной цикл ==========
 def main():
@@ -120,16 +102,17 @@ def main():
 
     log_filename = f"logs/log_run_{run_number}_{distance}m.txt"
     csv_filename = f"data/received/received_run_{run_number}_{distance}m.csv"
-    os.makedirs("logs", exist_ok=True)
-    os.makedirs("data/received", exist_ok=True)
+    # Файлы запуска открываются один раз; сброс после каждой строки, как раньше
+    run_writer = RunWriter(csv_filename, log_filename, CSV_HEADER, flush_rows=1, fsync=False)
 
     try:
         uart = serial.Serial(UART_PORT, BAUDRATE, timeout=1)
     except Exception as e:
-        log_event(log_filename, T['port_error'].format(UART_PORT, e))
+        log_event(run_writer, T['port_error'].format(UART_PORT, e))
+        run_writer.close()
         return
 
-    log_event(log_filename, T['start_log'])
+    log_event(run_writer, T['start_log'])
 
     try:
         while True:
@@ -142,34 +125,35 @@ def main():
             crc_ok = (received_crc == calculated_crc)
 
             if not crc_ok:
-                log_event(log_filename, T['crc_fail'])
+                log_event(run_writer, T['crc_fail'])
                 continue
 
-            decrypted = decrypt_message(data)
+            decrypted = CODEC.decrypt(data)
             if decrypted is None:
-                log_event(log_filename, T['decrypt_fail'])
+                log_event(run_writer, T['decrypt_fail'])
                 continue
 
             parts = decrypted.split(",")
             if len(parts) != 6:
-                log_event(log_filename, T['format_error'])
+                log_event(run_writer, T['format_error'])
                 continue
 
             try:
                 packet_id = int(parts[0])
                 payload = list(map(int, parts[1:]))
             except ValueError:
-                log_event(log_filename, T['value_error'])
+                log_event(run_writer, T['value_error'])
                 continue
 
-            save_to_csv(csv_filename, packet_id, payload, crc_ok)
-            log_event(log_filename, T['packet_saved'].format(packet_id))
+            save_to_csv(run_writer, packet_id, payload, crc_ok)
+            log_event(run_writer, T['packet_saved'].format(packet_id))
 
     except KeyboardInterrupt:
-        log_event(log_filename, T['user_stop'])
+        log_event(run_writer, T['user_stop'])
     finally:
         uart.close()
-        log_event(log_filename, T['finished'])
+        log_event(run_writer, T['finished'])
+        run_writer.close()
         print(T['done'])
 
         action = input(T['exit_choice']).strip().lower()
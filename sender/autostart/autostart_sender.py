@@ -3,14 +3,19 @@
 # Версия: июнь 2025
 # ========================================
 
-import csv
+import sys
 import random
 import time
 import serial
 import os
 from datetime import datetime
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad
+
+# ========== Общие модули ==========
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.codec import AesCodec
+from common.crc import crc8
+from common.run_counter import next_run_number
+from common.run_writer import RunWriter, exit_on_signal
 
 # ========== Конфигурация ==========
 DEBUG = False
@@ -60,25 +65,17 @@ TEXT = {
 
 T = TEXT[CONFIG["LANG"]]
 
-# ========== Подготовка директорий и счётчика ==========
-def get_next_run_number(log_dir="logs"):
-    os.makedirs(log_dir, exist_ok=True)
-    existing = [f for f in os.listdir(log_dir) if f.startswith("log_run_") and f.endswith(".txt")]
-    numbers = []
-    for f in existing:
-        parts = f.replace("log_run_", "").replace(".txt", "")
-        if parts.isdigit():
-            numbers.append(int(parts))
-    return max(numbers, default=0) + 1
+CSV_HEADER = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity', 'density', 'concentration']
+
+run_writer = None  # RunWriter текущего запуска
 
 # ========== Логирование ==========
-def log_event(logfile, text):
+def log_event(text):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     line = f"[{timestamp}] {text}"
     if DEBUG:
         print(line)
-    with open(logfile, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    run_writer.write_line(line)
 
 # ========== Генерация параметров ==========
 def generate_parameters():
@@ -91,46 +88,30 @@ def generate_parameters():
     ]
 
 # ========== Сохранение в CSV ==========
-def save_to_csv(csvfile, packet_id, data):
-    header = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity', 'density', 'concentration']
+def save_to_csv(packet_id, data):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     row = [packet_id, timestamp] + data
-    file_exists = os.path.exists(csvfile)
-    with open(csvfile, 'a', newline='') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(header)
-        writer.writerow(row)
+    run_writer.write_row(row)
 
 # ========== Шифрование AES ==========
-def encrypt_message(message, key_str):
-    key = key_str.ljust(16)[:16].encode()
-    cipher = AES.new(key, AES.MODE_ECB)
-    return cipher.encrypt(pad(message.encode(), AES.block_size))
-
-# ========== CRC8 ==========
-def crc8(data: bytes) -> int:
-    crc = 0
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            crc = (crc << 1) ^ 0x07 if crc & 0x80 else crc << 1
-            crc &= 0xFF
-    return crc
+CODEC = AesCodec(CONFIG["AES_KEY"])  # Ключ выводится и шифр создаётся один раз
 
 # ========== Основной цикл ==========
 def main():
+    global run_writer
     print(T['start'])
 
-    run_number = get_next_run_number()
+    run_number = next_run_number()
     log_filename = f"logs/log_run_{run_number}.txt"
     csv_filename = f"data/sent_run_{run_number}.csv"
 
-    os.makedirs("logs", exist_ok=True)
-    os.makedirs("data", exist_ok=True)
+    # Как и раньше — запись после каждой строки, без fsync (перед выключением
+    # файлы закрываются, и система сама сбрасывает кэш)
+    run_writer = RunWriter(csv_filename, log_filename, CSV_HEADER, flush_rows=1, fsync=False)
+    exit_on_signal()
 
     if CONFIG["DELAY_BEFORE_START"] > 0:
-        log_event(log_filename, T['wait'].format(CONFIG["DELAY_BEFORE_START"]))
+        log_event(T['wait'].format(CONFIG["DELAY_BEFORE_START"]))
         time.sleep(CONFIG["DELAY_BEFORE_START"])
 
     try:
@@ -140,10 +121,11 @@ def main():
             timeout=1
         )
     except Exception as e:
-        log_event(log_filename, T['port_error'].format(CONFIG["UART_PORT"], e))
+        log_event(T['port_error'].format(CONFIG["UART_PORT"], e))
+        run_writer.close()
         return
 
-    log_event(log_filename, T['start_log'])
+    log_event(T['start_log'])
     start_time = time.time()
 
     try:
@@ -154,11 +136,11 @@ def main():
             if DEBUG:
                 print(T['param'], params)
 
-            log_event(log_filename, T['packet_built'].format(packet_id, params))
-            save_to_csv(csv_filename, packet_id, params)
+            log_event(T['packet_built'].format(packet_id, params))
+            save_to_csv(packet_id, params)
 
             message = f"{packet_id}," + ",".join(map(str, params))
-            encrypted = encrypt_message(message, CONFIG["AES_KEY"])
+            encrypted = CODEC.encrypt(message)
             crc = crc8(encrypted)
             full_packet = encrypted + bytes([crc])
 
@@ -166,22 +148,23 @@ def main():
                 uart.write(full_packet)
                 if DEBUG:
                     print(T['sent'])
-                log_event(log_filename, T['sent_log'].format(packet_id))
+                log_event(T['sent_log'].format(packet_id))
             except Exception as e:
-                log_event(log_filename, T['send_error'].format(packet_id, e))
+                log_event(T['send_error'].format(packet_id, e))
 
             time.sleep(CONFIG["INTERVAL"])
 
-        log_event(log_filename, T['finished'])
+        log_event(T['finished'])
         if DEBUG:
             print(T['done'])
 
     except KeyboardInterrupt:
-        log_event(log_filename, T['user_stop'])
+        log_event(T['user_stop'])
 
     finally:
         uart.close()
-        log_event(log_filename, T['shutdown'])
+        log_event(T['shutdown'])
+        run_writer.close()
         os.system("sudo shutdown now")
 
 if __name__ == '__main__':
@@ -1,27 +1,82 @@
 # autostart_sender_24h.py
 
-import csv
+import sys
 import random
 import time
 import serial
 import os
 from datetime import datetime
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad
+
+# ========== Общие модули ==========
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from common.airtime import DutyCycle, lora_airtime, transit_time
+from common.arq import ACK_SIZE, RetransmitTimer, RetransmitWindow, ack_device, is_ack, parse_ack
+from common.codec import AesCodec
+from common.crc import crc8
+from common.devices import HEADER_SIZE, RUN_ID_MASK, add_header
+from common.fec import ReedSolomon
+from common.framing import FrameDecoder
+from common.metrics import MetricsServer, add_run_writer_metrics, age
+from common.payload import aggregate_fits, pack_aggregate, pack_binary, pack_text
+from common.run_counter import next_run_number
+from common.run_manifest import RunManifest
+from common.run_writer import RunWriter, exit_on_signal
+from common.sqlite_store import SqliteWriter
+from common.scheduler import TickScheduler
+from common.spool import Spool
 
 # ========== Конфигурация ==========
 DEBUG = False
-FLUSH_INTERVAL = 60  # Период проверки времени (сек), для совместимости с приёмником
+FLUSH_INTERVAL = 60  # Сброс CSV и лога на диск не реже, чем раз в столько секунд
+FLUSH_ROWS = 10      # ...или после стольких записей в CSV/лог
 
 CONFIG = {
     "LANG": "rus",
     "DELAY_BEFORE_START": 5,    # Задержка перед стартом (сек)
     "DURATION": 86400,          # Длительность работы: 24 часа (сек)
     "INTERVAL": 30,             # Интервал отправки пакетов: 30 сек
+    "SCHEDULE_POLICY": "skip",  # При опоздании больше интервала: "skip" — пропустить такты,
+                                # "catch_up" — отправить пропущенные подряд (см. common/scheduler.py)
+    "DITHER": 0,                # Случайный сдвиг такта до стольких секунд, чтобы
+                                # несколько отправителей не совпадали по времени
     "UART_PORT": "/dev/ttyUSB0",
     # "/dev/ttyS0" - стандартный UART на Raspberry Pi (GPIO)
     "BAUDRATE": 9600,
-    "AES_KEY": "cat"
+    "AES_KEY": "cat",
+    "DEVICE_ID": None,          # Номер узла 0..255 в каждом кадре: приёмник различает отправителей, берёт ключ
+                                # узла из своей таблицы и пишет его строки отдельно; None — кадр без номера
+    "RUN_ID": False,            # True — номер запуска (2 байта) в каждом кадре: приёмник пишет строки в файл
+                                # с тем же номером, что у отправителя, а не под своим счётчиком
+    "PAYLOAD_FORMAT": "text",   # "text" — кадр 49 байт, "binary" — 17 байт (см. common/payload.py)
+    "AGGREGATE": 1,             # Показаний в одном кадре: 1 — без агрегации, до 30.
+                                # INTERVAL тогда — период снятия показаний, а кадр уходит раз в N показаний
+    "FEC_PARITY": 0,            # Проверочных байт Рида — Соломона в кадре: 0 — без FEC, 8 — исправляет
+                                # до 4 искажённых байт (кадр длиннее на 8 байт); у приёмника то же значение
+    "ARQ": False,               # True — приёмник подтверждает кадры (у него тоже ARQ = True),
+                                # неподтверждённые кадры отправляются повторно между тактами
+    "ARQ_WINDOW": 8,            # Кадров, ожидающих подтверждения
+    "ARQ_MAX_RETRIES": 3,       # Повторов одного кадра
+    "ARQ_INITIAL_RTO": 3.0,     # Таймаут повтора до первого замера RTT (сек); дальше — по RTT
+    "ARQ_MAX_RTO": 60.0,
+    "ARQ_TURNAROUND": 0.2,      # Запас на ответ приёмника и переключение модулей на приём (сек)
+    "ARQ_POLL": 0.05,           # Таймаут чтения UART в ожидании ACK (сек)
+    "ARQ_RETRANSMIT_SHARE": 0.5,  # Повторы — не больше этой доли бюджета эфира, остаток — новым данным
+    "DUTY_CYCLE": 0.1,          # Доля времени в эфире: 10% в 433 МГц, 1% в большей части 868 МГц
+    "DUTY_WINDOW": 3600,        # ...за скользящее окно (сек)
+    "LORA_PARAMS": {"sf": 9, "bw": 125000, "cr": 1, "preamble": 8},  # Скорость в эфире E22 — для таймаутов ARQ
+    "SPOOL": False,             # True — кадры хранятся на диске до подтверждения и досылаются, когда канал
+                                # снова работает, в т.ч. после перезагрузки; только вместе с ARQ
+    "SPOOL_PATH": "data/sender/spool.bin",
+    "SPOOL_CAPACITY": 2880,     # Кадров в буфере (сутки при интервале 30 с); при переполнении вытесняются старые
+    "SPOOL_DRAIN_RATE": 0.2,    # Досылка: не больше стольких кадров в секунду и доли ARQ_RETRANSMIT_SHARE эфира
+    "STORAGE": "csv",           # "sqlite" — строки в SQLITE_PATH (WAL, транзакция на сброс) вместо CSV на запуск
+    "SQLITE_PATH": "data/sender/sent.sqlite3",  # Одна база на все запуски; выгрузка: logs_csv/sqlite_runs.py
+    "METRICS_PORT": None,       # Например 9109: метрики Prometheus на http://127.0.0.1:9109/metrics
+    "METRICS_HOST": "127.0.0.1",
+    "RESUME": True,             # После сбоя или перезагрузки продолжить тот же запуск на оставшееся время
+    "MANIFEST_PATH": "logs/sender_manifest.json",  # Состояние идущего запуска (common/run_manifest.py)
+    "MANIFEST_SEQ_BLOCK": 20    # seq занимаются блоками: одна запись состояния на столько пакетов;
+                                # после сбоя seq продолжается с конца блока, пропуск виден как потери
 }
 
 TEXT = {
@@ -36,6 +91,25 @@ TEXT = {
         'sent': "Пакет отправлен",
         'sent_log': "Отправлен пакет ID {}",
         'send_error': "Ошибка при отправке пакета ID {}: {}",
+        'binary_error': "Пакет ID {} не помещается в двоичный формат, отправлен текстом: {}",
+        'aggregate_sent': "Отправлен агрегированный пакет: {} показаний, ID {}–{}",
+        'schedule_skip': "Отправка опоздала больше чем на интервал, пропущено тактов: {}",
+        'schedule_stats': "Планировщик: {}",
+        'retransmit': "Повторная отправка пакета seq {} (попытка {})",
+        'expired': "Пакет seq {} не подтверждён, повторы прекращены после {}",
+        'spooled': "Пакет seq {} не подтверждён после {} повторов, оставлен в буфере",
+        'spool_drained': "Дослан пакет seq {} из буфера",
+        'spool_dropped': "Буфер заполнен, вытеснен пакет seq {}",
+        'spool_resume': "В буфере {} пакетов прошлого запуска, seq продолжается с {}",
+        'spool_stats': "Буфер: {pending} пакетов из {capacity}, дослано {drained}, вытеснено {dropped}",
+        'spool_error': "Не удалось открыть буфер {}: {}",
+        'spool_needs_arq': "SPOOL без ARQ не работает: без подтверждений потерянный в эфире кадр не отличить от доставленного. Буфер отключён, включите ARQ",
+        'spool_skip': "Пакет seq {} не сохранён в буфере: {}",
+        'arq_stats': "ARQ: ждут подтверждения {in_flight}, подтверждено {acked} из {sent}, повторов {retransmits}, без подтверждения {expired}, RTO {rto_ms} мс, SRTT {srtt_ms} мс",
+        'duty_stats': "Эфир за окно: {used_s} из {budget_s} с ({duty:.2%})",
+        'metrics': "Метрики Prometheus: http://{}:{}/metrics",
+        'metrics_error': "Не удалось запустить метрики на порту {}: {}",
+        'resumed': "Продолжение запуска {} после сбоя (в {}-й раз): осталось {:.0f} сек, seq с {}, отрезано байт оборванных строк: {}",
         'done': "Готово.",
         'finished': "Передача завершена",
         'user_stop': "Передача остановлена пользователем",
@@ -51,6 +125,25 @@ TEXT = {
         'sent': "Packet sent",
         'sent_log': "Packet ID {} sent",
         'send_error': "Failed to send packet ID {}: {}",
+        'binary_error': "Packet ID {} does not fit the binary format, sent as text: {}",
+        'aggregate_sent': "Aggregated packet sent: {} readings, ID {}–{}",
+        'schedule_skip': "Transmission fell behind by more than an interval, ticks skipped: {}",
+        'schedule_stats': "Scheduler: {}",
+        'retransmit': "Retransmitting packet seq {} (attempt {})",
+        'expired': "Packet seq {} unacknowledged, gave up after {} retries",
+        'spooled': "Packet seq {} unacknowledged after {} retries, kept in the spool",
+        'spool_drained': "Packet seq {} sent from the spool",
+        'spool_dropped': "Spool full, packet seq {} dropped",
+        'spool_resume': "Spool holds {} packets of the previous run, seq continues from {}",
+        'spool_stats': "Spool: {pending} of {capacity} packets, drained {drained}, dropped {dropped}",
+        'spool_error': "Failed to open the spool {}: {}",
+        'spool_needs_arq': "SPOOL does not work without ARQ: with no ACKs a frame lost on air looks delivered. The spool is disabled; enable ARQ",
+        'spool_skip': "Packet seq {} not kept in the spool: {}",
+        'arq_stats': "ARQ: awaiting ACK {in_flight}, acknowledged {acked} of {sent}, retransmits {retransmits}, unacknowledged {expired}, RTO {rto_ms} ms, SRTT {srtt_ms} ms",
+        'duty_stats': "Airtime in window: {used_s} of {budget_s} s ({duty:.2%})",
+        'metrics': "Prometheus metrics: http://{}:{}/metrics",
+        'metrics_error': "Failed to start metrics on port {}: {}",
+        'resumed': "Resuming run {} after a crash (resume #{}): {:.0f} sec left, seq from {}, torn bytes truncated: {}",
         'done': "Done.",
         'finished': "Transmission completed",
         'user_stop': "Transmission interrupted by user",
@@ -59,31 +152,35 @@ TEXT = {
 
 T = TEXT[CONFIG["LANG"]]
 
-# ========== Подготовка директорий и счётчика ==========
-def get_next_run_number(log_dir="logs"):
-    os.makedirs(log_dir, exist_ok=True)
-    existing = [f for f in os.listdir(log_dir) if f.startswith("log_run_") and f.endswith(".txt")]
-    numbers = []
-    for f in existing:
-        parts = f.replace("log_run_", "").replace(".txt", "")
-        if parts.isdigit():
-            numbers.append(int(parts))
-    return max(numbers, default=0) + 1
+CSV_HEADER = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity', 'density', 'concentration', 'seq',
+              'sent_at', 'device']
+
+run_writer = None  # RunWriter текущего запуска
+frames_sent = 0      # Кадров, записанных в UART
+send_errors = 0      # Ошибок записи в UART
+uart_bytes = 0       # Байт, записанных в UART
+last_sent_at = None  # time.monotonic() последней отправки
+arq = None           # RetransmitWindow при CONFIG["ARQ"]
+duty = DutyCycle(CONFIG["DUTY_CYCLE"], CONFIG["DUTY_WINDOW"])  # Время в эфире своих передач
+ack_decoder = None   # FrameDecoder кадров ACK
+quiet_until = 0.0    # time.monotonic(), до которого отправитель слушает ACK
+spool = None         # Spool при CONFIG["SPOOL"]
+run_id = None        # Номер запуска в заголовке кадра при CONFIG["RUN_ID"]
+spool_drained = 0    # Кадров, досланных из буфера
+link_up = False      # Канал работает: последний ACK пришёл после последнего неподтверждённого кадра
+next_drain = 0.0     # time.monotonic(), раньше которого следующий кадр из буфера не уходит
 
 # ========== Логирование ==========
-def log_event(logfile, text):
+def log_event(text):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     line = f"[{timestamp}] {text}"
     if DEBUG:
         print(line)
     try:
-        with open(logfile, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
-            f.flush()  # Сброс буфера на диск
-            os.fsync(f.fileno())  # Гарантия записи на диск
+        run_writer.write_line(line)
     except Exception as e:
         if DEBUG:
-            print(T['file_error'].format(logfile, e))
+            print(T['file_error'].format(run_writer.log_path, e))
 
 # ========== Генерация параметров ==========
 def generate_parameters():
@@ -96,107 +193,408 @@ def generate_parameters():
     ]
 
 # ========== Сохранение в CSV ==========
-def save_to_csv(csvfile, packet_id, data):
-    header = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity', 'density', 'concentration']
+# sent_at — Unix-время отправки с миллисекундами (оно же в кадре)
+def save_to_csv(packet_id, data, seq, sent_at):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    row = [packet_id, timestamp] + data
+    device = CONFIG["DEVICE_ID"]
+    row = [packet_id, timestamp] + data + [seq, f"{sent_at:.3f}", '' if device is None else device]
     try:
-        file_exists = os.path.exists(csvfile)
-        with open(csvfile, 'a', newline='') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(header)
-            writer.writerow(row)
-            f.flush()  # Сброс буфера на диск
-            os.fsync(f.fileno())  # Гарантия записи на диск
+        run_writer.write_row(row)
     except Exception as e:
-        log_event(log_filename, T['file_error'].format(csvfile, e))
+        log_event(T['file_error'].format(run_writer.csv_path, e))
 
 # ========== Шифрование AES ==========
-def encrypt_message(message, key_str):
-    key = key_str.ljust(16)[:16].encode()
-    cipher = AES.new(key, AES.MODE_ECB)
-    return cipher.encrypt(pad(message.encode(), AES.block_size))
-
-# ========== CRC8 ==========
-def crc8(data: bytes) -> int:
-    crc = 0
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            crc = (crc << 1) ^ 0x07 if crc & 0x80 else crc << 1
-            crc &= 0xFF
-    return crc
+CODEC = AesCodec(CONFIG["AES_KEY"])  # Ключ выводится и шифр создаётся один раз
+FEC = ReedSolomon(CONFIG["FEC_PARITY"]) if CONFIG["FEC_PARITY"] else None
+
+# ========== Сборка кадра ==========
+# [Номер устройства] + шифротекст + CRC8 (+ проверочные байты FEC).
+# Приёмник определяет формат и наличие номера по длине кадра.
+# seq — сквозной номер пакета в запуске, по нему приёмник считает потери.
+# sent_at — время отправки с миллисекундами, по нему приёмник оценивает
+# смещение часов и задержку в одну сторону (common/clock_sync.py). Его
+# несёт только двоичный кадр: в тексте миллисекунды удлинили бы кадр с 33
+# до 49 байт, там остаются целые секунды (packet_id).
+def build_packet(seq, sent_at, params):
+    if CONFIG["PAYLOAD_FORMAT"] == "binary":
+        try:
+            return finish_frame(CODEC.encrypt_raw(pack_binary(seq, sent_at, params)))
+        except ValueError as e:
+            log_event(T['binary_error'].format(int(sent_at), e))
+    return finish_frame(CODEC.encrypt(pack_text(int(sent_at), params, seq)))
+
+# samples — список (packet_id, params), seq — номер первого показания
+def build_aggregate_packet(seq, samples):
+    return finish_frame(CODEC.encrypt(pack_aggregate(seq, samples)))
+
+def finish_frame(encrypted):
+    if CONFIG["DEVICE_ID"] is not None or run_id is not None:
+        encrypted = add_header(CONFIG["DEVICE_ID"], encrypted, run_id)
+    frame = encrypted + bytes([crc8(encrypted)])
+    return frame if FEC is None else FEC.encode(frame)
+
+# ========== Отправка кадра ==========
+# seq, count — показания в кадре; по ним кадр ждёт подтверждения при ARQ
+def send_packet(uart, full_packet, packet_id, sent_text, seq, count=1):
+    global frames_sent, send_errors, uart_bytes, last_sent_at
+    try:
+        write_frame(uart, full_packet)
+        frames_sent += 1
+        if DEBUG:
+            print(T['sent'])
+        log_event(sent_text)
+    except Exception as e:
+        send_errors += 1
+        log_event(T['send_error'].format(packet_id, e))
+        spool_push(seq, count, full_packet)
+        return
+    if arq is not None:
+        # Кадр лежит в буфере, пока его не подтвердят
+        spool_push(seq, count, full_packet)
+        add_in_flight(seq, count, full_packet, last_sent_at)
+
+def send_aggregate(uart, seq, samples):
+    first_id, last_id = samples[0][0], samples[-1][0]
+    full_packet = build_aggregate_packet(seq, samples)
+    send_packet(uart, full_packet, first_id, T['aggregate_sent'].format(len(samples), first_id, last_id),
+                seq, len(samples))
+
+# Запись кадра в UART с учётом времени в эфире; после неё отправитель
+# молчит, пока может прийти ACK (полудуплекс: передача заглушит приём)
+def write_frame(uart, frame):
+    global uart_bytes, last_sent_at, quiet_until
+    uart.write(frame)
+    uart_bytes += len(frame)
+    now = last_sent_at = time.monotonic()
+    duty.record(lora_airtime(len(frame), **CONFIG["LORA_PARAMS"]), now)
+    quiet_until = now + listen_time(len(frame))
+
+def add_in_flight(seq, count, frame, now):
+    for pending in arq.add(seq, count, frame, now, listen_time(len(frame))):
+        log_expired(pending)
+
+# ========== ARQ ==========
+# Кадр доходит до приёмника, ACK — обратно; раньше ждать ACK нет смысла
+def listen_time(size):
+    lora, baudrate = CONFIG["LORA_PARAMS"], CONFIG["BAUDRATE"]
+    ack_size = ack_frame_size() + CONFIG["FEC_PARITY"]
+    return transit_time(size, baudrate, **lora) + transit_time(ack_size, baudrate, **lora) + CONFIG["ARQ_TURNAROUND"]
+
+# Ожидание до следующего такта (sleep планировщика): чтение ACK и
+# повторы. Повтор уходит, только если его ACK успеет вернуться до такта,
+# эфир не занят ожиданием другого ACK и повторы не превысили свою долю
+# бюджета duty cycle — новые данные всегда важнее повторов.
+# until_empty — выйти раньше, когда все кадры подтверждены (завершение).
+def arq_idle(uart, seconds, until_empty=False):
+    global send_errors, link_up
+    deadline = time.monotonic() + seconds
+    poll = CONFIG["ARQ_POLL"]
+    while True:
+        now = time.monotonic()
+        if now >= deadline or (until_empty and not len(arq)):
+            return
+        if deadline - now < poll and not uart.in_waiting:
+            time.sleep(deadline - now)
+            continue
+        raw = uart.read(uart.in_waiting or 1)
+        now = time.monotonic()
+        for frame in ack_decoder.feed(raw) if raw else ack_decoder.drain():
+            for pending in arq.ack(*parse_ack(frame), now):
+                if spool is not None:
+                    spool.remove(pending.seq)
+            link_up = True
+        if now < quiet_until:
+            continue
+        pending, dropped = arq.due(now)
+        for expired in dropped:
+            log_expired(expired)
+        if pending is None:
+            # Повторов нет — эфир для кадров из буфера
+            spool_drain(uart, now, deadline)
+            continue
+        if now + listen_time(len(pending.frame)) > deadline:
+            continue
+        airtime = lora_airtime(len(pending.frame), **CONFIG["LORA_PARAMS"])
+        if not duty.allows(airtime, now, CONFIG["ARQ_RETRANSMIT_SHARE"]):
+            continue
+        try:
+            write_frame(uart, pending.frame)
+        except Exception as e:
+            send_errors += 1
+            log_event(T['send_error'].format(pending.seq, e))
+            continue
+        arq.retransmitted(pending, now)
+        log_event(T['retransmit'].format(pending.seq, pending.retries))
+
+# ACK отправителю с номером устройства несёт этот номер
+def ack_frame_size():
+    return ACK_SIZE + (HEADER_SIZE if CONFIG["DEVICE_ID"] is not None else 0)
+
+def is_own_ack(frame):
+    return is_ack(frame) and ack_device(frame) == CONFIG["DEVICE_ID"]
+
+# Неподтверждённый кадр: при буфере он остаётся там до досылки
+def log_expired(pending):
+    global link_up
+    link_up = False
+    if spool is not None and pending.seq in spool:
+        log_event(T['spooled'].format(pending.seq, pending.retries))
+    else:
+        log_event(T['expired'].format(pending.seq, pending.retries))
+
+def log_arq():
+    if arq is not None:
+        log_event(T['arq_stats'].format(**arq.stats()))
+        log_event(T['duty_stats'].format(**duty.stats(time.monotonic())))
+    if spool is not None:
+        log_event(T['spool_stats'].format(drained=spool_drained, **spool.stats()))
+
+# ========== Буфер кадров ==========
+# Кадры, доставка которых не известна, лежат в кольцевом буфере на диске
+# (common/spool.py) до подтверждения, поэтому буфер работает только с ARQ:
+# без ACK кадр, потерянный в эфире, не отличить от доставленного. Буфер переживает перезагрузку; досылка начинается,
+# когда канал снова работает, не чаще SPOOL_DRAIN_RATE кадров в секунду
+# и в пределах доли бюджета эфира для повторов.
+def spool_push(seq, count, frame):
+    if spool is None:
+        return
+    try:
+        dropped = spool.push(seq, count, frame)
+    except ValueError as e:
+        # Кадр длиннее записи буфера (большой AGGREGATE с FEC и заголовком):
+        # он всё равно отправлен, только без досылки
+        log_event(T['spool_skip'].format(seq, e))
+        return
+    if dropped is not None:
+        log_event(T['spool_dropped'].format(dropped))
+
+def spool_drain(uart, now, deadline):
+    global send_errors, spool_drained, next_drain
+    if spool is None or not link_up or now < next_drain:
+        return
+    if len(arq) >= arq.size:
+        return
+    # Самый старый кадр, который не ждёт ACK
+    item = next((item for item in spool if item[0] not in arq), None)
+    if item is None:
+        return
+    seq, count, frame = item
+    if now + listen_time(len(frame)) > deadline:
+        return
+    if not duty.allows(lora_airtime(len(frame), **CONFIG["LORA_PARAMS"]), now, CONFIG["ARQ_RETRANSMIT_SHARE"]):
+        return
+    next_drain = now + 1 / CONFIG["SPOOL_DRAIN_RATE"]
+    try:
+        write_frame(uart, frame)
+    except Exception as e:
+        send_errors += 1
+        log_event(T['send_error'].format(seq, e))
+        return
+    spool_drained += 1
+    log_event(T['spool_drained'].format(seq))
+    add_in_flight(seq, count, frame, now)
+
+# ========== Метрики ==========
+# Отдельный поток; значения читаются из счётчиков, которые цикл отправки
+# ведёт и так, поэтому опрос не задерживает отправку
+def start_metrics(scheduler, get_seq):
+    metrics = MetricsServer(CONFIG["METRICS_PORT"], CONFIG["METRICS_HOST"], prefix="lora_sender_")
+    metrics.counter("frames_sent_total", "Frames written to the UART", lambda: frames_sent)
+    metrics.counter("readings_total", "Readings taken (seq)", get_seq)
+    metrics.counter("send_errors_total", "Failed UART writes", lambda: send_errors)
+    metrics.counter("uart_bytes_total", "Bytes written to the UART", lambda: uart_bytes)
+    metrics.gauge("last_packet_age_seconds", "Seconds since the last frame was sent", age(lambda: last_sent_at))
+    metrics.counter("schedule_skipped_total", "Ticks skipped after falling behind", lambda: scheduler.skipped)
+    metrics.counter("schedule_late_total", "Ticks started later than their deadline", lambda: scheduler.late)
+    metrics.gauge("schedule_jitter_seconds", "Delay of the last tick past its deadline", lambda: scheduler.last_jitter)
+    metrics.gauge("duty_cycle_airtime_seconds", "Own airtime within the duty-cycle window",
+                  lambda: duty.used(time.monotonic()))
+    if spool is not None:
+        metrics.gauge("spool_frames", "Frames held in the on-disk spool", lambda: len(spool))
+        metrics.counter("spool_drained_total", "Frames sent again from the spool", lambda: spool_drained)
+        metrics.counter("spool_dropped_total", "Frames pushed out of a full spool", lambda: spool.dropped)
+    if arq is not None:
+        metrics.counter("frames_acked_total", "Frames confirmed by the receiver's ACK", lambda: arq.acked)
+        metrics.counter("retransmits_total", "Frames sent again after an ACK timeout", lambda: arq.retransmits)
+        metrics.counter("frames_expired_total", "Frames given up on without an ACK", lambda: arq.expired)
+        metrics.gauge("arq_in_flight", "Frames awaiting an ACK", lambda: len(arq))
+        metrics.gauge("arq_rto_seconds", "Current retransmission timeout", lambda: arq.timer.rto)
+    add_run_writer_metrics(metrics, lambda: run_writer)
+    return metrics.start()
 
 # ========== Основной цикл ==========
 def main():
-    global log_filename
+    global run_writer, arq, ack_decoder, spool, run_id
     print(T['start'])
 
-    run_number = get_next_run_number()
+    # Незавершённый запуск (сбой питания, перезагрузка) продолжается под тем
+    # же номером: CSV и лог дописываются, seq идёт дальше
+    manifest = RunManifest(CONFIG["MANIFEST_PATH"]) if CONFIG["RESUME"] else None
+    resumed = manifest.resume(CONFIG["DURATION"]) if manifest is not None else None
+    run_number = resumed["run"] if resumed else next_run_number()
+    if CONFIG["RUN_ID"]:
+        run_id = run_number & RUN_ID_MASK
     log_filename = f"logs/log_run_{run_number}.txt"
-    csv_filename = f"data/sender/sent_run_{run_number}.csv"
-    os.makedirs("data/sender", exist_ok=True)
+    if CONFIG["STORAGE"] == "sqlite":
+        run_writer = SqliteWriter(CONFIG["SQLITE_PATH"], log_filename, CSV_HEADER, run_number,
+                                  FLUSH_ROWS, FLUSH_INTERVAL)
+    else:
+        # С номером устройства — в папку устройства, как у приёмника:
+        # analyze_runs.py сопоставляет файлы одного устройства
+        directory = "data/sender" if CONFIG["DEVICE_ID"] is None else f"data/sender/device={CONFIG['DEVICE_ID']}"
+        csv_filename = f"{directory}/sent_run_{run_number}.csv"
+        run_writer = RunWriter(csv_filename, log_filename, CSV_HEADER, FLUSH_ROWS, FLUSH_INTERVAL)
+    exit_on_signal()
+    if resumed:
+        log_event(T['resumed'].format(run_number, resumed["resumes"], manifest.remaining(), resumed["seq"],
+                                      run_writer.truncated))
 
     if CONFIG["DELAY_BEFORE_START"] > 0:
-        log_event(log_filename, T['wait'].format(CONFIG["DELAY_BEFORE_START"]))
+        log_event(T['wait'].format(CONFIG["DELAY_BEFORE_START"]))
         time.sleep(CONFIG["DELAY_BEFORE_START"])
 
     try:
         uart = serial.Serial(
             port=CONFIG["UART_PORT"],
             baudrate=CONFIG["BAUDRATE"],
-            timeout=1
+            timeout=CONFIG["ARQ_POLL"] if CONFIG["ARQ"] else 1
         )
     except Exception as e:
-        log_event(log_filename, T['port_error'].format(CONFIG["UART_PORT"], e))
+        log_event(T['port_error'].format(CONFIG["UART_PORT"], e))
+        run_writer.close()
         return
 
-    log_event(log_filename, T['start_log'])
-    start_time = time.time()
-    last_flush = start_time
+    log_event(T['start_log'])
+    if CONFIG["SPOOL"] and not CONFIG["ARQ"]:
+        log_event(T['spool_needs_arq'])
+    elif CONFIG["SPOOL"]:
+        try:
+            spool = Spool(CONFIG["SPOOL_PATH"], CONFIG["SPOOL_CAPACITY"])
+        except (OSError, ValueError) as e:
+            log_event(T['spool_error'].format(CONFIG["SPOOL_PATH"], e))
+    sleep = None
+    if CONFIG["ARQ"]:
+        timer = RetransmitTimer(CONFIG["ARQ_INITIAL_RTO"], listen_time(ack_frame_size()), CONFIG["ARQ_MAX_RTO"],
+                                CONFIG["ARQ_POLL"])
+        arq = RetransmitWindow(CONFIG["ARQ_WINDOW"], CONFIG["ARQ_MAX_RETRIES"], timer)
+        ack_decoder = FrameDecoder((ack_frame_size(),), validate=is_own_ack, fec=FEC)
+        # Между тактами отправитель не спит, а ждёт ACK и повторяет кадры
+        sleep = lambda seconds: arq_idle(uart, seconds)
+    # Такты по монотонным часам: ровно DURATION / INTERVAL отправок без дрейфа
+    scheduler = TickScheduler(CONFIG["INTERVAL"], CONFIG["SCHEDULE_POLICY"], CONFIG["DITHER"], sleep=sleep)
+    # Продолженный запуск — на оставшееся время; задержка перед стартом входит в него
+    if resumed:
+        duration = manifest.remaining()
+    else:
+        duration = CONFIG["DURATION"]
+        if manifest is not None:
+            manifest.start(run_number, duration)
+    total_ticks = int(duration // CONFIG["INTERVAL"])
+    last_flush = time.time()
+    seq = resumed["seq"] if resumed else 0  # Номер пакета (показания) в запуске
+    if spool is not None and len(spool) and spool.next_seq > seq:
+        # Кадры прерванного запуска ещё в буфере: их seq не повторяются,
+        # иначе приёмник примет новые показания за повторы
+        seq = spool.next_seq
+        log_event(T['spool_resume'].format(len(spool), seq))
+    # В манифесте — не следующий seq, а граница занятого блока: каждый
+    # отправленный seq меньше записанной на диск, после сбоя он не повторится
+    reserved = seq
+    if manifest is not None:
+        reserved = seq + CONFIG["MANIFEST_SEQ_BLOCK"]
+        manifest.update(seq=reserved)
+    finished = False  # Запуск завершён штатно или вручную; по сигналу — продолжится при следующем старте
+    samples = []  # Показания, ожидающие агрегированного кадра
+    samples_seq = 0  # seq первого из них
+
+    metrics = None
+    if CONFIG["METRICS_PORT"] is not None:
+        try:
+            metrics = start_metrics(scheduler, lambda: seq)
+            log_event(T['metrics'].format(CONFIG["METRICS_HOST"], metrics.port))
+        except OSError as e:
+            log_event(T['metrics_error'].format(CONFIG["METRICS_PORT"], e))
 
     try:
-        while time.time() - start_time < CONFIG["DURATION"]:
-            packet_id = int(time.time())
+        while scheduler.next_tick < total_ticks:
+            skipped = scheduler.skipped
+            if scheduler.wait() >= total_ticks:
+                break
+            if scheduler.skipped > skipped:
+                log_event(T['schedule_skip'].format(scheduler.skipped - skipped))
+            # Округление до мс до выбора packet_id: в кадре будет то же время
+            sent_at = round(time.time(), 3)
+            packet_id = int(sent_at)
             params = generate_parameters()
 
             if DEBUG:
                 print(T['param'], params)
 
-            log_event(log_filename, T['packet_built'].format(packet_id, params))
-            save_to_csv(csv_filename, packet_id, params)
+            if CONFIG["AGGREGATE"] > 1:
+                log_event(T['packet_built'].format(packet_id, params))
+                save_to_csv(packet_id, params, seq, sent_at)
+                # Разности с первым показанием должны уместиться в int8
+                if not aggregate_fits(samples, packet_id, params):
+                    send_aggregate(uart, samples_seq, samples)
+                    samples = []
+                if not samples:
+                    samples_seq = seq
+                samples.append((packet_id, params))
+                if len(samples) >= CONFIG["AGGREGATE"]:
+                    send_aggregate(uart, samples_seq, samples)
+                    samples = []
+            else:
+                # Кадр уходит сразу после отметки sent_at, а CSV и лог пишутся
+                # после отправки: их fsync не попадает в измеряемую задержку
+                full_packet = build_packet(seq, sent_at, params)
+                send_packet(uart, full_packet, packet_id, T['sent_log'].format(packet_id), seq)
+                log_event(T['packet_built'].format(packet_id, params))
+                save_to_csv(packet_id, params, seq, sent_at)
+            seq += 1
+            if manifest is not None and seq >= reserved:
+                # Следующий блок занимается после отправки последнего seq
+                # текущего: fsync манифеста не задерживает кадр
+                reserved = seq + CONFIG["MANIFEST_SEQ_BLOCK"]
+                manifest.update(seq=reserved)
 
-            message = f"{packet_id}," + ",".join(map(str, params))
-            encrypted = encrypt_message(message, CONFIG["AES_KEY"])
-            crc = crc8(encrypted)
-            full_packet = encrypted + bytes([crc])
-
-            try:
-                uart.write(full_packet)
-                if DEBUG:
-                    print(T['sent'])
-                log_event(log_filename, T['sent_log'].format(packet_id))
-            except Exception as e:
-                log_event(log_filename, T['send_error'].format(packet_id, e))
-
-            # Проверка времени для периодической синхронизации
+            # Периодический сброс CSV и лога на диск
             current_time = time.time()
             if current_time - last_flush >= FLUSH_INTERVAL:
                 last_flush = current_time
+                log_event(T['schedule_stats'].format(scheduler.stats()))
+                log_arq()
+                run_writer.maybe_flush()
 
-            time.sleep(CONFIG["INTERVAL"])
-
-        log_event(log_filename, T['finished'])
+        finished = True
+        log_event(T['finished'])
         if DEBUG:
             print(T['done'])
 
     except KeyboardInterrupt:
-        log_event(log_filename, T['user_stop'])
+        finished = True
+        log_event(T['user_stop'])
 
     finally:
+        if samples:
+            # Неполный агрегированный кадр отправляется при завершении
+            send_aggregate(uart, samples_seq, samples)
+        if arq is not None:
+            # Последним кадрам — время на подтверждение и повторы
+            try:
+                arq_idle(uart, CONFIG["INTERVAL"], until_empty=True)
+            except KeyboardInterrupt:
+                pass
         uart.close()
-        log_event(log_filename, T['finished'])
+        if metrics is not None:
+            metrics.close()
+        log_event(T['schedule_stats'].format(scheduler.stats()))
+        log_arq()
+        if spool is not None:
+            spool.close()
+        if manifest is not None and finished:
+            manifest.finish()
+        log_event(T['finished'])
+        run_writer.close()
         print(T['done'])
 
 if __name__ == '__main__':
@@ -5,14 +5,18 @@
 # Назначение: Интерактивная отправка 250 пакетов с отметкой дистанции и номера запуска
 # ========================================
 
-import csv
+import sys
 import random
 import time
 import serial
 import os
 from datetime import datetime
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad
+
+# ========== Общие модули ==========
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.codec import AesCodec
+from common.crc import crc8
+from common.run_writer import RunWriter
 
 # ========== Выбор языка ==========
 def choose_language():
@@ -60,6 +64,7 @@ BAUDRATE = 9600
 AES_KEY = "cat".ljust(16)[:16].encode()
 PACKET_COUNT = 250
 SEND_INTERVAL = 3  # секунды
+CSV_HEADER = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity', 'density', 'concentration', 'run_number', 'distance_m']
 
 # ========== Генерация параметров ==========
 def generate_parameters():
@@ -71,43 +76,44 @@ def generate_parameters():
         random.randint(50, 150)
     ]
 
-# ========== CRC8 ==========
-def crc8(data: bytes) -> int:
-    crc = 0
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x80:
-                crc = (crc << 1) ^ 0x07
-            else:
-                crc <<= 1
-            crc &= 0xFF
-    return crc
-
 # ========== AES Шифрование ==========
-def encrypt_message(message):
-    cipher = AES.new(AES_KEY, AES.MODE_ECB)
-    return cipher.encrypt(pad(message.encode(), AES.block_size))
+CODEC = AesCodec(AES_KEY)  # Шифр создаётся один раз, а не на каждый пакет
 
 # ========== Логирование ==========
-def log_event(logfile, text):
+def log_event(run_writer, text):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     line = f"[{timestamp}] {text}"
     print(line)
-    with open(logfile, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    run_writer.write_line(line)
 
 # ========== Сохранение CSV ==========
-def save_csv(csvfile, packet_id, params, run_number, distance):
-    header = ['packet_id', 'timestamp', 'temperature', 'pressure', 'humidity', 'density', 'concentration', 'run_number', 'distance_m']
+def save_csv(run_writer, packet_id, params, run_number, distance):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     row = [packet_id, timestamp] + params + [run_number, distance]
-    file_exists = os.path.exists(csvfile)
-    with open(csvfile, 'a', newline='') as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(header)
-        writer.writerow(row)
+    run_writer.write_row(row)
+
+# ========== Один запуск ==========
+def send_run(uart, run_writer, run_number, distance):
+    log_event(run_writer, T['run_start'].format(run_number, distance))
+
+    for _ in range(PACKET_COUNT):
+        packet_id = int(time.time())
+        params = generate_parameters()
+        message = f"{packet_id}," + ",".join(map(str, params))
+        encrypted = CODEC.encrypt(message)
+        crc = crc8(encrypted)
+        full_packet = encrypted + bytes([crc])
+
+        try:
+            uart.write(full_packet)
+            log_event(run_writer, T['packet_sent'].format(packet_id))
+            save_csv(run_writer, packet_id, params, run_number, distance)
+        except Exception as e:
+            log_event(run_writer, T['packet_error'].format(packet_id, e))
+
+        time.sleep(SEND_INTERVAL)
+
+    log_event(run_writer, T['run_done'].format(PACKET_COUNT))
 
 # ========== Основной цикл ==========
 def main():
@@ -135,29 +141,9 @@ def main():
         log_filename = f"logs/log_run_{run_number}_{distance}m.txt"
         csv_filename = f"data/sent_run_{run_number}_{distance}m.csv"
 
-        os.makedirs("logs", exist_ok=True)
-        os.makedirs("data", exist_ok=True)
-
-        log_event(log_filename, T['run_start'].format(run_number, distance))
-
-        for _ in range(PACKET_COUNT):
-            packet_id = int(time.time())
-            params = generate_parameters()
-            message = f"{packet_id}," + ",".join(map(str, params))
-            encrypted = encrypt_message(message)
-            crc = crc8(encrypted)
-            full_packet = encrypted + bytes([crc])
-
-            try:
-                uart.write(full_packet)
-                log_event(log_filename, T['packet_sent'].format(packet_id))
-                save_csv(csv_filename, packet_id, params, run_number, distance)
-            except Exception as e:
-                log_event(log_filename, T['packet_error'].format(packet_id, e))
-
-            time.sleep(SEND_INTERVAL)
-
-        log_event(log_filename, T['run_done'].format(PACKET_COUNT))
+        # Файлы запуска открываются один раз; сброс после каждой строки, как раньше
+        with RunWriter(csv_filename, log_filename, CSV_HEADER, flush_rows=1, fsync=False) as run_writer:
+            send_run(uart, run_writer, run_number, distance)
 
 if __name__ == '__main__':
     main()
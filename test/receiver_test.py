@@ -9,10 +9,16 @@
 # ========================================
 
 import csv
+import os
+import sys
 from datetime import datetime
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import unpad
 
+# ========== Общие модули ==========
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.crc import crc8
+
 # ========== Настройки ==========
 def get_config():
     return {
@@ -22,19 +28,6 @@ def get_config():
         "aes_key": "cat"
     }
 
-# ========== CRC8 ==========
-def crc8(data: bytes) -> int:
-    crc = 0
-    for byte in data:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x80:
-                crc = (crc << 1) ^ 0x07
-            else:
-                crc <<= 1
-            crc &= 0xFF
-    return crc
-
 # ========== Логирование ==========
 def log_event(text, logfile):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,179 @@
+# ========================================
+# Файл: sim_run_24h.py
+# Авторы: Snopkov D. I., Shimpf A. A.
+# Версия: октябрь 2026
+# Назначение:
+#   - Запуск autostart_sender_24h.main() и autostart_receiver_24h.main()
+#     без модулей E22: виртуальный порт и модель канала (common/channel_sim.py)
+#   - Ускоренное время, потери, искажения и обрывы пакетов
+#   - Смещение и дрейф часов отправителя (проверка common/clock_sync.py)
+#   - Подтверждения и повторы (ARQ) по полудуплексному каналу
+#   - Обрыв связи и досылка кадров из буфера на диске (SPOOL)
+#   - Сводка: что ушло в канал, что принято, PDR по CSV
+# ========================================
+#
+# Пример (сутки при ускорении x500, 2% потерь):
+#   python test/sim_run_24h.py --duration 86400 --speed 500 --loss 0.02
+#
+# ARQ при 10% потерь в каждую сторону, общий эфир:
+#   python test/sim_run_24h.py --loss 0.1 --arq --half-duplex
+#
+# Связи нет с 10-й по 20-ю минуту, кадры досылаются из буфера:
+#   python test/sim_run_24h.py --arq --spool --outage 600 1200
+
+import argparse
+import importlib.util
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from common.channel_sim import SkewedClock, VirtualClock, make_link
+from common.fec import ReedSolomon
+from common.link_stats import RunFiles, find_runs, merge_run, run_stats
+from common.sqlite_store import export_run, runs
+
+SENDER = os.path.join(ROOT, "sender", "autostart", "autostart_sender_24h.py")
+RECEIVER = os.path.join(ROOT, "receiver", "autostart", "autostart_receiver_24h.py")
+
+def load_script(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the 24h sender and receiver over a simulated E22 link")
+    parser.add_argument("--duration", type=float, default=3600, help="virtual seconds of transmission")
+    parser.add_argument("--interval", type=float, default=30, help="sender interval, virtual seconds")
+    parser.add_argument("--speed", type=float, default=100, help="clock acceleration factor")
+    parser.add_argument("--loss", type=float, default=0.0, help="packet loss probability")
+    parser.add_argument("--ber", type=float, default=0.0, help="bit error rate")
+    parser.add_argument("--truncate", type=float, default=0.0, help="packet truncation probability")
+    parser.add_argument("--format", choices=("text", "binary"), default="text")
+    parser.add_argument("--aggregate", type=int, default=1, help="readings per frame")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--sender-offset", type=float, default=0.0, help="sender clock offset, seconds (estimated from binary frames)")
+    parser.add_argument("--sender-drift-ppm", type=float, default=0.0, help="sender clock drift, ppm")
+    parser.add_argument("--fec-parity", type=int, default=0, help="Reed-Solomon parity bytes (FEC_PARITY)")
+    parser.add_argument("--device-id", type=int, default=None, help="sender DEVICE_ID (frames carry it)")
+    parser.add_argument("--run-id", action="store_true", help="frames carry the sender's run number (RUN_ID)")
+    parser.add_argument("--arq", action="store_true", help="ACKs and retransmissions (ARQ in both scripts)")
+    parser.add_argument("--half-duplex", action="store_true",
+                        help="both directions share the air: overlapping packets are lost")
+    parser.add_argument("--spool", action="store_true", help="sender keeps unacknowledged frames on disk (SPOOL, needs --arq)")
+    parser.add_argument("--outage", type=float, nargs=2, metavar=("START", "END"), default=None,
+                        help="link down (both directions) between these virtual seconds")
+    parser.add_argument("--storage", choices=("csv", "sqlite"), default="csv", help="STORAGE of both scripts")
+    parser.add_argument("--capture", action="store_true", help="receiver also writes a raw capture (CAPTURE_RAW)")
+    parser.add_argument("--workdir", default=None, help="directory for logs/ and data/ (default: temporary)")
+    args = parser.parse_args()
+    if args.spool and not args.arq:
+        parser.error("--spool needs --arq: the sender refuses SPOOL without ARQ")
+    return args
+
+# Обрыв связи: все пакеты теряются с start по end секунду симуляции
+def outage(clock, channels, start, end):
+    clock.sleep(start)
+    losses = [channel.loss for channel in channels]
+    for channel in channels:
+        channel.loss = 1.0
+    clock.sleep(end - start)
+    for channel, loss in zip(channels, losses):
+        channel.loss = loss
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sim_24h_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    clock = VirtualClock(args.speed)
+    sender_port, receiver_port = make_link(clock, seed=args.seed, half_duplex=args.half_duplex,
+                                           loss=args.loss, ber=args.ber, truncate=args.truncate)
+
+    sender = load_script("autostart_sender_24h", SENDER)
+    receiver = load_script("autostart_receiver_24h", RECEIVER)
+    for module, port in ((sender, sender_port), (receiver, receiver_port)):
+        module.serial = port.as_module()
+        module.datetime = clock.virtual_datetime()
+    if args.sender_offset or args.sender_drift_ppm:
+        sender_clock = SkewedClock(clock, args.sender_offset, args.sender_drift_ppm)
+        sender.time = sender_clock.as_module()
+        sender.datetime = sender_clock.virtual_datetime()
+    sender.CONFIG.update(DURATION=args.duration, INTERVAL=args.interval, DELAY_BEFORE_START=0,
+                         PAYLOAD_FORMAT=args.format, AGGREGATE=args.aggregate, STORAGE=args.storage,
+                         ARQ=args.arq, DEVICE_ID=args.device_id, RUN_ID=args.run_id, SPOOL=args.spool)
+    # Приёмник ждёт последний кадр ещё несколько интервалов
+    receiver.START_DELAY = 0
+    receiver.CAPTURE_RAW = args.capture
+    receiver.STORAGE = args.storage
+    receiver.ARQ = args.arq
+    # Кодек FEC создаётся при загрузке скрипта — заменяется вместе с параметром
+    sender.CONFIG["FEC_PARITY"] = receiver.FEC_PARITY = args.fec_parity
+    sender.FEC = receiver.FEC = ReedSolomon(args.fec_parity) if args.fec_parity else None
+    # Декодер приёмника — локальная переменная main(); запоминается для сводки
+    decoders = []
+    decoder_class = receiver.FrameDecoder
+    receiver.FrameDecoder = lambda *a, **kw: decoders.append(decoder_class(*a, **kw)) or decoders[-1]
+    receiver.RECEIVE_DURATION = args.duration + 3 * args.interval
+    # Обработчик сигнала ставится только из главного потока, а приёмник
+    # работает в отдельном потоке
+    receiver.exit_on_signal = lambda: None
+
+    with clock:
+        receiver_thread = threading.Thread(target=receiver.main, name="receiver")
+        receiver_thread.start()
+        # Номер запуска отправителя берётся после того, как приёмник создал свой лог
+        while receiver.run_writer is None and receiver_thread.is_alive():
+            clock.sleep(0.01)
+        if args.outage:
+            threading.Thread(target=outage, args=(clock, (sender_port.tx, receiver_port.tx), *args.outage),
+                             name="outage", daemon=True).start()
+        sender.main()
+        receiver_thread.join()
+
+    sent_stats = sender_port.tx.stats()
+    print(f"\nWork directory: {workdir}")
+    print(f"Channel: {sent_stats}")
+    if args.arq:
+        print(f"ACK channel: {receiver_port.tx.stats()}")
+        print(f"ARQ: {sender.arq.stats()}, ACKs: {receiver.acks.stats(clock.monotonic())}")
+    if args.spool:
+        print(f"Spool: {sender.spool.stats()}, drained: {sender.spool_drained}")
+    print(f"Decoder: {decoders[-1].stats()}")
+    if args.storage == "sqlite":
+        # Выгрузка запусков из баз в CSV в той же раскладке, что при STORAGE = "csv"
+        exported = []
+        for module, prefix in ((sender, "sent"), (receiver, "received")):
+            path = module.run_writer.csv_path
+            db = sqlite3.connect(path)
+            exported.append([file for number in runs(db)
+                             for file, _ in export_run(db, number, os.path.dirname(path), prefix)])
+            db.close()
+        sent_path, received_path = exported[0][-1], exported[1][-1]
+    else:
+        # Приёмник пишет в последний открытый файл (папку устройства, если
+        # кадры несут номер устройства)
+        sent_path, received_path = sender.run_writer.csv_path, receiver.run_writer.paths[-1]
+    if args.run_id:
+        # Файл приёмника назван по запуску отправителя — пару находит find_runs()
+        sent_path = os.path.abspath(sent_path)
+        run = next(run for run in find_runs(os.curdir) if os.path.abspath(run.sent_path) == sent_path)
+    else:
+        run = RunFiles("sim", None, None, sent_path, received_path)
+    stats = run_stats(merge_run(run))
+    print(f"Sent: {stats['sent']}, delivered: {stats['delivered']}, PDR: {stats['pdr']:.2%}, "
+          f"loss bursts: {stats['bursts']} (max {stats['max_burst']})")
+    sync = receiver.links.link(args.device_id, sender.run_id)[1]
+    if sync.samples:
+        # Смещение приёмника относительно отправителя — с обратным знаком
+        print(f"Sender clock: configured offset {-args.sender_offset * 1000:.3f} ms, "
+              f"drift {-args.sender_drift_ppm:.3f} ppm; estimated {sync.stats()}")
+        print(f"One-way latency: {receiver.links.one_way.summary()}")
+
+if __name__ == "__main__":
+    main()